@@ -3,8 +3,9 @@
 """
 """
 from .parse import dtt_read
+from .parallel import dtt_read_many
 from .access import DiagAccess
-from .dtt2bunch import dtt2bunch
+from .dtt2bunch import dtt2bunch, dtt2bunch_iter
 
 from .version import (
     version,
@@ -13,8 +14,10 @@ from .version import (
 
 __all__ = [
     dtt_read,
+    dtt_read_many,
     DiagAccess,
     dtt2bunch,
+    dtt2bunch_iter,
     version,
     __version__,
 ]
@@ -8,4 +8,5 @@ h5ls -r filename.h5
 from . import dtt2hdf
 
 if __name__ == '__main__':
-    dtt2hdf.main()
+    import sys
+    sys.exit(dtt2hdf.main())
@@ -1,7 +1,20 @@
 """
 """
+import os
 import numpy as np
 from .parse import dtt_read
+from .cache import ParseCache
+from .lru import LRUCache
+from .axes import same_axis
+
+#DiagAccess objects kept by DiagAccess.cached
+ACCESS_CACHE = LRUCache()
+
+
+def _read_only(array):
+    #the holders are memoized, so their arrays are shared by every caller
+    array.flags.writeable = False
+    return array
 
 
 class DiagMeasurementHolder(object):
@@ -45,7 +58,7 @@ class DiagFreqMeasurementHolder(DiagMeasurementHolder):
 
     def metadata_check(self, other):
         super(DiagFreqMeasurementHolder, self).metadata_check(other)
-        if not all(other.FHz == self.FHz):
+        if not same_axis(other.FHz, self.FHz):
             raise RuntimeError("Freqs supposed to be the same")
         return
 
@@ -55,16 +68,9 @@ class DiagCoherenceHolder(DiagFreqMeasurementHolder):
         self.daccess = daccess
         self.chn1 = chn1
         self.chn2 = chn2
-        try:
-            chn1_coh = self.daccess.results['COH'][chn1]
-            self._metadata_mirror(chn1_coh)
-            idx = chn1_coh.channelB_inv[chn2]
-            self.coh = chn1_coh.coherence[idx].reshape(-1)
-        except KeyError:
-            chn2_coh = self.daccess.results['COH'][chn2]
-            self._metadata_mirror(chn2_coh)
-            idx = chn2_coh.channelB_inv[chn1]
-            self.coh = chn2_coh.coherence[idx].reshape(-1)
+        result, idx, inverted = self.daccess.pair('COH', chn1, chn2)
+        self._metadata_mirror(result)
+        self.coh = _read_only(result.coherence[idx].reshape(-1))
 
     _coh_phased = None
     @property
@@ -73,7 +79,7 @@ class DiagCoherenceHolder(DiagFreqMeasurementHolder):
             return self._coh_phased
         m_csd = self.daccess.csd(self.chn1, self.chn2)
         self.metadata_check(m_csd)
-        self._coh_phased = self.coh * m_csd.csd / abs(m_csd.csd)
+        self._coh_phased = _read_only(self.coh * m_csd.csd / abs(m_csd.csd))
         return self._coh_phased
 
     @property
@@ -86,25 +92,18 @@ class DiagCSDHolder(DiagFreqMeasurementHolder):
         self.daccess = daccess
         self.chn1 = chn1
         self.chn2 = chn2
-        try:
-            chn1_csd = self.daccess.results['CSD'][chn1]
-            self._metadata_mirror(chn1_csd)
-            idx = chn1_csd.channelB_inv[chn2]
-            self.csd = chn1_csd.CSD[idx].reshape(-1)
-        except KeyError:
-            chn2_csd = self.daccess.results['CSD'][chn2]
-            self._metadata_mirror(chn2_csd)
-            idx = chn2_csd.channelB_inv[chn1]
-            self.csd = chn2_csd.CSD[idx].reshape(-1)
+        result, idx, inverted = self.daccess.pair('CSD', chn1, chn2)
+        self._metadata_mirror(result)
+        self.csd = _read_only(result.CSD[idx].reshape(-1))
 
 
 class DiagASDHolder(DiagFreqMeasurementHolder):
     def __init__(self, daccess, chn):
         self.daccess = daccess
         self.chn = chn
-        chn_asd = self.daccess.results['PSD'][chn]
+        chn_asd, idx, inverted = self.daccess.pair('PSD', chn)
         self._metadata_mirror(chn_asd)
-        self.asd = chn_asd.PSD.reshape(-1)
+        self.asd = _read_only(chn_asd.PSD.reshape(-1))
 
 
 class DiagXferHolder(DiagFreqMeasurementHolder):
@@ -115,21 +114,17 @@ class DiagXferHolder(DiagFreqMeasurementHolder):
 
         self.xfer = None
         try:
-            self.chn_den_TF = self.daccess.results['TF'][self.chn_den]
-            self._metadata_mirror(self.chn_den_TF)
-            idx = self.chn_den_TF.channelB_inv[self.chn_num]
-            self.xfer = self.chn_den_TF.xfer[idx].reshape(-1)
+            result, idx, inverted = self.daccess.pair('TF', self.chn_den, self.chn_num)
         except KeyError:
             pass
-
-        if self.xfer is None:
-            try:
-                self.chn_num_TF = self.daccess.results['TF'][self.chn_num]
-                self._metadata_mirror(self.chn_num_TF)
-                idx = self.chn_num_TF.channelB_inv[self.chn_den]
-                self.xfer = 1./self.chn_num_TF.xfer[idx].reshape(-1)
-            except KeyError:
-                pass
+        else:
+            self._metadata_mirror(result)
+            if not inverted:
+                self.chn_den_TF = result
+                self.xfer = _read_only(result.xfer[idx].reshape(-1))
+            else:
+                self.chn_num_TF = result
+                self.xfer = _read_only(1./result.xfer[idx].reshape(-1))
 
         #if the measurment aborts before it completes, it pads the freq data with zeros
         #if self.xfer is not None:
@@ -141,7 +136,7 @@ class DiagXferHolder(DiagFreqMeasurementHolder):
             try:
                 self._metadata_mirror(self.csd_obj)
                 self.metadata_check(self.asd_den_obj)
-                self.xfer = self.csd_obj.csd / self.asd_den_obj.asd**2
+                self.xfer = _read_only(self.csd_obj.csd / self.asd_den_obj.asd**2)
             except KeyError:
                 raise
                 raise RuntimeError("Diag file does not seem to carry this xfer function")
@@ -159,9 +154,13 @@ class DiagXferHolder(DiagFreqMeasurementHolder):
     def coh(self):
         return self.coh_obj.coh
 
+    _SNR_estimate = None
     @property
     def SNR_estimate(self):
-        return self.coh**2/(1-self.coh**2) * self.averages
+        if self._SNR_estimate is not None:
+            return self._SNR_estimate
+        self._SNR_estimate = _read_only(self.coh**2/(1-self.coh**2) * self.averages)
+        return self._SNR_estimate
         try:
             P = (self.asd_num / self.asd_den)**2
             M = self.csd / self.asd_den**2
@@ -202,69 +201,78 @@ class DiagXferHolder(DiagFreqMeasurementHolder):
     _asd_den_obj = None
     @property
     def asd_den_obj(self):
-        if self._asd_num_obj is None:
-            self._asd_den_obj = self.daccess.asd(self.chn_den)
+        if self._asd_den_obj is not None:
+            return self._asd_den_obj
+        self._asd_den_obj = self.daccess.asd(self.chn_den)
+        self.metadata_check(self._asd_den_obj)
         return self._asd_den_obj
 
     @property
     def asd_den(self):
-        return self._asd_den_obj.asd
+        return self.asd_den_obj.asd
 
 
 class DiagXferViaHolder(DiagFreqMeasurementHolder):
 
     def __init__(self, daccess, chn_num, chn_den, chn_via):
         self.daccess = daccess
+        self.chn_num = chn_num
+        self.chn_den = chn_den
+        self.chn_via = chn_via
         self._xfer_num_obj = self.daccess.xfer(chn_num, chn_via)
         self._xfer_den_obj = self.daccess.xfer(chn_den, chn_via)
         self._metadata_mirror(self._xfer_num_obj)
         self.metadata_check(self._xfer_den_obj)
-        self.xfer = self._xfer_num_obj.xfer / self._xfer_den_obj.xfer
+        self.xfer = _read_only(self._xfer_num_obj.xfer / self._xfer_den_obj.xfer)
 
+    _SNR_estimate = None
     @property
     def SNR_estimate(self):
+        if self._SNR_estimate is not None:
+            return self._SNR_estimate
         snr_num = self._xfer_num_obj.SNR_estimate
         snr_den = self._xfer_den_obj.SNR_estimate
-        return 1/(1/snr_den + 1/snr_num)
+        self._SNR_estimate = _read_only(1/(1/snr_den + 1/snr_num))
+        return self._SNR_estimate
 
     _coh_nv_obj = None
     @property
     def coh_nv_obj(self):
         if self._coh_nv_obj is not None:
             return self._coh_nv_obj
-        self._coh_nv_obj = self.daccess.coherence(self.chn1, self.chn2)
+        self._coh_nv_obj = self.daccess.coherence(self.chn_num, self.chn_via)
         self.metadata_check(self._coh_nv_obj)
         return self._coh_nv_obj
 
     @property
     def coh_nv(self):
-        return self._coh_nv_obj.coh
+        return self.coh_nv_obj.coh
 
     _coh_dv_obj = None
     @property
     def coh_dv_obj(self):
         if self._coh_dv_obj is not None:
             return self._coh_dv_obj
-        self._coh_dv_obj = self.daccess.coherence(self.chn1, self.chn2)
+        self._coh_dv_obj = self.daccess.coherence(self.chn_den, self.chn_via)
         self.metadata_check(self._coh_dv_obj)
         return self._coh_dv_obj
 
     @property
     def coh_dv(self):
-        return self._coh_dv_obj.coh
+        return self.coh_dv_obj.coh
 
     _coh_nd_obj = None
     @property
     def coh_nd_obj(self):
         if self._coh_nd_obj is not None:
             return self._coh_nd_obj
-        self._coh_nd_obj = self.daccess.coherence(self.chn1, self.chn2)
+        self._coh_nd_obj = self.daccess.coherence(self.chn_num, self.chn_den)
         self.metadata_check(self._coh_nd_obj)
         return self._coh_nd_obj
 
     @property
     def coh_nd(self):
-        return self._coh_nd_obj.coh
+        return self.coh_nd_obj.coh
 
     @property
     def asd_num_obj(self):
@@ -291,6 +299,38 @@ class DiagXferViaHolder(DiagFreqMeasurementHolder):
         return self.asd_via_obj.asd
 
 
+class DiagMatrixHolder(DiagFreqMeasurementHolder):
+    """
+    Holder of a measurement of every pair of chns_row x chns_col, with the
+    data in one array of shape (len(chns_row), len(chns_col), F), or of shape
+    (len(chns_row), F) for a stack of single channel measurements, under
+    the attribute named by field. mask marks the pairs (or channels) found,
+    the others are filled with NaN.
+    """
+    def __init__(self, daccess, field, data, mask, chns_row, chns_col = None):
+        self.daccess = daccess
+        self.field = field
+        self.data = data
+        self.mask = mask
+        self.chns_row = list(chns_row)
+        self.chns_col = list(chns_col) if chns_col is not None else None
+        setattr(self, field, data)
+
+    def _gather_from(self, results):
+        """
+        Mirror the metadata of the first of results and check the others
+        against it
+        """
+        first = None
+        for result in results:
+            if first is None:
+                first = result
+                self._metadata_mirror(result)
+            elif result is not first:
+                self.metadata_check(result)
+        return
+
+
 class DiagSineResponseCoefficients(DiagMeasurementHolder):
     def __init__(self, daccess, chn_list, chn_wrt = None, freq_idx = 0):
         self.daccess = daccess
@@ -376,39 +416,430 @@ class DiagAccess(object):
     def __init__(
             self,
             fname,
+            streaming  = False,
+            lazy       = False,
+            channels   = None,
+            types      = None,
+            references = True,
+            indexed    = False,
+            backend    = None,
+            cache_dir  = None,
     ):
-        # Parse the file
-        raw = dtt_read(fname)
+        """
+        cache_dir may be a directory or a cache.ParseCache, through which the
+        parsed file is then stored and reloaded with its arrays memory mapped.
+        """
+        kwargs = dict(
+            streaming  = streaming,
+            lazy       = lazy,
+            channels   = channels,
+            types      = types,
+            references = references,
+            indexed    = indexed,
+            backend    = backend,
+        )
+        if cache_dir is not None:
+            if not isinstance(cache_dir, ParseCache):
+                cache_dir = ParseCache(cache_dir)
+            raw = cache_dir.read(fname, **kwargs)
+        else:
+            # Parse the file, the filters are applied before any data is decoded
+            raw = dtt_read(fname, **kwargs)
+        self._setup(raw)
+
+    def _setup(self, raw):
+        #holders by (kind, channels...), see _holder
+        self._holders   = dict()
         self.references = raw.references
         self.results    = raw.results
+        self.index      = raw.index
+        self.by_name    = raw.by_name
+        #the HDF5 file read by from_hdf, see close
+        self.hdf        = raw.get('hdf', None)
 
         # Add the reference traces to the externally-accessible results dict
         # Channel naming convention follows the DTT convention: "CHN_NAME(REF#)"
+        self.reference_channels = set()
         for idx_ref, ref in self.references.items():
             type_ref = ref['type_name']
             if type_ref in ('PSD', 'CSD', 'COH', 'TF'):
                 chn_ref = '{}(REF{})'.format(ref['channelA'], idx_ref)
+                self.reference_channels.add(chn_ref)
                 if type_ref not in self.results:
                     self.results[type_ref] = dict()
                 self.results[type_ref][chn_ref] = ref
+        self.reindex()
+
+    def reindex(self):
+        """
+        Build the table of the channel pairs of the results and the channel
+        sets, from the metadata only. Called at load, and needed again only
+        if the results are modified.
+
+        The pairs map (type_name, chn_A, chn_B) to (result, row, inverted),
+        where the row of the result holds chn_B against chn_A, or chn_A
+        against chn_B if inverted. The single channel results use chn_B =
+        None and row None.
+        """
+        pairs = dict()
+        pairs_inverted = dict()
+        channels_A = set()
+        channels_B = set()
+        for res_key, res_obj in self.results.items():
+            if res_key in (
+                'HarmonicCoefficients',
+                'CoherenceCoefficients',
+                'TransferCoefficients',
+                'TransferMatrix',
+            ):
+                channels_A.update(list(res_obj.channels.values()))
+                continue
+            channels_A.update(list(res_obj.keys()))
+            for chn_A, result in res_obj.items():
+                channelB_inv = result.get('channelB_inv', None)
+                if not channelB_inv:
+                    pairs[(res_key, chn_A, None)] = (result, None, False)
+                    continue
+                channels_B.update(list(channelB_inv.keys()))
+                for chn_B, row in channelB_inv.items():
+                    pairs[(res_key, chn_A, chn_B)] = (result, row, False)
+                    pairs_inverted.setdefault((res_key, chn_B, chn_A), (result, row, True))
+        #the direct orientations take precedence over the inverted ones
+        pairs_inverted.update(pairs)
+        pairs = pairs_inverted
+        self._pairs = pairs
+        partners = dict()
+        for res_key, chn_A, chn_B in pairs:
+            if chn_B is not None:
+                partners.setdefault((res_key, chn_A), set()).add(chn_B)
+        self._partners = partners
+        #reduce the B channels to being the unique ones
+        self._channels = (channels_A, channels_B - channels_A)
+        return
+
+    def pair(self, type_name, chn_A, chn_B = None):
+        """
+        Find the result holding chn_B against chn_A (or just chn_A for the
+        single channel types), see reindex. Raises KeyError if there is none.
+        """
+        return self._pairs[(type_name, chn_A, chn_B)]
+
+    def partners(self, type_name, chn):
+        """
+        Set of the channels paired with chn in results of the type, in either
+        orientation
+        """
+        return set(self._partners.get((type_name, chn), ()))
+
+    def pairs(self, type_name, inverted = False):
+        """
+        List the (chn_A, chn_B) pairs of the type, those measured directly or
+        also the inverted ones
+        """
+        return [
+            (chn_A, chn_B)
+            for (res_key, chn_A, chn_B), (result, row, is_inverted) in self._pairs.items()
+            if res_key == type_name and chn_B is not None and (inverted or not is_inverted)
+        ]
+
+    @classmethod
+    def from_raw(cls, raw):
+        """
+        Build the access object from the output of dtt_read
+        """
+        self = cls.__new__(cls)
+        self._setup(raw)
+        return self
+
+    @classmethod
+    def from_hdf(cls, fname):
+        """
+        Build the access object from the HDF5 file written by dtt2hdf, reading
+        only its metadata. The arrays are read from the file, kept open as
+        the hdf attribute, on first use, until close is called. It is also a
+        context manager closing the file. See hdf_access.hdf_read.
+        """
+        from .hdf_access import hdf_read
+        self = cls.__new__(cls)
+        self._setup(hdf_read(fname))
+        return self
+
+    def close(self):
+        """
+        Close the HDF5 file of an object built by from_hdf. The arrays not
+        read yet can no longer be. Does nothing for the other objects.
+        """
+        if self.hdf is not None:
+            self.hdf.close()
+            self.hdf = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def open_many(cls, fnames, workers = None, **kwargs):
+        """
+        Open many files over a pool of worker processes, see
+        parallel.dtt_read_many. Returns a list in the order of fnames, holding
+        the exception raised for the files that failed to read.
+        """
+        from .parallel import dtt_read_many
+        raws = dtt_read_many(fnames, workers = workers, **kwargs)
+        return [
+            raw if isinstance(raw, Exception) else cls.from_raw(raw)
+            for raw in raws
+        ]
+
+    @classmethod
+    def cached(cls, fname, **kwargs):
+        """
+        DiagAccess(fname, \\*\\*kwargs) through the process-wide ACCESS_CACHE,
+        which returns the same object while the file keeps its size and mtime.
+        The cache budget is set with ACCESS_CACHE.configure(max_bytes = ...)
+        and its hit/miss counts read with ACCESS_CACHE.stats(). The arrays of
+        lazy results are decoded on use, so the size of the entry is measured
+        again on each hit and counts those decoded since.
+        """
+        key = [os.path.abspath(fname)]
+        for kw, value in sorted(kwargs.items()):
+            if kw in ('channels', 'types') and value is not None:
+                value = tuple(sorted(value))
+            key.append((kw, value))
+        key = tuple(key)
+        stat = os.stat(fname)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        daccess = ACCESS_CACHE.get(key, stamp)
+        if daccess is None:
+            daccess = cls(fname, **kwargs)
+            ACCESS_CACHE.put(key, daccess, stamp = stamp, nbytes = daccess.nbytes())
+        else:
+            ACCESS_CACHE.resize(key, daccess.nbytes())
+        return daccess
+
+    def nbytes(self):
+        """
+        Estimate of the memory held by the decoded arrays of the results
+        """
+        seen = set()
+        nbytes = 0
+        for result in self.by_name.values():
+            #the arrays of lazy results not decoded yet are left out
+            for key, value in result.loaded_items():
+                if isinstance(value, np.ndarray) and id(value) not in seen:
+                    seen.add(id(value))
+                    nbytes += value.nbytes
+        return nbytes
+
+    def index_lookup(self, entry_type, chn_A = None, chn_B = None):
+        """
+        Resolve an entry of the file's Index, such as ('TransferFunction',
+        chn_A, chn_B) or ('PowerSpectrum', chn), to the parsed result node
+        holding it, without scanning the results.
+
+        Returns (result, row) where row is the index of chn_B in the result,
+        or None for entries without B channels. Raises KeyError if the Index
+        has no such entry or its result was not read.
+        """
+        if self.index is None:
+            raise KeyError("File has no Index")
+        node_name, offset, length = self.index.lookup[(entry_type, chn_A, chn_B)]
+        result = self.by_name[node_name]
+        if chn_B is None:
+            return result, None
+        return result, result.channelB_inv[chn_B]
+
+    def _holder(self, holder_cls, *channels):
+        """
+        Return the holder of holder_cls for the channels, built on first use
+        and then reused along with the properties it memoizes. Their arrays
+        are shared by every caller, so they are read-only; copy them to
+        modify them.
+        """
+        key = (holder_cls,) + channels
+        holder = self._holders.get(key, None)
+        if holder is None:
+            holder = self._holders[key] = holder_cls(self, *channels)
+        return holder
+
+    def clear_holders(self):
+        """
+        Drop the memoized holders, e.g. after modifying the results
+        """
+        self._holders.clear()
+
+    def release(self, results = None):
+        """
+        Drop the holders and the decoded arrays of the results (all of them by
+        default), for those which can decode them again on use (read lazy and
+        indexed). Returns the number of fields released.
+        """
+        self.clear_holders()
+        if results is None:
+            results = []
+            for type_results in self.results.values():
+                if isinstance(type_results, dict):
+                    results.extend(type_results.values())
+        released = 0
+        for result in results:
+            released += result.release()
+        return released
 
     def coherence(self, chn1, chn2):
-        return DiagCoherenceHolder(self, chn1, chn2)
+        return self._holder(DiagCoherenceHolder, chn1, chn2)
 
     def coh(self, chn1, chn2):
-        return DiagCoherenceHolder(self, chn1, chn2)
+        return self._holder(DiagCoherenceHolder, chn1, chn2)
 
     def csd(self, chn1, chn2):
-        return DiagCSDHolder(self, chn1, chn2)
+        return self._holder(DiagCSDHolder, chn1, chn2)
 
     def asd(self, chn):
-        return DiagASDHolder(self, chn)
+        return self._holder(DiagASDHolder, chn)
 
     def xfer(self, chn_num, chn_den):
-        return DiagXferHolder(self, chn_num, chn_den)
+        return self._holder(DiagXferHolder, chn_num, chn_den)
 
     def xfer_via(self, chn_num, chn_den, chn_via):
-        return DiagXferViaHolder(self, chn_num, chn_den, chn_via)
+        return self._holder(DiagXferViaHolder, chn_num, chn_den, chn_via)
+
+    def _gather_pairs(self, type_name, field, chns_1, chns_2, swap = False):
+        """
+        Gather the rows of field for the pairs (type_name, chns_1[i],
+        chns_2[j]), or (type_name, chns_2[j], chns_1[i]) with swap, with one
+        fancy indexing per result. Returns the (len(chns_1), len(chns_2), F)
+        data, the mask of the pairs found, the mask of the inverted ones and
+        the results used.
+        """
+        shape = (len(chns_1), len(chns_2))
+        groups = dict()
+        for idx_1, chn_1 in enumerate(chns_1):
+            for idx_2, chn_2 in enumerate(chns_2):
+                if swap:
+                    key = (type_name, chn_2, chn_1)
+                else:
+                    key = (type_name, chn_1, chn_2)
+                entry = self._pairs.get(key, None)
+                if entry is None:
+                    continue
+                result, row, inverted = entry
+                group = groups.get(id(result), None)
+                if group is None:
+                    group = groups[id(result)] = (result, [], [], [], [])
+                group[1].append(idx_1)
+                group[2].append(idx_2)
+                group[3].append(row)
+                group[4].append(inverted)
+
+        mask = np.zeros(shape, dtype = bool)
+        inverted_mask = np.zeros(shape, dtype = bool)
+        if not groups:
+            return None, mask, inverted_mask, []
+        results = [group[0] for group in groups.values()]
+        data = None
+        for result, idxs_1, idxs_2, rows, inverted in groups.values():
+            values = result[field]
+            if data is None:
+                data = np.empty(shape + values.shape[1:], dtype = values.dtype)
+                data.fill(np.nan)
+            elif values.shape[1:] != data.shape[2:]:
+                raise RuntimeError("Freqs supposed to be the same")
+            data[idxs_1, idxs_2] = values[rows]
+            mask[idxs_1, idxs_2] = True
+            inverted_mask[idxs_1, idxs_2] = inverted
+        return data, mask, inverted_mask, results
+
+    def _matrix(self, type_name, field, holder_field, chns_1, chns_2, swap = False):
+        data, mask, inverted_mask, results = self._gather_pairs(
+            type_name, field, chns_1, chns_2, swap = swap
+        )
+        if data is None:
+            raise KeyError("No {0} results for these channels".format(type_name))
+        holder = DiagMatrixHolder(self, holder_field, data, mask, chns_1, chns_2)
+        holder._gather_from(results)
+        return holder
+
+    def coh_matrix(self, chns_1, chns_2):
+        """
+        Coherences of every pair of chns_1 x chns_2, see DiagMatrixHolder
+        """
+        return self._matrix('COH', 'coherence', 'coh', chns_1, chns_2)
+
+    def csd_matrix(self, chns_1, chns_2):
+        """
+        Cross spectra of every pair of chns_1 x chns_2, see DiagMatrixHolder
+        """
+        return self._matrix('CSD', 'CSD', 'csd', chns_1, chns_2)
+
+    def asd_stack(self, chns):
+        """
+        Spectra of chns, as a DiagMatrixHolder with asd of shape (len(chns), F)
+        """
+        mask = np.zeros(len(chns), dtype = bool)
+        results = []
+        data = None
+        for idx, chn in enumerate(chns):
+            entry = self._pairs.get(('PSD', chn, None), None)
+            if entry is None:
+                continue
+            values = entry[0].PSD.reshape(-1)
+            if data is None:
+                data = np.empty((len(chns), len(values)), dtype = values.dtype)
+                data.fill(np.nan)
+            elif len(values) != data.shape[1]:
+                raise RuntimeError("Freqs supposed to be the same")
+            data[idx] = values
+            mask[idx] = True
+            results.append(entry[0])
+        if data is None:
+            raise KeyError("No PSD results for these channels")
+        holder = DiagMatrixHolder(self, 'asd', data, mask, chns)
+        holder._gather_from(results)
+        return holder
+
+    def xfer_matrix(self, chns_num, chns_den):
+        """
+        Transfer functions of every pair of chns_num x chns_den, as xfer of
+        shape (len(chns_num), len(chns_den), F), see DiagMatrixHolder. Like
+        xfer, the pairs only measured the other way around are inverted and
+        those without a TF are computed from the CSD and the ASD of the
+        denominator.
+        """
+        data, mask, inverted_mask, results = self._gather_pairs(
+            'TF', 'xfer', chns_num, chns_den, swap = True
+        )
+        if data is not None:
+            data[inverted_mask] = 1. / data[inverted_mask]
+
+        if not np.all(mask):
+            csd, csd_mask, _, csd_results = self._gather_pairs(
+                'CSD', 'CSD', chns_num, chns_den
+            )
+            try:
+                asd = self.asd_stack(chns_den)
+            except KeyError:
+                asd = None
+            if csd is not None and asd is not None:
+                fill = ~mask & csd_mask & asd.mask[np.newaxis, :]
+                if data is None:
+                    data = np.empty(csd.shape, dtype = csd.dtype)
+                    data.fill(np.nan)
+                idxs_num, idxs_den = np.nonzero(fill)
+                data[idxs_num, idxs_den] = csd[idxs_num, idxs_den] / asd.asd[idxs_den]**2
+                mask = mask | fill
+                results = results + csd_results + [
+                    self._pairs[('PSD', chn, None)][0]
+                    for chn, found in zip(chns_den, asd.mask) if found
+                ]
+
+        if data is None:
+            raise KeyError("No TF or CSD results for these channels")
+        holder = DiagMatrixHolder(self, 'xfer', data, mask, chns_num, chns_den)
+        holder._gather_from(results)
+        return holder
 
     def sine_response(self, chn_list, chn_wrt = None, freq_idx = 0):
         return DiagSineResponseCoefficients(
@@ -426,36 +857,15 @@ class DiagAccess(object):
         )
 
     def channels(self):
-        channels_A = set()
-        channels_B = set()
-        for res_key, res_obj in self.results.items():
-            if res_key in (
-                'HarmonicCoefficients',
-                'CoherenceCoefficients',
-                'TransferCoefficients',
-                'TransferMatrix',
-            ):
-                channels_A.update(list(res_obj.channels.values()))
-            if res_key in ('TS',):
-                channels_A.update(list(res_obj.keys()))
-            else:
-                for chn_key, chn_obj in res_obj.items():
-                    channels_A.add(chn_key)
-                    channels_B.update(list(chn_obj.channelB_inv.keys()))
-        #reduce the B channels to being the unique ones
-        channels_B = channels_B - channels_A
-        return channels_A, channels_B
+        channels_A, channels_B = self._channels
+        return set(channels_A), set(channels_B)
 
     def channels_print(self):
-        channels_A, channels_B = self.channels()
-        channels_A = sorted(channels_A)
+        channels_A, channels_B = self._channels
         print("A-Channels:")
-        for chn in channels_A:
+        for chn in sorted(channels_A):
             print("\t", chn)
         if channels_B:
-            channels_B = sorted(channels_B)
             print("Non-A, B-Channels:")
-            for chn in channels_B:
+            for chn in sorted(channels_B):
                 print("\t", chn)
-
-
@@ -0,0 +1,55 @@
+"""
+Interning of the frequency axes of the results of a file.
+
+The results of one measurement nearly always share their frequencies, so
+dtt_read keeps one read-only array per distinct axis. Holders can then check
+that their frequencies agree by identity rather than elementwise.
+"""
+import hashlib
+import numpy as np
+
+
+class AxisInterner(object):
+    """
+    Table of the frequency axes of a file. linear() returns the axis of an
+    (f0, df, N) grid, and explicit() the stored copy of an axis read from a
+    stream, keyed by a digest of its bytes computed once. The copy is made
+    so that the interned axis does not keep alive the decoded stream the
+    axis was a view into.
+    """
+    def __init__(self):
+        self._linear = dict()
+        self._explicit = dict()
+
+    def linear(self, f0, df, N):
+        key = (f0, df, N)
+        FHz = self._linear.get(key, None)
+        if FHz is None:
+            FHz = np.linspace(f0, f0 + df*(N-1), N)
+            FHz.flags.writeable = False
+            self._linear[key] = FHz
+        return FHz
+
+    def explicit(self, FHz):
+        key = (
+            FHz.dtype.str,
+            FHz.shape,
+            hashlib.blake2b(np.ascontiguousarray(FHz).tobytes(), digest_size = 16).digest(),
+        )
+        FHz_interned = self._explicit.get(key, None)
+        if FHz_interned is not None and np.array_equal(FHz_interned, FHz):
+            return FHz_interned
+        FHz = np.array(FHz)
+        FHz.flags.writeable = False
+        self._explicit[key] = FHz
+        return FHz
+
+    def __len__(self):
+        return len(self._linear) + len(self._explicit)
+
+
+def same_axis(FHz_a, FHz_b):
+    """
+    Check two frequency axes for equality, by identity first
+    """
+    return FHz_a is FHz_b or np.array_equal(FHz_a, FHz_b)
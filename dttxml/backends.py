@@ -0,0 +1,196 @@
+"""
+XML parser backends yielding the top-level LIGO_LW nodes of a diaggui file.
+
+ - 'lxml': lxml.etree with huge_tree, so that the large base64 Stream texts of
+   long measurements are accepted. Used by default when lxml is installed.
+ - 'etree': the standard library xml.etree.ElementTree (C accelerated).
+ - 'expat': xml.parsers.expat callbacks feeding an ElementTree TreeBuilder only
+   for the top-level nodes that dttxml reads (Index, Result[n], Reference[n]),
+   so the Header, Test, Plot, ... blocks are never built.
+
+The backend is chosen by the backend argument of dtt_read, else by the
+DTTXML_BACKEND environment variable, else automatically.
+"""
+import os
+from xml.parsers import expat
+import xml.etree.ElementTree as etree
+
+try:
+    import lxml.etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+
+ENV_VAR = 'DTTXML_BACKEND'
+
+_CHUNK_BYTES = 1 << 16
+
+
+def node_needed(name, references = True):
+    """
+    Check if dttxml reads the top-level node of the given Name
+    """
+    if name.startswith('Reference['):
+        return references
+    return name == 'Index' or name.startswith('Result[')
+
+
+class EtreeBackend(object):
+    name = 'etree'
+    etree = etree
+
+    def iter_nodes(self, diag_file, streaming = False, select = None):
+        """
+        Yield the top-level nodes, optionally those whose Name passes select.
+        With streaming, each node is cleared and detached from the root once
+        the consumer resumes, so only one node is held at a time.
+        """
+        if streaming:
+            xml_nodes = self._iter_streaming(diag_file)
+        else:
+            xml_nodes = self._iter_tree(diag_file)
+        for xml_node in xml_nodes:
+            if select is not None and not select(xml_node.attrib.get('Name', '')):
+                continue
+            yield xml_node
+
+    def _parse(self, diag_file):
+        return self.etree.parse(diag_file)
+
+    def _iterparse(self, diag_file):
+        return self.etree.iterparse(diag_file, events = ('start', 'end'))
+
+    def _iter_tree(self, diag_file):
+        diag_tree = self._parse(diag_file)
+        for xml_node in diag_tree.getroot():
+            yield xml_node
+
+    def _iter_streaming(self, diag_file):
+        depth = 0
+        root = None
+        for event, xml_node in self._iterparse(diag_file):
+            if event == 'start':
+                if depth == 0:
+                    root = xml_node
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    yield xml_node
+                    xml_node.clear()
+                    root.remove(xml_node)
+
+
+class LxmlBackend(EtreeBackend):
+    name = 'lxml'
+    etree = lxml_etree
+
+    def _parse(self, diag_file):
+        parser = lxml_etree.XMLParser(huge_tree = True)
+        return lxml_etree.parse(diag_file, parser)
+
+    def _iterparse(self, diag_file):
+        return lxml_etree.iterparse(diag_file, events = ('start', 'end'), huge_tree = True)
+
+    def _iter_tree(self, diag_file):
+        #lxml also iterates over the comments and processing instructions
+        for xml_node in super(LxmlBackend, self)._iter_tree(diag_file):
+            if isinstance(xml_node.tag, str):
+                yield xml_node
+
+
+class ExpatBackend(object):
+    name = 'expat'
+    etree = etree
+
+    def iter_nodes(self, diag_file, streaming = False, select = None):
+        """
+        Yield the top-level nodes whose Name passes select as they close. The
+        other top-level nodes are skipped without building them. The parse is
+        incremental, so streaming makes no difference.
+        """
+        nodes = []
+        #depth of the current element and builder of the current top-level node
+        state = dict(depth = 0, builder = None)
+
+        def start(tag, attrs):
+            depth = state['depth'] = state['depth'] + 1
+            if depth == 2:
+                if select is None or select(attrs.get('Name', '')):
+                    state['builder'] = etree.TreeBuilder()
+                else:
+                    state['builder'] = None
+            builder = state['builder']
+            if depth >= 2 and builder is not None:
+                builder.start(tag, attrs)
+
+        def end(tag):
+            depth = state['depth']
+            state['depth'] = depth - 1
+            builder = state['builder']
+            if depth >= 2 and builder is not None:
+                builder.end(tag)
+                if depth == 2:
+                    nodes.append(builder.close())
+                    state['builder'] = None
+
+        def data(text):
+            builder = state['builder']
+            if builder is not None and state['depth'] >= 2:
+                builder.data(text)
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.specified_attributes = True
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = data
+
+        if hasattr(diag_file, 'read'):
+            F = diag_file
+            close = False
+        else:
+            F = open(diag_file, 'rb')
+            close = True
+        try:
+            while True:
+                chunk = F.read(_CHUNK_BYTES)
+                parser.Parse(chunk, not chunk)
+                for xml_node in nodes:
+                    yield xml_node
+                del nodes[:]
+                if not chunk:
+                    break
+        finally:
+            if close:
+                F.close()
+
+
+BACKENDS = {
+    'etree' : EtreeBackend,
+    'expat' : ExpatBackend,
+    'lxml'  : LxmlBackend,
+}
+
+
+def get_backend(backend = None):
+    """
+    Return the parser backend of the given name, or the backend itself if one
+    is passed. With None, DTTXML_BACKEND is used if set, else lxml when it is
+    installed and the standard library etree otherwise.
+    """
+    if backend is None:
+        backend = os.environ.get(ENV_VAR, None) or None
+    if backend is None:
+        backend = 'lxml' if lxml_etree is not None else 'etree'
+    if not isinstance(backend, str):
+        return backend
+    try:
+        backend_cls = BACKENDS[backend.lower()]
+    except KeyError:
+        raise ValueError("Unknown xml backend {0}, must be one of {1}".format(
+            backend, sorted(BACKENDS)
+        ))
+    if backend_cls is LxmlBackend and lxml_etree is None:
+        raise ImportError("The lxml xml backend requires lxml to be installed")
+    return backend_cls()
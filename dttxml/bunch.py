@@ -138,6 +138,14 @@ class Bunch(object):
     def __deepcopy__(self, memo):
         return self.__class__(copy.deepcopy(self._mydict, memo))
 
+    #defined so that pickle does not look them up through __getattr__ before
+    #_mydict is restored
+    def __getstate__(self):
+        return self.__dict__
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
     def copy(self):
         return self.__class__(self._mydict.copy())
 
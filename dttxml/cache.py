@@ -0,0 +1,288 @@
+"""
+Persistent on-disk cache of parsed diaggui files.
+
+Each entry is a directory holding the decoded arrays as .npy files and a
+manifest.json describing the rest of the dtt_read output, with the arrays
+referenced by file name. Entries are reloaded with the arrays memory mapped
+read-only, so a warm open costs about the manifest read whatever the size of
+the measurement. Entries are written to a temporary directory and renamed in
+place, and are evicted least recently used first once the cache grows beyond
+max_bytes.
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+from .bunch import Bunch
+from .parse import dtt_read
+from .records import (
+    ResultRecord,
+    SpectrumRecord,
+    TransferRecord,
+    TimeSeriesRecord,
+    CoefficientRecord,
+)
+
+MANIFEST = 'manifest.json'
+_CACHE_VERSION = 2
+
+_RECORDS = dict((cls.__name__, cls) for cls in (
+    SpectrumRecord,
+    TransferRecord,
+    TimeSeriesRecord,
+    CoefficientRecord,
+))
+
+#the dtt_read arguments changing its output with their defaults, the others
+#only change how it reads
+_KEY_KWARGS = (
+    ('channels',   None),
+    ('types',      None),
+    ('references', True),
+)
+
+
+def _content_hash(fname):
+    digest = hashlib.sha256()
+    with open(fname, 'rb') as F:
+        while True:
+            chunk = F.read(1 << 20)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Encoder(object):
+    """
+    Encode the dtt_read output into json-compatible values, writing the arrays
+    out as it goes. Containers and arrays met twice (such as the results
+    also listed in by_name) are stored once and referenced by id.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.memo = {}
+        self.nbytes = 0
+
+    def __call__(self, value):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            if isinstance(value, str) and type(value) is not str:
+                #such as the np.str_ of the channel names
+                return str(value)
+            return value
+        if isinstance(value, np.generic):
+            return dict(t = 'np', d = value.dtype.str, v = value.item())
+        ref_id = self.memo.get(id(value), None)
+        if ref_id is not None:
+            return dict(t = 'ref', id = ref_id)
+        ref_id = self.memo[id(value)] = len(self.memo)
+        if isinstance(value, np.ndarray):
+            if value.dtype.hasobject:
+                raise TypeError("Can't cache object arrays")
+            fname = '{0}.npy'.format(ref_id)
+            np.save(os.path.join(self.path, fname), value, allow_pickle = False)
+            self.nbytes += value.nbytes
+            return dict(t = 'npy', id = ref_id, f = fname)
+        if isinstance(value, ResultRecord):
+            return dict(
+                t  = 'record',
+                id = ref_id,
+                c  = value.__class__.__name__,
+                v  = self._items(value),
+            )
+        if isinstance(value, Bunch):
+            return dict(t = 'bunch', id = ref_id, v = self._items(value._mydict))
+        if isinstance(value, dict):
+            return dict(t = 'dict', id = ref_id, v = self._items(value))
+        if isinstance(value, list):
+            return dict(t = 'list', id = ref_id, v = [self(item) for item in value])
+        if isinstance(value, tuple):
+            return dict(t = 'tuple', id = ref_id, v = [self(item) for item in value])
+        raise TypeError("Can't cache values of type {0}".format(type(value)))
+
+    def _items(self, mapping):
+        return [[self(key), self(item)] for key, item in mapping.items()]
+
+
+class _Decoder(object):
+    def __init__(self, path):
+        self.path = path
+        self.memo = {}
+
+    def __call__(self, value):
+        if not isinstance(value, dict):
+            return value
+        tag = value['t']
+        if tag == 'np':
+            return np.dtype(value['d']).type(value['v'])
+        if tag == 'ref':
+            return self.memo[value['id']]
+        if tag == 'npy':
+            fname = os.path.join(self.path, value['f'])
+            try:
+                decoded = np.load(fname, mmap_mode = 'r', allow_pickle = False)
+            except ValueError:
+                #empty arrays can't be memory mapped
+                decoded = np.load(fname, allow_pickle = False)
+        elif tag == 'bunch':
+            decoded = Bunch()
+            self.memo[value['id']] = decoded
+            decoded.update(self._items(value['v']))
+        elif tag == 'record':
+            decoded = _RECORDS[value['c']]()
+            self.memo[value['id']] = decoded
+            decoded.update(self._items(value['v']))
+        elif tag == 'dict':
+            decoded = dict()
+            self.memo[value['id']] = decoded
+            decoded.update(self._items(value['v']))
+        elif tag == 'list':
+            decoded = []
+            self.memo[value['id']] = decoded
+            decoded.extend(self(item) for item in value['v'])
+        elif tag == 'tuple':
+            decoded = tuple(self(item) for item in value['v'])
+        else:
+            raise ValueError("Unknown cache tag {0}".format(tag))
+        self.memo[value['id']] = decoded
+        return decoded
+
+    def _items(self, items):
+        return [(self(key), self(item)) for key, item in items]
+
+
+class ParseCache(object):
+    """
+    Cache of the dtt_read output of files under cache_dir.
+
+    Entries are keyed by the absolute path, size and mtime of the file and the
+    filters passed to dtt_read. With hash_content, the sha256 of the file
+    replaces its path and mtime, so copies and touched files still hit, at
+    the cost of reading the file on each lookup.
+
+    The cached arrays are memory mapped read-only.
+    """
+    def __init__(self, cache_dir, max_bytes = 2**30, hash_content = False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def key(self, fname, **kwargs):
+        stat = os.stat(fname)
+        if self.hash_content:
+            ident = [stat.st_size, _content_hash(fname)]
+        else:
+            ident = [os.path.abspath(fname), stat.st_size, stat.st_mtime_ns]
+        for kw, default in _KEY_KWARGS:
+            value = kwargs.get(kw, default)
+            if kw == 'references':
+                value = bool(value)
+            elif value is not None:
+                value = sorted(value)
+            ident.append(value)
+        return hashlib.sha256(json.dumps(ident).encode('utf-8')).hexdigest()
+
+    def read(self, fname, **kwargs):
+        """
+        dtt_read(fname, \\*\\*kwargs) through the cache
+        """
+        key = self.key(fname, **kwargs)
+        raw = self.load(key)
+        if raw is None:
+            raw = dtt_read(fname, **kwargs)
+            try:
+                self.store(key, raw, source = fname)
+            except TypeError:
+                #holds values the cache can't represent, left uncached
+                pass
+            else:
+                #reload to hand out the same memory mapped arrays as a warm read
+                raw_cached = self.load(key)
+                if raw_cached is not None:
+                    raw = raw_cached
+        return raw
+
+    def load(self, key):
+        path = os.path.join(self.cache_dir, key)
+        manifest_path = os.path.join(path, MANIFEST)
+        try:
+            with open(manifest_path, 'r') as F:
+                manifest = json.load(F)
+        except (IOError, OSError, ValueError):
+            return None
+        if manifest.get('version', None) != _CACHE_VERSION:
+            return None
+        try:
+            raw = _Decoder(path)(manifest['tree'])
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+        #the manifest mtime orders the entries for eviction
+        os.utime(manifest_path, None)
+        return raw
+
+    def store(self, key, raw, source = None):
+        path = os.path.join(self.cache_dir, key)
+        path_tmp = os.path.join(self.cache_dir, '.tmp-{0}-{1}'.format(key, os.getpid()))
+        shutil.rmtree(path_tmp, ignore_errors = True)
+        os.makedirs(path_tmp)
+        try:
+            encoder = _Encoder(path_tmp)
+            tree = encoder(raw)
+            with open(os.path.join(path_tmp, MANIFEST), 'w') as F:
+                json.dump(dict(
+                    version = _CACHE_VERSION,
+                    source  = source,
+                    nbytes  = encoder.nbytes,
+                    tree    = tree,
+                ), F)
+            try:
+                os.rename(path_tmp, path)
+            except OSError:
+                #another process stored it first
+                pass
+        finally:
+            shutil.rmtree(path_tmp, ignore_errors = True)
+        self.evict()
+        return
+
+    def entries(self):
+        """
+        List the (last use time, size in bytes, key) of the entries
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            if key.startswith('.'):
+                continue
+            path = os.path.join(self.cache_dir, key)
+            try:
+                atime = os.stat(os.path.join(path, MANIFEST)).st_mtime_ns
+                nbytes = sum(
+                    entry.stat().st_size for entry in os.scandir(path)
+                )
+            except (IOError, OSError):
+                continue
+            entries.append((atime, nbytes, key))
+        return entries
+
+    def evict(self, max_bytes = None):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if max_bytes is None:
+            return
+        entries = sorted(self.entries())
+        total = sum(nbytes for atime, nbytes, key in entries)
+        for atime, nbytes, key in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors = True)
+            total -= nbytes
+        return
+
+    def clear(self):
+        self.evict(max_bytes = 0)
@@ -13,21 +13,52 @@ class DiagFileError(ValueError):
     pass
 
 
-def dtt2bunch(
+def dtt2bunch_iter(
     fpath,
     channels         = None,
     no_remap         = True,
     channel_map      = {},
     channels_exclude = set(),
     verbose          = False,
+    lazy             = False,
+    indexed          = False,
 ):
+    """
+    Generate the (path, value) items of the dtt2bunch conversion, path being
+    the tuple of keys of the value in the bunch. An empty dict value stands
+    for an empty group. The items of each channel are produced as they are
+    read, and with lazy and indexed the decoded results are released
+    afterwards, so that consuming them as they come keeps about one result in
+    memory. The GPS time follows the type, ahead of the arrays, to skip
+    a measurement already converted without reading them.
+
+    When several raw channels map to the same channel, the first is used.
+
+    The reference traces, merged into the results of DiagAccess as
+    "CHN(REF#)" channels, are left out of ASD, CSD, XFER and COH, as they are
+    stored whole under REFS. A transfer function without a coherence, such as
+    that of a reference, gets neither COH nor XFER_SNR_EST. The conversion of
+    a file with references used to raise a KeyError on either.
+    """
+    if channels is not None:
+        #the raw channel names which can map into the requested channels
+        channels_raw = set()
+        if no_remap:
+            channels_raw.update(channels)
+        for chn_raw, chn in channel_map.items():
+            if chn in channels:
+                channels_raw.add(chn_raw)
+    else:
+        channels_raw = None
     try:
-        daccess = DiagAccess(fpath)
+        daccess = DiagAccess(
+            fpath,
+            channels = channels_raw,
+            lazy     = lazy,
+            indexed  = indexed,
+        )
     except Exception:
         raise DiagFileError("Diag File malformed (xml syntax error)")
-    def insert_refs(dbunch):
-        for k, v in daccess.references.items():
-            dbunch.REFS[str(k)] = v
 
     Achns, Bchns = daccess.channels()
     allchns_raw = set(Achns)
@@ -35,181 +66,258 @@ def dtt2bunch(
     allchns_raw = list(allchns_raw)
     allchns_raw.sort()
 
-    spectra_bunch = DeepBunch()
-    spectra_bunch.type = 'spectra',
-    #PSD type
-    xsd_current = None
-    xsd_prev    = None
-    xfer_current = None
-    xfer_prev    = None
-    for idx_A in range(len(allchns_raw)):
-        chn_A_raw = allchns_raw[idx_A]
-        if chn_A_raw in channels_exclude:
+    #resolve the mapping of the raw channels once, in their sorted order
+    #the reference traces are stored whole under REFS rather than as spectra
+    chns_mapped = []
+    for chn_raw in allchns_raw:
+        if chn_raw in channels_exclude:
+            continue
+        if chn_raw in daccess.reference_channels:
             continue
         try:
-            chn_A = channel_map[chn_A_raw]
+            chn = channel_map[chn_raw]
         except KeyError:
             if no_remap:
-                chn_A = chn_A_raw
+                chn = chn_raw
             else:
                 continue
-        if channels is not None and chn_A not in channels:
+        if channels is not None and chn not in channels:
             continue
-        if chn_A in channels_exclude:
+        if chn in channels_exclude:
             continue
-        for idx_B in range(len(allchns_raw)):
-            chn_B_raw = allchns_raw[idx_B]
-            if chn_B_raw in channels_exclude:
-                continue
+        chns_mapped.append((chn_raw, chn))
+    chns_order = dict((chn_raw, idx) for idx, (chn_raw, chn) in enumerate(chns_mapped))
+
+    #the channels measured against each, from the metadata only. The xfer falls
+    #back to the CSD, so these cover all of the pairs with data
+    chns_pairs = []
+    for chn_A_raw, chn_A in chns_mapped:
+        chns_B_raw = daccess.partners('CSD', chn_A_raw)
+        chns_B_raw.update(daccess.partners('TF', chn_A_raw))
+        chns_B_raw = sorted(
+            (chn_B_raw for chn_B_raw in chns_B_raw if chn_B_raw in chns_order),
+            key = chns_order.get,
+        )
+        chns_B = []
+        for chn_B_raw in chns_B_raw:
+            chn_B = chns_mapped[chns_order[chn_B_raw]][1]
+            if chn_B != chn_A:
+                chns_B.append((chn_B_raw, chn_B))
+        try:
+            daccess.pair('PSD', chn_A_raw)
+        except KeyError:
+            has_psd = False
+        else:
+            has_psd = True
+        chns_pairs.append((chn_A_raw, chn_A, has_psd, chns_B))
+
+    #the results are released after the last channel using them
+    def pair_results(chn_A_raw, chn_B_raw):
+        for type_name, chns_raw in [
+            ('PSD', (chn_A_raw,)),
+            ('PSD', (chn_B_raw,)),
+            ('CSD', (chn_A_raw, chn_B_raw)),
+            ('TF',  (chn_B_raw, chn_A_raw)),
+            ('COH', (chn_A_raw, chn_B_raw)),
+        ]:
             try:
-                chn_B = channel_map[chn_B_raw]
+                yield daccess.pair(type_name, *chns_raw)[0]
             except KeyError:
-                if no_remap:
-                    chn_B = chn_B_raw
-                else:
-                    continue
-            if channels is not None and chn_B not in channels:
-                continue
+                pass
+    results_release = [[] for chns in chns_pairs]
+    results_last = dict()
+    for idx, (chn_A_raw, chn_A, has_psd, chns_B) in enumerate(chns_pairs):
+        for chn_B_raw, chn_B in chns_B:
+            for result in pair_results(chn_A_raw, chn_B_raw):
+                results_last[id(result)] = (idx, result)
+        if has_psd:
+            result = daccess.pair('PSD', chn_A_raw)[0]
+            results_last[id(result)] = (idx, result)
+    for idx, result in results_last.values():
+        results_release[idx].append(result)
+    results_last = None
 
-            if chn_B in channels_exclude:
-                continue
+    #the getters of the values produced, to check later mappings against
+    seen = dict()
+    def checked(path, getter, which):
+        """
+        Whether the value at path is new, else warn if it differs
+        """
+        prev_getter = seen.get(path, None)
+        if prev_getter is None:
+            seen[path] = getter
+            return True
+        prev = prev_getter()
+        value = getter()
+        if prev is not value:
+            if not all(prev == value):
+                warnings.warn((
+                    "Multiple Mappings from raw to real channel are not consistent for {0}"
+                ).format(which)
+                )
+        return False
+
+    def ref_items():
+        for k, v in daccess.references.items():
+            yield ('REFS', str(k)), v
 
-            if verbose:
-                print(chn_A, chn_B)
-            if chn_A == chn_B:
+    multiple_chns = len(set(chn for chn_raw, chn in chns_mapped)) > 1
+    if any(has_psd or chns_B for chn_A_raw, chn_A, has_psd, chns_B in chns_pairs):
+        yield ('type',), ('spectra',)
+        #from the metadata, that of the spectra before that of the xfer
+        results_all = [result for results in results_release for result in results]
+        results_xsd = [result for result in results_all if result.type_name in ('PSD', 'CSD')]
+        yield ('gps_second',), ((results_xsd or results_all)[0].gps_second,)
+        #PSD type
+        xsd_current = None
+        xsd_prev    = None
+        xfer_current = None
+        xfer_prev    = None
+        for idx, (chn_A_raw, chn_A, has_psd, chns_B) in enumerate(chns_pairs):
+            if has_psd:
+                xsd_current = daccess.asd(chn_A_raw)
+                if verbose:
+                    print(chn_A, chn_A)
+                if checked(
+                    ('ASD', chn_A),
+                    lambda chn_A_raw = chn_A_raw: daccess.asd(chn_A_raw).asd,
+                    "ASD of chn: {0}".format(chn_A),
+                ):
+                    yield ('ASD', chn_A), xsd_current.asd
+                if xsd_prev is not None:
+                    xsd_prev.metadata_check(xsd_current)
+                xsd_prev = xsd_current
+
+            if multiple_chns:
+                #created even when empty, as for each pair visited
+                for group in ['CSD', 'XFER']:
+                    if (group, chn_A) not in seen:
+                        seen[(group, chn_A)] = dict
+                        yield (group, chn_A), {}
+
+            for chn_B_raw, chn_B in chns_B:
+                if verbose:
+                    print(chn_A, chn_B)
+                pair_raw = (chn_A_raw, chn_B_raw)
+                between = "between chns: {0} and {1}".format(chn_A, chn_B)
                 try:
-                    xsd_current = daccess.asd(chn_A_raw)
-                    value = xsd_current.asd
-                    prev = spectra_bunch.ASD.setdefault(chn_A, value)
-                    if prev is not value:
-                        if not all(prev == value):
-                            warnings.warn((
-                                "Multiple Mappings from raw to real channel are not consistent for ASD of chn: {0}"
-                            ).format(chn_A)
-                            )
+                    xsd_current = daccess.csd(*pair_raw)
                 except KeyError:
-                    continue
-            else:
-                try:
-                    chn_A_dict = spectra_bunch.CSD.setdefault(chn_A, {})
-                    xsd_current = daccess.csd(chn_A_raw, chn_B_raw)
-                    value = xsd_current.csd
-                    prev = chn_A_dict.setdefault(chn_B, value)
-                    if prev is not value:
-                        if not all(prev == value):
-                            warnings.warn((
-                                "Multiple Mappings from raw to real channel are not consistent for CSD between chns: {0} and {1}"
-                            ).format(chn_A, chn_B)
-                            )
+                    pass
+                else:
+                    if checked(
+                        ('CSD', chn_A, chn_B),
+                        lambda pair_raw = pair_raw: daccess.csd(*pair_raw).csd,
+                        "CSD " + between,
+                    ):
+                        yield ('CSD', chn_A, chn_B), xsd_current.csd
                     if verbose:
                         print("GOOD: ", chn_A, chn_B)
-                except KeyError:
-                    pass
 
                 try:
-                    chn_A_dict = spectra_bunch.XFER.setdefault(chn_A, {})
-                    xfer_current = daccess.xfer(chn_A_raw, chn_B_raw)
-                    value = xfer_current.xfer
-                    prev = chn_A_dict.setdefault(chn_B, value)
-                    if prev is not value:
-                        if not all(prev == value):
-                            warnings.warn((
-                                "Multiple Mappings from raw to real channel are not consistent for XFER between chns: {0} and {1}"
-                            ).format(chn_A, chn_B)
-                            )
+                    xfer_current = daccess.xfer(*pair_raw)
                 except KeyError:
-                    print("BAD: ", chn_A, chn_B)
+                    if verbose:
+                        print("BAD: ", chn_A, chn_B)
                     continue
+                if checked(
+                    ('XFER', chn_A, chn_B),
+                    lambda pair_raw = pair_raw: daccess.xfer(*pair_raw).xfer,
+                    "XFER " + between,
+                ):
+                    yield ('XFER', chn_A, chn_B), xfer_current.xfer
+                try:
+                    coh = daccess.coh(*pair_raw).coh
+                except KeyError:
+                    #such as the transfer functions of references, saved without
+                    #their coherence
+                    coh = None
+                if coh is not None:
+                    if checked(
+                        ('COH', chn_A, chn_B),
+                        lambda pair_raw = pair_raw: daccess.coh(*pair_raw).coh,
+                        "COH " + between,
+                    ):
+                        yield ('COH', chn_A, chn_B), coh
+                    snr_est = lambda pair_raw = pair_raw: np.maximum(
+                        daccess.xfer(*pair_raw).SNR_estimate**2 - 1, 0
+                    )
+                    if checked(
+                        ('XFER_SNR_EST', chn_A, chn_B),
+                        snr_est,
+                        "XFER_SNR_EST " + between,
+                    ):
+                        yield ('XFER_SNR_EST', chn_A, chn_B), snr_est()
+
+                if xsd_prev is not None:
+                    xsd_prev.metadata_check(xsd_current)
+                xsd_prev = xsd_current
+
+                if xfer_prev is not None:
+                    xfer_prev.metadata_check(xfer_current)
+                xfer_prev = xfer_current
+            daccess.release(results_release[idx])
+
+        if xsd_current is not None:
+            yield ('window',),     (xsd_current.window,)
+            yield ('averages',),   (xsd_current.averages,)
+            yield ('BW',),         (xsd_current.BW,)
+            yield ('FHz',),        (xsd_current.FHz.squeeze(),)
+        else:
+            #yield ('window',),     (xfer_current.window,)
+            yield ('averages',),   (xfer_current.averages,)
+            #yield ('BW',),         (xfer_current.BW,)
+            yield ('FHz',),        (xfer_current.FHz.squeeze(),)
+        for item in ref_items():
+            yield item
+        return
 
-                chn_A_dict = spectra_bunch.COH.setdefault(chn_A, {})
-                value = daccess.coh(chn_A_raw, chn_B_raw).coh
-                prev = chn_A_dict.setdefault(chn_B, value)
-                if prev is not value:
-                    if not all(prev == value):
-                        warnings.warn((
-                            "Multiple Mappings from raw to real channel are not consistent for COH between chns: {0} and {1}"
-                        ).format(chn_A, chn_B)
-                        )
-                chn_A_dict = spectra_bunch.XFER_SNR_EST.setdefault(chn_A, {})
-                value = daccess.xfer(chn_A_raw, chn_B_raw).SNR_estimate
-                value = np.maximum(value**2 - 1, 0)
-                prev = chn_A_dict.setdefault(chn_B, value)
-                if prev is not value:
-                    if not all(prev == value):
-                        warnings.warn((
-                            "Multiple Mappings from raw to real channel are not consistent for XFER_SNR_EST between chns: {0} and {1}"
-                        ).format(chn_A, chn_B)
-                        )
-            if xsd_prev is not None:
-                xsd_prev.metadata_check(xsd_current)
-            xsd_prev = xsd_current
-
-            if xfer_prev is not None:
-                xfer_prev.metadata_check(xfer_current)
-            xfer_prev = xfer_current
-
-    if xsd_current is not None:
-        spectra_bunch.gps_second   = xsd_current.gps_second,
-        spectra_bunch.window       = xsd_current.window,
-        spectra_bunch.averages     = xsd_current.averages,
-        spectra_bunch.BW           = xsd_current.BW,
-        spectra_bunch.FHz          = xsd_current.FHz.squeeze(),
-        insert_refs(spectra_bunch)
-        return spectra_bunch
-    elif xfer_current is not None:
-        spectra_bunch.gps_second   = xfer_current.gps_second,
-        #spectra_bunch.window       = xfer_current.window,
-        spectra_bunch.averages     = xfer_current.averages,
-        #spectra_bunch.BW           = xfer_current.BW,
-        spectra_bunch.FHz          = xfer_current.FHz.squeeze(),
-        insert_refs(spectra_bunch)
-        return spectra_bunch
-
-    TS_bunch = DeepBunch()
-    TS_bunch.type = 'timeseries',
     try:
         diag_TS = daccess.results.TS
     except (KeyError, AttributeError):
         raise DiagFileError("No Channels Found in TS")
-    ts_current = None
-    ts_prev = None
-    for idx_A in range(len(allchns_raw)):
-        chn_A_raw = allchns_raw[idx_A]
-        if chn_A_raw in channels_exclude:
-            continue
-        try:
-            chn_A = channel_map[chn_A_raw]
-        except KeyError:
-            if no_remap:
-                chn_A = chn_A_raw
-            else:
-                continue
-        if channels is not None and chn_A not in channels:
-            continue
-        if chn_A in channels_exclude:
-            continue
-        try:
-            ts_current = diag_TS[chn_A_raw]
-        except KeyError:
-            pass
-        else:
-            value = ts_current.timeseries
-            prev = TS_bunch.TS.setdefault(chn_A, value)
-            ts_prev = ts_current
-            if prev is not value:
-                if not all(prev == value):
-                    warnings.warn((
-                        "Multiple Mappings from raw to real channel are not consistent for TS of chn: {0}"
-                    ).format(chn_A)
-                    )
-    if ts_current is not None:
-        TS_bunch.gps_second    = ts_current.gps_second,
-        TS_bunch.time_delay_s  = ts_current.time_delay_s,
-        TS_bunch.avgtype       = ts_current.avgtype,
-        TS_bunch.dt            = ts_current.dt,
-        insert_refs(TS_bunch)
-        return TS_bunch
-    else:
+    chns_TS = [
+        (chn_A_raw, chn_A) for chn_A_raw, chn_A in chns_mapped if chn_A_raw in diag_TS
+    ]
+    if not chns_TS:
         raise DiagFileError("No Channels Found in TS")
+    yield ('type',), ('timeseries',)
+    yield ('gps_second',), (diag_TS[chns_TS[0][0]].gps_second,)
+    for chn_A_raw, chn_A in chns_TS:
+        ts_current = diag_TS[chn_A_raw]
+        if checked(
+            ('TS', chn_A),
+            lambda chn_A_raw = chn_A_raw: diag_TS[chn_A_raw].timeseries,
+            "TS of chn: {0}".format(chn_A),
+        ):
+            yield ('TS', chn_A), ts_current.timeseries
+        daccess.release([ts_current])
+    yield ('time_delay_s',), (ts_current.time_delay_s,)
+    yield ('avgtype',),      (ts_current.avgtype,)
+    yield ('dt',),           (ts_current.dt,)
+    for item in ref_items():
+        yield item
 
 
+def dtt2bunch(
+    fpath,
+    channels         = None,
+    no_remap         = True,
+    channel_map      = {},
+    channels_exclude = set(),
+    verbose          = False,
+):
+    dbunch = DeepBunch()
+    for path, value in dtt2bunch_iter(
+        fpath,
+        channels         = channels,
+        no_remap         = no_remap,
+        channel_map      = channel_map,
+        channels_exclude = channels_exclude,
+        verbose          = verbose,
+    ):
+        dbunch_sub = dbunch
+        for key in path[:-1]:
+            dbunch_sub = dbunch_sub[key]
+        dbunch_sub[path[-1]] = value
+    return dbunch
@@ -5,41 +5,317 @@ If you have hdf5 command line tools (h5ls) then you can list the datasets with
 
 h5ls -r filename.h5
 """
+import os
+import sys
+import glob
+import time
 import argparse
 import os.path as path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import h5py
-from .declarative.hdf_deep_bunch import HDFDeepBunch
+from .hdf_deep_bunch import HDFDeepBunch
 
-from .dtt2bunch import dtt2bunch
+from .dtt2bunch import dtt2bunch, dtt2bunch_iter
+from .hdf_archive import HDFArchive
+
+#extensions of the second positional argument taken as the output file, for
+#the single file form "dtt2hdf from.xml to.h5"
+HDF_EXTENSIONS = ('.h5', '.hdf5', '.hdf')
+
+
+def dtt2hdf(file_from, file_to, stream = True, verbose = False, write_options = None):
+    """
+    Convert the diaggui file file_from into the HDF5 file file_to, which is
+    overwritten. With stream, each dataset is written as soon as it is read
+    and the decoded results are released as it goes, so that the full
+    conversion is never held in memory. write_options sets the layout of the
+    datasets, see hdf_deep_bunch.WRITE_OPTIONS.
+
+    The file is written under a temporary name and renamed into place, so
+    file_to is never left partially written.
+    """
+    file_tmp = '{0}.tmp-{1}'.format(file_to, os.getpid())
+    try:
+        with h5py.File(file_tmp, 'w') as F_hdf:
+            hdf = HDFDeepBunch(F_hdf, writeable = True, write_options = write_options)
+            if stream:
+                hdf.update_items(dtt2bunch_iter(
+                    fpath   = file_from,
+                    verbose = verbose,
+                    lazy    = True,
+                    indexed = True,
+                ))
+            else:
+                hdf.update_recursive(dtt2bunch(fpath = file_from, verbose = verbose))
+        os.replace(file_tmp, file_to)
+    finally:
+        if path.exists(file_tmp):
+            os.remove(file_tmp)
+    return
+
+
+def expand_inputs(inputs, recursive = False):
+    """
+    List the (file, relative path) of the diaggui files named by inputs,
+    which may be files, directories (of which the .xml files are taken, and
+    those of the subdirectories if recursive) or glob patterns. The relative
+    path is that under the directory given, for mirroring it in an output
+    directory.
+    """
+    fpaths = []
+    for fpath_in in inputs:
+        if path.isdir(fpath_in):
+            if recursive:
+                pattern = path.join(glob.escape(fpath_in), '**', '*.xml')
+            else:
+                pattern = path.join(glob.escape(fpath_in), '*.xml')
+            for fpath in sorted(glob.glob(pattern, recursive = recursive)):
+                fpaths.append((fpath, path.relpath(fpath, fpath_in)))
+        elif path.exists(fpath_in):
+            fpaths.append((fpath_in, path.basename(fpath_in)))
+        else:
+            matches = sorted(glob.glob(fpath_in, recursive = recursive))
+            if not matches:
+                raise IOError("No diaggui files match {0}".format(fpath_in))
+            for fpath in matches:
+                if path.isfile(fpath):
+                    fpaths.append((fpath, path.basename(fpath)))
+    return fpaths
+
+
+def output_path(file_from, relpath = None, output_dir = None):
+    """
+    The .h5 file of file_from, alongside it or in output_dir
+    """
+    if output_dir is None:
+        return path.splitext(file_from)[0] + '.h5'
+    if relpath is None:
+        relpath = path.basename(file_from)
+    return path.join(output_dir, path.splitext(relpath)[0] + '.h5')
+
+
+def up_to_date(file_from, file_to):
+    try:
+        return os.stat(file_to).st_mtime_ns >= os.stat(file_from).st_mtime_ns
+    except OSError:
+        return False
+
+
+def _convert_worker(file_from, file_to, kwargs):
+    t_start = time.perf_counter()
+    try:
+        dirname = path.dirname(file_to)
+        if dirname:
+            os.makedirs(dirname, exist_ok = True)
+        dtt2hdf(file_from, file_to, **kwargs)
+    except Exception as E:
+        return E
+    return time.perf_counter() - t_start
+
+
+def convert_many(conversions, workers = 1, report = None, **kwargs):
+    """
+    Run dtt2hdf(file_from, file_to, \\*\\*kwargs) for each of the (file_from,
+    file_to) of conversions, spread over a pool of workers processes if more
+    than 1.
+
+    Returns the list of the (file_from, file_to, seconds or exception), in
+    the order of completion, calling report with each as it completes.
+    """
+    conversions = list(conversions)
+    workers = min(workers, len(conversions))
+    results = []
+    def done(file_from, file_to, outcome):
+        results.append((file_from, file_to, outcome))
+        if report is not None:
+            report(file_from, file_to, outcome)
+
+    if workers <= 1:
+        for file_from, file_to in conversions:
+            done(file_from, file_to, _convert_worker(file_from, file_to, kwargs))
+        return results
+
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = dict(
+            (executor.submit(_convert_worker, file_from, file_to, kwargs), (file_from, file_to))
+            for file_from, file_to in conversions
+        )
+        for future in as_completed(futures):
+            file_from, file_to = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as E:
+                outcome = E
+            done(file_from, file_to, outcome)
+    return results
 
 
 def main(args = None):
     parser = argparse.ArgumentParser(
-        prog = 'dtt2hdf5',
+        prog = 'dtt2hdf',
         description=__doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter,
     )
 
     parser.add_argument(
-        #'--control-A',
-        dest     = 'file_from',
+        dest     = 'inputs',
         metavar  = 'from-file',
         type     = str,
-        help     = 'diaggui xml file to parse'
+        nargs    = '+',
+        help     = (
+            'diaggui xml files to parse, directories of them or glob patterns. '
+            'Each is written to a .h5 of the same name. For a single file, a '
+            'second argument ending in .h5 is taken as the HDF5 file to write.'
+        ),
+    )
+
+    parser.add_argument(
+        '-o', '--output-dir',
+        dest     = 'output_dir',
+        default  = None,
+        help     = 'Directory to write the HDF5 files to, rather than alongside the inputs',
+    )
+
+    parser.add_argument(
+        '-r', '--recursive',
+        dest     = 'recursive',
+        action   = 'store_true',
+        help     = 'Convert the files of the subdirectories of directory inputs, and let ** match them in patterns',
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        dest     = 'jobs',
+        type     = int,
+        default  = 1,
+        help     = 'Number of files to convert in parallel processes',
+    )
+
+    parser.add_argument(
+        '-f', '--force',
+        dest     = 'force',
+        action   = 'store_true',
+        help     = 'Convert files even if their HDF5 file is newer than them',
+    )
+
+    parser.add_argument(
+        '--compression',
+        dest     = 'compression',
+        choices  = ['gzip', 'lzf'],
+        default  = None,
+        help     = 'Compress the datasets',
     )
 
     parser.add_argument(
-        #'--control-A',
-        dest     = 'file_to',
-        metavar  = 'to-file',
+        '--compression-level',
+        dest     = 'compression_opts',
+        type     = int,
+        default  = None,
+        help     = 'gzip compression level, 0-9',
+    )
+
+    parser.add_argument(
+        '--shuffle',
+        dest     = 'shuffle',
+        action   = 'store_true',
+        help     = 'Apply the shuffle filter before compressing, which usually helps',
+    )
+
+    parser.add_argument(
+        '--chunks',
+        dest     = 'chunks',
         type     = str,
-        nargs    = '?',
         default  = None,
-        help     = 'HDF5 file to insert to. Will rename the input to a .h5 if not given.'
+        help     = (
+            'Chunk the datasets, into blocks of this many points along the '
+            'frequency (or time) axis, or "auto" for chunks chosen by h5py'
+        ),
+    )
+
+    parser.add_argument(
+        '--float32',
+        dest     = 'float32',
+        action   = 'store_true',
+        help     = 'Store the double precision arrays as single precision, that of the dtt data',
     )
 
     parser.add_argument(
-        '-q, --quiet',
+        '--scalar-attrs',
+        dest     = 'scalar_attrs',
+        action   = 'store_true',
+        help     = 'Store the single values (gps_second, averages, BW...) as attributes of their group',
+    )
+
+    parser.add_argument(
+        '--append',
+        dest     = 'append',
+        metavar  = 'ARCHIVE',
+        default  = None,
+        help     = (
+            'Append the measurements as rows of the time-stacked archive '
+            'ARCHIVE (see dttxml.hdf_archive), rather than writing a file for '
+            'each. Files already in it are skipped'
+        ),
+    )
+
+    parser.add_argument(
+        '--watch',
+        dest     = 'watch',
+        action   = 'store_true',
+        help     = (
+            'Watch the directories given for new files, converting (or '
+            'appending or caching) each once it has stopped changing, until '
+            'interrupted'
+        ),
+    )
+
+    parser.add_argument(
+        '--poll-interval',
+        dest     = 'poll_interval',
+        type     = float,
+        default  = 2.0,
+        help     = 'Seconds between the scans of the watched directories',
+    )
+
+    parser.add_argument(
+        '--state-file',
+        dest     = 'state_file',
+        default  = None,
+        help     = 'JSON file recording the files done by --watch, by default in the output or watched directory',
+    )
+
+    parser.add_argument(
+        '--max-polls',
+        dest     = 'max_polls',
+        type     = int,
+        default  = None,
+        help     = 'Stop watching after this many scans',
+    )
+
+    parser.add_argument(
+        '--cache-dir',
+        dest     = 'cache_dir',
+        default  = None,
+        help     = 'With --watch, parse the new files into this ParseCache directory rather than converting them',
+    )
+
+    parser.add_argument(
+        '--in-memory',
+        dest     = 'in_memory',
+        action   = 'store_true',
+        help     = 'Build the whole conversion in memory before writing it, rather than streaming it',
+    )
+
+    parser.add_argument(
+        '-v', '--verbose',
+        dest     = 'verbose',
+        action   = 'store_true',
+        help     = 'Print the channel pairs as they are converted',
+    )
+
+    parser.add_argument(
+        '-q', '--quiet',
         dest     = 'quiet',
         action   = 'store_true',
         help     = 'Quiet the output',
@@ -47,30 +323,181 @@ def main(args = None):
 
     args = parser.parse_args(args = args)
 
-    ffrom_base, ffrom_ext = path.splitext(args.file_from)
-    if args.file_to is None:
-        file_to = ffrom_base + '.h5'
+    if args.chunks is None:
+        chunks = None
+    elif args.chunks == 'auto':
+        chunks = True
     else:
-        file_to = args.file_to
+        try:
+            chunks = int(args.chunks)
+        except ValueError:
+            parser.error("--chunks takes a number of points or auto")
+    write_options = dict(
+        chunks           = chunks,
+        compression      = args.compression,
+        compression_opts = args.compression_opts,
+        shuffle          = args.shuffle,
+        float32          = args.float32,
+        scalar_attrs     = args.scalar_attrs,
+    )
 
+    if args.watch:
+        return main_watch(args, write_options)
+
+    inputs = args.inputs
+    file_to = None
+    if len(inputs) == 2 and path.splitext(inputs[1])[1].lower() in HDF_EXTENSIONS:
+        inputs, file_to = inputs[:1], inputs[1]
+
+    fpaths = expand_inputs(inputs, recursive = args.recursive)
+    if args.append is not None:
+        if file_to is not None:
+            parser.error("--append takes the archive in place of the output file")
+        return main_append(args, [file_from for file_from, relpath in fpaths], write_options)
+    if file_to is not None and len(fpaths) > 1:
+        parser.error("{0} names more than one file to convert into {1}".format(inputs[0], file_to))
+
+    conversions = []
+    n_skipped = 0
+    for file_from, relpath in fpaths:
+        if file_to is None:
+            file_to_conv = output_path(file_from, relpath, args.output_dir)
+        else:
+            file_to_conv = file_to
+        if not args.force and up_to_date(file_from, file_to_conv):
+            n_skipped += 1
+            continue
+        conversions.append((file_from, file_to_conv))
+
+    def report(file_from, file_to, outcome):
+        if isinstance(outcome, Exception):
+            print("FAILED: {0}: {1}".format(file_from, outcome), file = sys.stderr)
+        elif not args.quiet:
+            MB = path.getsize(file_from) / 1e6
+            print("{0} -> {1}: {2:.1f} MB in {3:.2f} s ({4:.1f} MB/s)".format(
+                file_from, file_to, MB, outcome, MB / max(outcome, 1e-9),
+            ))
+
+    t_start = time.perf_counter()
+    results = convert_many(
+        conversions,
+        workers = args.jobs,
+        report  = report,
+        stream  = not args.in_memory,
+        verbose = args.verbose,
+        write_options = write_options,
+    )
+    t_total = time.perf_counter() - t_start
+
+    n_failed = sum(isinstance(outcome, Exception) for file_from, file_to, outcome in results)
+    if not args.quiet and (len(results) > 1 or n_skipped):
+        MB = sum(
+            path.getsize(file_from) / 1e6
+            for file_from, file_to, outcome in results
+            if not isinstance(outcome, Exception)
+        )
+        print((
+            "{0} converted, {1} up to date, {2} failed: {3:.1f} MB in {4:.2f} s ({5:.1f} MB/s)"
+        ).format(
+            len(results) - n_failed, n_skipped, n_failed,
+            MB, t_total, MB / max(t_total, 1e-9),
+        ))
+    if n_failed:
+        return 1
+    return 0
+
+
+def main_append(args, fpaths, write_options):
+    """
+    The --append mode of main. The archive is written by this process only,
+    so the files are read in turn.
+    """
+    n_appended = 0
+    n_skipped = 0
+    n_failed = 0
+    t_start = time.perf_counter()
+    with HDFArchive(args.append, write_options = write_options) as archive:
+        for file_from in fpaths:
+            t_file = time.perf_counter()
+            try:
+                row = archive.append(file_from, verbose = args.verbose)
+            except Exception as E:
+                n_failed += 1
+                print("FAILED: {0}: {1}".format(file_from, E), file = sys.stderr)
+                continue
+            if row is None:
+                n_skipped += 1
+                continue
+            n_appended += 1
+            if not args.quiet:
+                print("{0} -> {1}[{2}]: {3:.2f} s".format(
+                    file_from, args.append, row, time.perf_counter() - t_file,
+                ))
     if not args.quiet:
-        print(file_to)
+        print("{0} appended, {1} already archived, {2} failed in {3:.2f} s".format(
+            n_appended, n_skipped, n_failed, time.perf_counter() - t_start,
+        ))
+    if n_failed:
+        return 1
+    return 0
 
-    #parser.add_argument(
-    #    '-E',
-    #    dest='control_A',
-    #    type=int,
-    #    required=True,
-    #    help='Exclude Channels'
-    #)
 
-    diag_DB = dtt2bunch(fpath = args.file_from, verbose = not args.quiet)
+def main_watch(args, write_options):
+    """
+    The --watch mode of main, watching each of the input directories in turn
+    at each poll
+    """
+    import logging
+    from .watch import Watcher
+
+    logging.basicConfig(
+        level  = logging.WARNING if args.quiet else logging.INFO,
+        format = '%(asctime)s %(message)s',
+    )
+    for directory in args.inputs:
+        if not path.isdir(directory):
+            raise SystemExit("--watch takes directories, {0} isn't one".format(directory))
+    if args.state_file is not None and len(args.inputs) > 1:
+        raise SystemExit("--state-file is for a single watched directory")
 
-    #write the file out, it is cleared first due to the 'w' flag. Could do this using append operations with 'a'
-    with h5py.File(file_to, 'w') as F_hdf:
-        hdf = HDFDeepBunch(F_hdf, writeable = True)
-        hdf.update_recursive(diag_DB)
+    archive = None
+    if args.append is not None:
+        archive = HDFArchive(args.append, write_options = write_options)
+    watchers = [
+        Watcher(
+            directory,
+            output_dir    = args.output_dir,
+            recursive     = args.recursive,
+            state_file    = args.state_file,
+            workers       = args.jobs,
+            poll_interval = args.poll_interval,
+            archive       = archive,
+            cache_dir     = args.cache_dir,
+            write_options = write_options,
+            stream        = not args.in_memory,
+        )
+        for directory in args.inputs
+    ]
+    polls = 0
+    try:
+        while args.max_polls is None or polls < args.max_polls:
+            for watcher in watchers:
+                watcher.poll()
+            polls += 1
+            if args.max_polls is not None and polls >= args.max_polls:
+                break
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for watcher in watchers:
+            watcher.close()
+        if archive is not None:
+            archive.close()
+    if any(watcher.n_failed for watcher in watchers):
+        return 1
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Reading of the HDF5 files written by dtt2hdf back into the results of
+dtt_read, for DiagAccess.from_hdf.
+
+The converted file holds the arrays per channel or channel pair (ASD/<A>,
+CSD/<A>/<B>, XFER/<A>/<B>, COH/<A>/<B>, TS/<A>), the single values of the
+measurement at its root and the references under REFS. These are regrouped
+into one result per type and channel A, with its channelB_inv rows, as the
+parsers build them. Only the metadata is read on open; the arrays of each
+result are read on first use, as those of the records of the lazy parse,
+and can be released and read again.
+"""
+import h5py
+import numpy as np
+
+from .bunch import Bunch
+from .records import RECORD_TYPES
+
+#the single values of the measurement at the root of the file
+METADATA = ('gps_second', 'window', 'averages', 'BW', 'time_delay_s', 'avgtype', 'dt')
+
+
+class HDFFieldLoader(object):
+    """
+    Loader of the arrays of a result from the datasets of an open HDF5 file.
+    fields maps each key to a dataset path, or to a list of paths whose
+    datasets are stacked as the rows of the array.
+    """
+    __slots__ = ('hdf', 'fields')
+
+    def __init__(self, hdf, fields):
+        self.hdf = hdf
+        self.fields = fields
+
+    def __call__(self):
+        arrays = dict()
+        for key, paths in self.fields.items():
+            if not isinstance(paths, list):
+                arrays[key] = self.hdf[paths][()]
+                continue
+            datasets = [self.hdf[path] for path in paths]
+            data = np.empty((len(datasets),) + datasets[0].shape, dtype = datasets[0].dtype)
+            for row, dataset in enumerate(datasets):
+                dataset.read_direct(data[row])
+            arrays[key] = data
+        return arrays
+
+    def release(self):
+        #nothing is kept here, the arrays are read again from the file
+        return True
+
+
+def hdf_value(value, unwrap = True):
+    """
+    Convert a value read from the file to that of the parsers, decoding
+    strings and unwrapping single values, which dtt2hdf writes as arrays of
+    length 1 unless unwrap is False
+    """
+    value = np.asarray(value)
+    if value.dtype.kind in 'OS':
+        value = np.array([
+            v.decode('utf-8') if isinstance(v, bytes) else v for v in value.reshape(-1)
+        ], dtype = object).reshape(value.shape)
+        if value.size > 0 and all(isinstance(v, str) for v in value.reshape(-1)):
+            value = value.astype(str)
+    if value.ndim == 0 or (unwrap and value.ndim == 1 and value.shape[0] == 1):
+        value = value.reshape(-1)[0]
+        if isinstance(value, np.generic):
+            value = value.item()
+    return value
+
+
+def hdf_metadata(hdf, name, default = None):
+    """
+    A single value at the root of the file, stored as a dataset or, with the
+    scalar_attrs write option, as an attribute
+    """
+    try:
+        item = hdf[name]
+    except KeyError:
+        try:
+            item = hdf.attrs[name]
+        except KeyError:
+            return default
+    else:
+        if not isinstance(item, h5py.Dataset):
+            return default
+        item = item[()]
+    return hdf_value(item)
+
+
+def hdf_reference(hdf, group):
+    """
+    The reference stored in group, with its arrays deferred
+    """
+    values = dict()
+    fields = dict()
+    for key, item in group.items():
+        if isinstance(item, h5py.Group):
+            values[key] = dict(
+                (sub_key, hdf_value(sub_item[()])) for sub_key, sub_item in item.items()
+            )
+        elif item.ndim > 0 and item.dtype.kind in 'fciu':
+            fields[key] = item.name
+        else:
+            values[key] = hdf_value(item[()], unwrap = False)
+    ref = RECORD_TYPES[values['type_name']](values)
+    if fields:
+        ref.defer(list(fields), HDFFieldLoader(hdf, fields))
+    return ref
+
+
+def hdf_read(fpath):
+    """
+    Read the HDF5 file written by dtt2hdf into the Bunch of references,
+    results, index and by_name of dtt_read. The file is kept open, as raw.hdf,
+    for the arrays read on use. There is no Index, and by_name names the
+    results by their type and channel A, the references as in the XML.
+    """
+    hdf = h5py.File(fpath, 'r')
+    try:
+        kind = hdf_metadata(hdf, 'type')
+        if kind not in ('spectra', 'timeseries'):
+            raise ValueError("{0} is not a file written by dtt2hdf".format(fpath))
+
+        metadata = dict()
+        for name in METADATA:
+            value = hdf_metadata(hdf, name)
+            if value is not None:
+                metadata[name] = value
+        for name in ('gps_second', 'window', 'averages', 'BW'):
+            metadata.setdefault(name, None)
+        if 'FHz' in hdf:
+            FHz = np.asarray(hdf['FHz'][()]).reshape(-1)
+            FHz.flags.writeable = False
+            metadata['FHz'] = FHz
+
+        #type_name -> chn_A -> list of (chn_B, dataset path)
+        rows = dict()
+        def add_rows(group_name, type_name, swap = False):
+            try:
+                group = hdf[group_name]
+            except KeyError:
+                return
+            #by name, as opening each dataset would cost more than the rest
+            for chn_1 in group.keys():
+                for chn_2 in group[chn_1].keys():
+                    if swap:
+                        chn_A, chn_B = chn_2, chn_1
+                    else:
+                        chn_A, chn_B = chn_1, chn_2
+                    rows.setdefault(type_name, dict()).setdefault(chn_A, []).append(
+                        (chn_B, '/'.join((group_name, chn_1, chn_2)))
+                    )
+        add_rows('CSD', 'CSD')
+        #XFER/<num>/<den> is the row of num in the TF of den
+        add_rows('XFER', 'TF', swap = True)
+        add_rows('COH', 'COH')
+
+        results = dict()
+        by_name = dict()
+        def add_result(type_name, chn_A, fields, extra):
+            result = RECORD_TYPES[type_name](metadata)
+            result.type_name = type_name
+            if type_name == 'TS':
+                result.channel = chn_A
+            else:
+                result.channelA = chn_A
+            result.update(extra)
+            result.defer(list(fields), HDFFieldLoader(hdf, fields))
+            results.setdefault(type_name, dict())[chn_A] = result
+            by_name['{0}[{1}]'.format(type_name, chn_A)] = result
+
+        if kind == 'spectra':
+            for chn_A in hdf.get('ASD', dict()).keys():
+                add_result('PSD', chn_A, dict(PSD = 'ASD/' + chn_A), dict())
+            for type_name, field in [('CSD', 'CSD'), ('TF', 'xfer'), ('COH', 'coherence')]:
+                for chn_A, chns_B in rows.get(type_name, dict()).items():
+                    channelB = np.array([chn_B for chn_B, path in chns_B])
+                    add_result(type_name, chn_A, {field : [path for chn_B, path in chns_B]}, dict(
+                        channelB     = channelB,
+                        channelB_inv = dict((chn_B, idx) for idx, chn_B in enumerate(channelB)),
+                        M            = len(channelB),
+                    ))
+        else:
+            for chn_A in hdf.get('TS', dict()).keys():
+                add_result('TS', chn_A, dict(timeseries = 'TS/' + chn_A), dict())
+
+        refs = dict()
+        for key, group in hdf.get('REFS', dict()).items():
+            refs[int(key)] = by_name['Reference[{0}]'.format(key)] = hdf_reference(hdf, group)
+    except BaseException:
+        hdf.close()
+        raise
+
+    raw = Bunch()
+    raw.references = Bunch(refs)
+    raw.results = Bunch(results)
+    raw.index = None
+    raw.by_name = by_name
+    raw.hdf = hdf
+    return raw
@@ -0,0 +1,257 @@
+"""
+Time-stacked HDF5 archive of the measurements of one diaggui template.
+
+Each array of the dtt2hdf conversion (ASD/<chn>, XFER/<A>/<B>, COH, CSD...)
+becomes a resizable (n_measurements, F) dataset at the same path, the single
+values of each measurement (gps_second, averages, BW, window) go to 1-D
+datasets under index/, and the frequency grid to FHz, which every appended
+file must share. A trend of one channel is then a single sliced read.
+
+Rows missing a channel read as NaN. Files already archived, by their path or
+by their GPS time, are skipped.
+"""
+import os
+import h5py
+import numpy as np
+
+from .dtt2bunch import dtt2bunch_iter
+from .hdf_deep_bunch import hdf_write_options
+
+INDEX = 'index'
+
+
+def _fillvalue(dtype):
+    if dtype.kind in 'fc':
+        return dtype.type(np.nan)
+    if dtype.kind in 'OSU':
+        return ''
+    return 0
+
+
+class HDFArchive(object):
+    """
+    Archive in the HDF5 file fpath, created if missing. write_options takes
+    the compression, compression_opts, shuffle and float32 options of
+    hdf_deep_bunch.WRITE_OPTIONS, and chunks as the number of frequency
+    points per chunk of a row (the whole row by default).
+    """
+    def __init__(self, fpath, write_options = None, mode = 'a'):
+        self.fpath = fpath
+        self.write_options = hdf_write_options(write_options) or {}
+        self.hdf = h5py.File(fpath, mode)
+        #the paths of the (row, ...) datasets, all kept at the number of rows
+        self._row_paths = []
+        def visit(name, item):
+            if isinstance(item, h5py.Dataset) and item.maxshape[0] is None:
+                self._row_paths.append(name)
+        self.hdf.visititems(visit)
+        #the sources archived, not to decode their column on each append
+        self._sources = set(self.sources)
+
+    def close(self):
+        self.hdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        try:
+            return len(self.hdf[INDEX]['gps_second'])
+        except KeyError:
+            return 0
+
+    @property
+    def gps_second(self):
+        try:
+            return self.hdf[INDEX]['gps_second'][()]
+        except KeyError:
+            return np.zeros(0)
+
+    @property
+    def sources(self):
+        try:
+            return [source.decode('utf-8') for source in self.hdf[INDEX]['source'][()]]
+        except KeyError:
+            return []
+
+    @property
+    def FHz(self):
+        return self.hdf['FHz'][()]
+
+    def keys(self):
+        """
+        The paths of the archived arrays, as tuples
+        """
+        return [
+            tuple(path.split('/')) for path in self._row_paths
+            if not path.startswith(INDEX + '/')
+        ]
+
+    def _row_dataset(self, path, value, n_rows, created = None):
+        """
+        The dataset at path for rows of value, created if needed with n_rows
+        rows of fill, and then its path added to the list created
+        """
+        try:
+            return self.hdf[path]
+        except KeyError:
+            pass
+        options = self.write_options
+        value = np.asarray(value)
+        kwargs = dict()
+        if value.ndim == 0:
+            #the index datasets
+            kwargs['chunks'] = True
+        elif value.dtype.kind in 'fc':
+            chunks = options.get('chunks', None)
+            if isinstance(chunks, int) and value.ndim > 0:
+                kwargs['chunks'] = (1,) + value.shape[:-1] + (max(1, min(chunks, value.shape[-1])),)
+            else:
+                kwargs['chunks'] = (1,) + value.shape
+            if options.get('compression', None) is not None:
+                kwargs['compression'] = options['compression']
+                if options.get('compression_opts', None) is not None:
+                    kwargs['compression_opts'] = options['compression_opts']
+            if options.get('shuffle', False):
+                kwargs['shuffle'] = True
+        dataset = self.hdf.create_dataset(
+            path,
+            shape     = (n_rows,) + value.shape,
+            maxshape  = (None,) + value.shape,
+            dtype     = value.dtype,
+            fillvalue = _fillvalue(value.dtype),
+            **kwargs
+        )
+        self._row_paths.append(path)
+        if created is not None:
+            created.append(path)
+        return dataset
+
+    def _resize(self, n_rows):
+        for path in self._row_paths:
+            dataset = self.hdf[path]
+            if dataset.shape[0] != n_rows:
+                dataset.resize(n_rows, axis = 0)
+
+    def _row_value(self, value):
+        value = np.asarray(value)
+        if value.dtype.kind == 'U':
+            value = value.astype(h5py.string_dtype())
+        elif value.ndim > 0 and self.write_options.get('float32', False):
+            #only the arrays, the single values of index/ keep their precision
+            #as for HDFDeepBunch, gps_second not being exact in float32
+            if value.dtype == np.float64:
+                value = value.astype(np.float32)
+            elif value.dtype == np.complex128:
+                value = value.astype(np.complex64)
+        return value
+
+    def append(self, fpath, verbose = False, **kwargs):
+        """
+        Append the measurement of the diaggui file fpath as a row, reading it
+        with dtt2bunch_iter(fpath, \\*\\*kwargs). Returns the row, or None if
+        the file, or one at the same GPS time, is already archived.
+
+        Raises ValueError if the file is not a spectrum or transfer function
+        measurement, or if its frequencies differ from those of the archive,
+        leaving the archive unchanged.
+        """
+        source = os.path.abspath(fpath)
+        if source in self._sources:
+            return None
+
+        n_rows = len(self)
+        row = n_rows
+        index = dict(source = source)
+        FHz = None
+        #the datasets of channels new to the archive, dropped with the row
+        created = []
+        kwargs.setdefault('lazy', True)
+        kwargs.setdefault('indexed', True)
+        try:
+            for path, value in dtt2bunch_iter(fpath, verbose = verbose, **kwargs):
+                if path == ('type',):
+                    if value[0] != 'spectra':
+                        raise ValueError("Only spectra can be archived, {0} holds {1}".format(fpath, value[0]))
+                elif path == ('gps_second',):
+                    #produced ahead of the arrays, so a copy of an archived
+                    #measurement is skipped before writing any
+                    if n_rows > 0 and np.any(self.gps_second == value[0]):
+                        return None
+                    index['gps_second'] = value[0]
+                elif path == ('FHz',):
+                    FHz = np.asarray(value[0])
+                elif path[0] == 'REFS' or isinstance(value, dict):
+                    continue
+                elif len(path) == 1:
+                    index[path[0]] = value[0]
+                else:
+                    value = self._row_value(value)
+                    dataset = self._row_dataset('/'.join(path), value, n_rows, created)
+                    if dataset.shape[1:] != value.shape:
+                        raise ValueError("{0} of {1} has shape {2}, the archive {3}".format(
+                            '/'.join(path), fpath, value.shape, dataset.shape[1:],
+                        ))
+                    if dataset.shape[0] <= row:
+                        dataset.resize(row + 1, axis = 0)
+                    dataset[row] = value
+                value = None
+
+            if FHz is None:
+                raise ValueError("{0} holds no frequencies".format(fpath))
+            if 'FHz' in self.hdf:
+                FHz_archive = self.hdf['FHz'][()]
+                if FHz_archive.shape != FHz.shape or not np.allclose(FHz_archive, FHz):
+                    raise ValueError("The frequencies of {0} differ from those of the archive".format(fpath))
+        except BaseException:
+            #drop the partial row and the datasets created for it
+            for path in created:
+                self._row_paths.remove(path)
+                del self.hdf[path]
+            self._resize(n_rows)
+            raise
+
+        if 'FHz' not in self.hdf:
+            self.hdf['FHz'] = FHz
+            self.hdf.attrs['type'] = 'spectra'
+        for name, value in index.items():
+            self._row_dataset(INDEX + '/' + name, self._row_value(value), n_rows)
+        self._resize(row + 1)
+        for name, value in index.items():
+            self.hdf[INDEX][name][row] = self._row_value(value)
+        self._sources.add(source)
+        self.hdf.flush()
+        return row
+
+    def rows(self, gps_start = None, gps_end = None):
+        """
+        The rows with gps_start <= gps_second < gps_end, as a slice when
+        they are contiguous, else as an array of row numbers
+        """
+        gps_second = self.gps_second
+        select = np.ones(len(gps_second), dtype = bool)
+        if gps_start is not None:
+            select &= gps_second >= gps_start
+        if gps_end is not None:
+            select &= gps_second < gps_end
+        rows = np.flatnonzero(select)
+        if len(rows) == 0:
+            return slice(0, 0)
+        if rows[-1] - rows[0] + 1 == len(rows):
+            return slice(rows[0], rows[-1] + 1)
+        return rows
+
+    def trend(self, *path, **kwargs):
+        """
+        trend('ASD', chn) or trend('XFER', chn_A, chn_B), with the
+        gps_start and gps_end keywords of rows. Returns the GPS times and the
+        (rows, F) array of the measurements, sorted by time.
+        """
+        rows = self.rows(**kwargs)
+        gps_second = self.gps_second[rows]
+        data = self.hdf['/'.join(path)][rows]
+        order = np.argsort(gps_second, kind = 'stable')
+        return gps_second[order], data[order]
@@ -3,7 +3,6 @@
 Requires h5py to interface
 """
 from __future__ import print_function
-from ..utilities.future_from_2 import repr_compat
 import h5py
 import numpy as np
 try:
@@ -11,10 +10,58 @@ try:
 except ImportError:
     from collections import Mapping as MappingABC
 
-
-from ..utilities.future_from_2 import str, unicode
-from ..utilities.unique import NOARG
-from ..utilities.interrupt_delay import DelayedKeyboardInterrupt
+from .deep_bunch import NOARG
+
+
+#the writer options of HDFDeepBunch and their defaults, which write as
+#hdf[key] = item does
+WRITE_OPTIONS = dict(
+    #True for chunks chosen by h5py, a shape, or a number of points along the
+    #last axis (the frequency or time axis of the dtt arrays) for each chunk
+    chunks           = None,
+    #'gzip' or 'lzf'
+    compression      = None,
+    #the gzip level
+    compression_opts = None,
+    shuffle          = False,
+    #store float64/complex128 arrays as float32/complex64, the precision of
+    #the dtt data, the single values keep theirs
+    float32          = False,
+    #store the single values (such as gps_second, averages or BW) as attributes
+    #of their group rather than as datasets
+    scalar_attrs     = False,
+)
+
+
+def hdf_write_options(write_options = None):
+    if not write_options:
+        return None
+    unknown = set(write_options) - set(WRITE_OPTIONS)
+    if unknown:
+        raise TypeError("Unknown HDF write options: {0}".format(sorted(unknown)))
+    options = dict(WRITE_OPTIONS)
+    options.update(write_options)
+    if options == WRITE_OPTIONS:
+        return None
+    return options
+
+
+def hdf_chunks(chunks, shape):
+    if chunks is None or chunks is True:
+        return chunks
+    if isinstance(chunks, int):
+        return tuple([1] * (len(shape) - 1) + [max(1, min(chunks, shape[-1]))])
+    return tuple(min(chunk, dim) for chunk, dim in zip(chunks, shape))
+
+
+def hdf_keys(hdf):
+    """
+    The keys of the datasets and groups of hdf followed by those of its
+    attributes, which hold the single values written with scalar_attrs
+    """
+    keys = list(hdf.keys())
+    keys.extend(hdf.attrs.keys())
+    return keys
 
 
 def hdf_group_is(item):
@@ -36,18 +83,74 @@ def hdf_assert_grouplike(hdf):
     return
 
 
+class HDFDatasetProxy(object):
+    """
+    Handle to an HDF dataset read only as far as it is indexed, returned by
+    HDFDeepBunch in lazy mode. Indexing reads the hyperslab asked for, and
+    np.asarray() reads the whole dataset.
+    """
+    __slots__ = ('dataset',)
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    @property
+    def shape(self):
+        return self.dataset.shape
+
+    @property
+    def dtype(self):
+        return self.dataset.dtype
+
+    @property
+    def ndim(self):
+        return self.dataset.ndim
+
+    @property
+    def size(self):
+        return self.dataset.size
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, key):
+        return self.dataset[key]
+
+    def __array__(self, dtype = None, copy = None):
+        arr = self.dataset[()]
+        if dtype is not None:
+            arr = arr.astype(dtype, copy = False)
+        return arr
+
+    def read(self):
+        return self.dataset[()]
+
+    def __repr__(self):
+        return '{0}({1})'.format(self.__class__.__name__, self.dataset)
+
+
 class HDFDeepBunch(object):
     """
     """
-    __slots__ = ('_hdf', '_vpath', '_overwrite')
+    __slots__ = ('_hdf', '_vpath', '_overwrite', '_write_options', '_lazy', '_groups')
 
     def __init__(
         self,
         hdf = None,
         writeable = False,
         overwrite = False,
+        write_options = None,
+        lazy      = False,
         _vpath    = None,
+        _groups   = None,
     ):
+        """
+        write_options is a dict of the options in WRITE_OPTIONS, setting the
+        layout of the datasets written.
+
+        With lazy, the array datasets are returned as HDFDatasetProxy, reading
+        only the parts indexed, rather than read whole.
+        """
         if isinstance(hdf, str):
             if writeable:
                 hdf = h5py.File(hdf, 'a')
@@ -74,6 +177,13 @@ class HDFDeepBunch(object):
         #access through super is necessary because of the override on __setattr__ can't see these slots
         super(HDFDeepBunch, self).__setattr__('_hdf', hdf)
         super(HDFDeepBunch, self).__setattr__('_overwrite', overwrite)
+        super(HDFDeepBunch, self).__setattr__('_write_options', hdf_write_options(write_options))
+        super(HDFDeepBunch, self).__setattr__('_lazy', lazy)
+        #the (parent, group) handles looked up, by (id of the parent, name), shared
+        #with the sub-bunches so that paths are walked once
+        if _groups is None:
+            _groups = dict()
+        super(HDFDeepBunch, self).__setattr__('_groups', _groups)
 
         if _vpath is True:
             _vpath = ()
@@ -83,6 +193,37 @@ class HDFDeepBunch(object):
         super(HDFDeepBunch, self).__setattr__('_vpath', _vpath)
         return
 
+    def _child(self, hdf, _vpath, overwrite = None):
+        if overwrite is None:
+            overwrite = self._overwrite
+        return self.__class__(
+            hdf           = hdf,
+            _vpath        = _vpath,
+            overwrite     = overwrite,
+            write_options = self._write_options,
+            lazy          = self._lazy,
+            _groups       = self._groups,
+        )
+
+    def _lookup(self, hdf, key):
+        """
+        hdf[key], through the cache of the group handles
+        """
+        cached = self._groups.get((id(hdf), key), None)
+        #the parent is kept with the handle so its id can't be reused
+        if cached is not None and cached[0] is hdf:
+            return cached[1]
+        item = hdf[key]
+        if hdf_group_is(item):
+            self._groups[(id(hdf), key)] = (hdf, item)
+        return item
+
+    def _forget_groups(self):
+        """
+        Drop the cached group handles, after deletions
+        """
+        self._groups.clear()
+
     def _resolve_hdf(self):
         """
         Returns the hdf object stored at the currently-referenced group.
@@ -94,7 +235,7 @@ class HDFDeepBunch(object):
             hdf = self._hdf
             for idx in range(len(self._vpath)):
                 gname = self._vpath[idx]
-                hdf = hdf[gname]
+                hdf = self._lookup(hdf, gname)
                 hdf_assert_grouplike(hdf)
         except KeyError:
             if idx != 0:
@@ -111,19 +252,11 @@ class HDFDeepBunch(object):
 
     @property
     def overwrite(self):
-        return self.__class__(
-            hdf       = self._hdf,
-            _vpath    = self._vpath,
-            overwrite = True,
-        )
+        return self._child(self._hdf, self._vpath, overwrite = True)
 
     @property
     def safewrite(self):
-        return self.__class__(
-            hdf       = self._hdf,
-            _vpath    = self._vpath,
-            overwrite = False,
-        )
+        return self._child(self._hdf, self._vpath, overwrite = False)
 
     def _require_hdf(self):
         if not self._vpath:
@@ -142,36 +275,38 @@ class HDFDeepBunch(object):
             #TODO, better error message when _vpath is False
             if self._vpath is False:
                 raise RuntimeError("HDFDeepBunch not set up for virtual paths, groups must exist in the file to access using __getitem__ / '[]'")
-            return self.__class__(
-                hdf       = self._hdf,
-                _vpath    = self._vpath + (key,),
-                overwrite = self._overwrite,
-            )
+            return self._child(self._hdf, self._vpath + (key,))
         try:
-            item = hdf[key]
+            item = self._lookup(hdf, key)
             if hdf_group_is(item):
-                return self.__class__(
-                    hdf       = item,
-                    _vpath    = self._vpath,
-                    overwrite = self._overwrite,
-                )
+                return self._child(item, self._vpath)
             elif isinstance(item, (h5py.Dataset)):
+                if self._lazy and item.shape != ():
+                    return HDFDatasetProxy(item)
                 arr = np.asarray(item)
                 if item.dtype.kind == 'V':
                     return arr
                 if arr.shape == ():
-                    return arr.item()
+                    item = arr.item()
+                    if item in ('<none>', b'<none>'):
+                        return None
+                    return item
                 return arr
             if item == '<none>':
                 return None
             return item
         except KeyError as E:
+            if key in hdf.attrs:
+                #a single value written with scalar_attrs
+                arr = np.asarray(hdf.attrs[key])
+                if arr.shape == ():
+                    item = arr.item()
+                    if item == '<none>':
+                        return None
+                    return item
+                return arr
             if self._vpath is not False:
-                return self.__class__(
-                    hdf       = self._hdf,
-                    _vpath    = self._vpath + (key,),
-                    overwrite = self._overwrite,
-                )
+                return self._child(self._hdf, self._vpath + (key,))
             if str(E).lower().find('object not found') != -1:
                 raise KeyError("key '{0}' not found in {1}".format(key, self))
             raise
@@ -182,13 +317,50 @@ class HDFDeepBunch(object):
         except KeyError:
             raise AttributeError("'{1}' not in {0}".format(self, key))
 
+    def _write(self, hdf, key, item):
+        options = self._write_options
+        if options is None:
+            hdf[key] = item
+            return
+        arr = np.asarray(item)
+        if arr.dtype.kind == 'U':
+            arr = arr.astype(h5py.string_dtype())
+        if arr.size <= 1 and arr.dtype.kind != 'V':
+            if options['scalar_attrs']:
+                if key in hdf.attrs and not self._overwrite:
+                    raise ValueError("Unable to create attribute (name already exists)")
+                hdf.attrs[key] = arr
+                return
+            hdf[key] = arr
+            return
+        kwargs = dict()
+        if arr.dtype.kind in 'biufc':
+            if options['float32']:
+                if arr.dtype == np.float64:
+                    arr = arr.astype(np.float32)
+                elif arr.dtype == np.complex128:
+                    arr = arr.astype(np.complex64)
+            chunks = hdf_chunks(options['chunks'], arr.shape)
+            if chunks is not None:
+                kwargs['chunks'] = chunks
+            if options['compression'] is not None:
+                kwargs['compression'] = options['compression']
+                if options['compression_opts'] is not None:
+                    kwargs['compression_opts'] = options['compression_opts']
+            if options['shuffle']:
+                kwargs['shuffle'] = True
+        hdf.create_dataset(key, data = arr, **kwargs)
+        return
+
     def __setitem__(self, key, item):
         hdf = self._require_hdf()
+        if isinstance(item, np.ndarray) and item.dtype.kind == 'U':
+            #such as the arrays of channel names, hdf has no fixed width unicode
+            item = item.astype(h5py.string_dtype())
+        if item is None:
+            item = '<none>'
         try:
-            if item is None:
-                hdf[key] = '<none>'
-            else:
-                hdf[key] = item
+            self._write(hdf, key, item)
             return
         except TypeError:
             #print((item, type(item)))
@@ -196,7 +368,8 @@ class HDFDeepBunch(object):
         except (RuntimeError, ValueError) as E:
             if str(E).lower().find('name already exists') != -1 and self._overwrite:
                 del hdf[key]
-                hdf[key] = item
+                self._forget_groups()
+                self._write(hdf, key, item)
             else:
                 raise TypeError("Can't insert {0} into {1} at key {2} error: {3}".format(item, hdf, key, E))
 
@@ -240,6 +413,7 @@ class HDFDeepBunch(object):
                         raise RuntimeError("Won't Overwrite groups")
                     else:
                         del refhdf[key]
+                        self._forget_groups()
                 else:
                     if not self._overwrite:
                         raise RuntimeError("Won't Overwrite data")
@@ -284,15 +458,38 @@ class HDFDeepBunch(object):
                     apply_hdf(subref, key, value)
                 else:
                     subref[key] = value
-        with DelayedKeyboardInterrupt():
-            recursive_action(self, data_dict)
+        recursive_action(self, data_dict)
+        return
+
+    def update_items(self, items):
+        """
+        Write the (path, value) items of an iterable, path being the tuple of
+        keys of value, as they are produced and without holding on to them,
+        such as those of dtt2bunch_iter. Mapping values are written with
+        update_recursive, and as there, empty ones make no group.
+        """
+        self._require_hdf()
+        for path, value in items:
+            subref = self
+            for key in path[:-1]:
+                subref = subref[key]
+            if isinstance(value, MappingABC):
+                if len(value) > 0:
+                    subref[path[-1]].update_recursive(value)
+            else:
+                subref[path[-1]] = value
+            value = None
         return
 
     def __delitem__(self, key):
         hdf = self._resolve_hdf()
         if hdf is None:
             return
+        if key not in hdf and key in hdf.attrs:
+            del hdf.attrs[key]
+            return
         del self._hdf[key]
+        self._forget_groups()
 
     def __delattr__(self, key):
         return self.__delitem__(key)
@@ -316,13 +513,10 @@ class HDFDeepBunch(object):
         hdf = self._resolve_hdf()
         if hdf is None:
             return False
-        return key in hdf
+        return key in hdf or key in hdf.attrs
 
     def has_key(self, key):
-        hdf = self._resolve_hdf()
-        if hdf is None:
-            return False
-        return key in hdf
+        return key in self
 
     def require_deleted(self, key):
         hdf = self._resolve_hdf()
@@ -330,6 +524,11 @@ class HDFDeepBunch(object):
             return
         try:
             del self._hdf[key]
+            self._forget_groups()
+        except KeyError:
+            pass
+        try:
+            del hdf.attrs[key]
         except KeyError:
             pass
         return
@@ -341,13 +540,12 @@ class HDFDeepBunch(object):
         return cls(item)
 
     def __dir__(self):
-        items = list(k for k in self._hdf.keys() if isinstance(k, (str, unicode)))
+        items = list(k for k in hdf_keys(self._hdf) if isinstance(k, str))
         items += ['overwrite', 'safewrite', 'hdf']
         #items.sort()
         #items += dir(super(Bunch, self))
         return items
 
-    @repr_compat
     def __repr__(self):
         return (
             '{0}({1}, overwrite={2}, vpath={3})'
@@ -362,13 +560,13 @@ class HDFDeepBunch(object):
         hdf = self._resolve_hdf()
         if hdf is None:
             return iter(())
-        return iter(hdf)
+        return iter(hdf_keys(hdf))
 
     def __len__(self):
         hdf = self._resolve_hdf()
         if hdf is None:
             return 0
-        return len(hdf)
+        return len(hdf) + len(hdf.attrs)
 
     def clear(self):
         hdf = self._resolve_hdf()
@@ -376,19 +574,21 @@ class HDFDeepBunch(object):
             return
         for key in list(hdf.keys()):
             del hdf[key]
+        hdf.attrs.clear()
+        self._forget_groups()
         return
 
     def keys(self):
         hdf = self._resolve_hdf()
         if hdf is None:
             return iter(())
-        return iter(list(hdf.keys()))
+        return iter(hdf_keys(hdf))
 
     def values(self):
         hdf = self._resolve_hdf()
         if hdf is None:
             return
-        for key in list(hdf.keys()):
+        for key in hdf_keys(hdf):
             yield self[key]
         return
 
@@ -396,7 +596,7 @@ class HDFDeepBunch(object):
         hdf = self._resolve_hdf()
         if hdf is None:
             return
-        for key in list(hdf.keys()):
+        for key in hdf_keys(hdf):
             yield key, self[key]
         return
 
@@ -0,0 +1,122 @@
+"""
+Thread-safe least recently used cache with a byte budget and stamps for
+invalidation, used to keep DiagAccess objects across opens of the same file.
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Maps keys to (stamp, value, nbytes). A lookup with a stamp differing from
+    the stored one, such as the size and mtime of a file that changed since,
+    drops the entry. Entries are evicted least recently used first once their
+    nbytes add up to more than max_bytes (or their count to max_entries).
+    """
+    def __init__(self, max_bytes = 2**29, max_entries = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, stamp = None):
+        """
+        Return the value of key if cached with the same stamp, else None
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != stamp:
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, stamp = None, nbytes = 0):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                #would only evict everything else and then itself
+                return
+            self._entries[key] = (stamp, value, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+        return
+
+    def resize(self, key, nbytes):
+        """
+        Set the nbytes of a cached entry, for values which grow or shrink
+        once cached, evicting entries to fit the budget
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                self._remove(key)
+                self.evictions += 1
+                return
+            self._entries[key] = (entry[0], entry[1], nbytes)
+            self.nbytes += nbytes - entry[2]
+            self._evict()
+        return
+
+    def _remove(self, key):
+        stamp, value, nbytes = self._entries.pop(key)
+        self.nbytes -= nbytes
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_bytes is not None and self.nbytes > self.max_bytes)
+            or (self.max_entries is not None and len(self._entries) > self.max_entries)
+        ):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def configure(self, max_bytes = None, max_entries = None):
+        """
+        Change the budget, evicting entries to fit it
+        """
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if max_entries is not None:
+                self.max_entries = max_entries
+            self._evict()
+        return
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+        return
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                hits          = self.hits,
+                misses        = self.misses,
+                evictions     = self.evictions,
+                invalidations = self.invalidations,
+                entries       = len(self._entries),
+                nbytes        = self.nbytes,
+                max_bytes     = self.max_bytes,
+            )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
@@ -0,0 +1,124 @@
+"""
+Reading of many diaggui files over a pool of processes.
+
+Each worker parses its file with dtt_read and pickles the result with
+protocol 5, which hands the buffers of the decoded arrays out of band. These
+are packed into one shared memory block, so that only the small pickle of the
+metadata goes through the pool's pipe. The parent copies the block out once
+and the arrays are rebuilt as views into that copy, and unlinks every block
+handed back, whether or not it could be read.
+
+multiprocessing.shared_memory needs Python 3.8, and is only imported when
+reading over a pool.
+"""
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from .parse import dtt_read
+
+#alignment of the array buffers packed into the shared block
+_ALIGN = 64
+
+
+def _pack_shared(items):
+    from multiprocessing import shared_memory, resource_tracker
+    buffers = []
+    payload = pickle.dumps(items, protocol = 5, buffer_callback = buffers.append)
+    raws = [buff.raw() for buff in buffers]
+    spans = []
+    pos = 0
+    for raw in raws:
+        pos = -(-pos // _ALIGN) * _ALIGN
+        spans.append((pos, pos + raw.nbytes))
+        pos += raw.nbytes
+    if pos == 0:
+        return payload, None, spans
+    shm = shared_memory.SharedMemory(create = True, size = pos)
+    #the parent attaching the block tracks and unlinks it
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    try:
+        for raw, (start, end) in zip(raws, spans):
+            shm.buf[start:end] = raw
+        name = shm.name
+    finally:
+        shm.close()
+    return payload, name, spans
+
+
+def _unlink_shared(name):
+    from multiprocessing import shared_memory
+    try:
+        shm = shared_memory.SharedMemory(name = name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _unpack_shared(payload, name, spans):
+    from multiprocessing import shared_memory
+    if name is None:
+        return pickle.loads(payload, buffers = [b''] * len(spans))
+    shm = shared_memory.SharedMemory(name = name)
+    try:
+        blob = memoryview(bytearray(shm.buf[:spans[-1][1]]))
+    finally:
+        shm.close()
+        shm.unlink()
+    return pickle.loads(payload, buffers = [blob[start:end] for start, end in spans])
+
+
+def _read_worker(path, kwargs):
+    try:
+        return _pack_shared(dtt_read(path, **kwargs))
+    except Exception as E:
+        return E
+
+
+def dtt_read_many(paths, workers = None, **kwargs):
+    """
+    Read each of the paths with dtt_read(path, \\*\\*kwargs), spread over a
+    pool of workers processes (os.cpu_count() by default, 0 or 1 to read in
+    this process).
+
+    Returns a list in the order of paths. The slot of a file that failed to
+    read holds the exception raised for it rather than aborting the batch.
+    """
+    paths = list(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(paths))
+
+    if workers <= 1:
+        results = []
+        for path in paths:
+            try:
+                results.append(dtt_read(path, **kwargs))
+            except Exception as E:
+                results.append(E)
+        return results
+
+    results = []
+    futures = []
+    try:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            futures.extend(executor.submit(_read_worker, path, kwargs) for path in paths)
+            for future in futures:
+                try:
+                    packed = future.result()
+                    if not isinstance(packed, Exception):
+                        packed = _unpack_shared(*packed)
+                except Exception as E:
+                    packed = E
+                results.append(packed)
+    finally:
+        #no process tracks the blocks, so those not unpacked, as on an error
+        #or an interrupt, are unlinked here. Those unpacked are already gone.
+        for future in futures:
+            if not future.done() or future.cancelled() or future.exception() is not None:
+                continue
+            packed = future.result()
+            if not isinstance(packed, Exception) and packed[1] is not None:
+                _unlink_shared(packed[1])
+    return results
@@ -1,14 +1,19 @@
 """
 """
-import xml.etree.cElementTree as etree
 import numpy as np
+import copy
 import re
+import warnings
 
 from .bunch import Bunch
 from .parse_transfer import parse_transfer
 from .parse_spectrum import parse_spectrum
 from .parse_timeseries import parse_timeseries
 from .parse_coefficients import parse_coefficients
+from .parse_index import parse_index, entry_node_name
+from .sections import SectionIndex
+from .backends import get_backend, node_needed
+from .axes import AxisInterner
 
 
 def coherence_TF_numerator_SNR(coherence, N_averages = None, rejection_ratio = 1.5):
@@ -36,86 +41,217 @@ def entry_type_num(text):
     return elines[0]
 
 
-def dtt_read(diag_file):
-    references = {}
+def _parse_result_node(xml_node, lazy = False, axes = None):
+    typename = xml_node.attrib['Type']
+    if typename == "TransferFunction":
+        return parse_transfer(xml_node, lazy = lazy, axes = axes)
+    elif typename == "Spectrum":
+        return parse_spectrum(xml_node, lazy = lazy, axes = axes)
+    elif typename == "TimeSeries":
+        return parse_timeseries(xml_node, lazy = lazy)
+    return None
+
+
+def _result_selected(ref, channels, types):
+    """
+    Check the metadata of a parsed result against the dtt_read filters
+    """
+    type_name = ref.get('type_name', None)
+    if types is not None and type_name not in types:
+        return False
+    if channels is None:
+        return True
+    if type_name == 'TS':
+        return ref.channel in channels
+    if ref.channelA not in channels:
+        return False
+    channelB_inv = ref.get('channelB_inv', None)
+    if not channelB_inv:
+        return True
+    for chn in channelB_inv:
+        if chn in channels:
+            return True
+    return False
+
+
+def dtt_read(
+    diag_file,
+    streaming  = False,
+    lazy       = False,
+    channels   = None,
+    types      = None,
+    references = True,
+    indexed    = False,
+    backend    = None,
+):
+    """
+    Read a diaggui xml file into a Bunch with "references" and "results".
+
+    If streaming is True, the file is read with iterparse and each top-level
+    LIGO_LW node (Index, Reference[n], Result[n]) is parsed and discarded as
+    soon as it closes, bounding the memory to about one node plus the decoded
+    arrays. The result is identical to the default full-tree parse.
+
+    If lazy is True, only the Param/Time metadata of each result is read. The
+    Array/Stream payload is kept as a deferred handle and is decoded into the
+    data fields (PSD, CSD, xfer, coherence, timeseries, FHz when stored in the
+    stream, ...) on their first access, then cached.
+
+    channels, types and references filter the results before any of their
+    data is decoded. With channels given, a result is kept only if its
+    ChannelA (or Channel) is listed and, if it has B channels, at least one of
+    them is too. types is a collection of type names such as 'TF', 'COH',
+    'PSD', 'CSD', 'TS' or coefficient entry types. references = False skips
+    the Reference[n] nodes entirely.
+
+    The returned Bunch also carries the parsed "index" (see
+    parse_index.parse_index, None if the file has no Index) and "by_name", a
+    table of the parsed results and references by the name of their node.
+
+    indexed may be True, 'sidecar' or a sections.SectionIndex of the file.
+    The blocks are then located by a byte-offset index (persisted next to the
+    file for 'sidecar') and parsed without their payloads, which are read
+    from the file only when decoded, combining well with lazy = True.
+
+    backend selects the xml parser, 'lxml', 'etree' or 'expat' (see
+    backends.get_backend). It defaults to the DTTXML_BACKEND environment
+    variable, else to lxml when it is installed. The indexed reads always use
+    the standard library etree on the blocks.
+    """
+    if channels is not None:
+        channels = set(channels)
+    if types is not None:
+        types = set(types)
+    #results are parsed lazily so that rejected ones are never decoded
+    filtering = channels is not None or types is not None
+    parse_lazy = lazy or filtering
+
+    #the frequency axes shared by the results of the file
+    axes = AxisInterner()
+
+    def parse_result_node(xml_node):
+        ref = _parse_result_node(xml_node, lazy = parse_lazy, axes = axes)
+        if ref is None:
+            return None
+        if filtering and not _result_selected(ref, channels, types):
+            return False
+        if parse_lazy and not lazy:
+            ref.resolve()
+        return ref
+
+    refs = {}
     results = {}
+    #the parsed results and references by the name of their node
+    by_name = {}
+    index = None
 
-    diag_tree = etree.parse(diag_file)
-    entries = {}
-
-    for xml_node in diag_tree.getroot():
-        if xml_node.attrib['Name'] == 'Index':
-            for subentry in xml_node:
-                match_ref = re.match(r'Entry\[(\d+)\]', subentry.attrib['Name'])
-                if match_ref:
-                    ref_num = int(match_ref.group(1))
-                    entries[ref_num] = subentry.text
-
-    for entry_text in entries.values():
-        entry_type, entry_num = entry_type_num(entry_text)
-        if entry_type in (
-            'TransferCoefficients',
-            'HarmonicCoefficients',
-            'IntermodulationCoefficients',
-            'CoherenceCoefficients',
-            #'TransferMatrix,
-        ):
-            entry_parse = re.search(r'Name\s+=\s+(\w+.*);', entry_text)
-            entry_node_name = entry_parse.group(1)
-            for xml_node in diag_tree.getroot().findall('LIGO_LW'):
-                if xml_node.attrib['Name'] == entry_node_name:
-                    break
-            else:
-                print("WARNING XML is funky!")
-            measurement = parse_coefficients(
-                LW_node = xml_node,
-                entry_type = entry_type,
-                entry_num = entry_num,
-                entry_text = entry_text,
-            )
-            old = results.setdefault(entry_type, measurement)
-            assert(old == measurement)
-
-    for xml_node in diag_tree.getroot():
-        match_ref = re.match(r'Reference\[(\d+)\]', xml_node.attrib['Name'])
-        if match_ref:
+    #coefficient entries from the Index, keyed by the name of the node holding their data
+    coefficient_entries = {}
+    #Result nodes of unknown type seen before the Index, which may be named by it
+    pending = []
+    index_seen = False
+
+    def parse_coefficient_node(xml_node, entry_type, entry_num, entry_text):
+        if types is not None and entry_type not in types:
+            return
+        measurement = parse_coefficients(
+            LW_node = xml_node,
+            entry_type = entry_type,
+            entry_num = entry_num,
+            entry_text = entry_text,
+            lazy = lazy,
+        )
+        old = results.setdefault(entry_type, measurement)
+        assert(old == measurement)
+        by_name[xml_node.attrib['Name']] = measurement
+
+    if indexed is not False and indexed is not None:
+        if not isinstance(indexed, SectionIndex):
+            indexed = SectionIndex.open(diag_file, sidecar = (indexed == 'sidecar'))
+
+        xml_nodes = indexed.iter_nodes(
+            select = lambda section: node_needed(section['name'], references)
+        )
+    else:
+        xml_nodes = get_backend(backend).iter_nodes(
+            diag_file,
+            streaming = streaming,
+            select = lambda name: node_needed(name, references),
+        )
+
+    for xml_node in xml_nodes:
+        node_name = xml_node.attrib['Name']
+        if node_name == 'Index':
+            index = parse_index(xml_node)
+            for entry in index.entries:
+                if entry.entry_type in (
+                    'TransferCoefficients',
+                    'HarmonicCoefficients',
+                    'IntermodulationCoefficients',
+                    'CoherenceCoefficients',
+                    #'TransferMatrix,
+                ):
+                    node_name_entry = entry_node_name(entry)
+                    if node_name_entry is None:
+                        warnings.warn("The Index entry {0} names no node".format(
+                            entry.text.splitlines()[0].strip()
+                        ))
+                        continue
+                    coefficient_entries[node_name_entry] = (
+                        entry.entry_type,
+                        entry.entry_num,
+                        entry.text,
+                    )
+            index_seen = True
+
+            for pending_node in pending:
+                entry = coefficient_entries.pop(pending_node.attrib['Name'], None)
+                if entry is not None:
+                    parse_coefficient_node(pending_node, *entry)
+            pending = []
+            continue
+
+        entry = coefficient_entries.pop(node_name, None)
+        if entry is not None:
+            parse_coefficient_node(xml_node, *entry)
+
+        match_ref = re.match(r'Reference\[(\d+)\]', node_name)
+        if match_ref and references:
             ref_num = int(match_ref.group(1))
-            typename = xml_node.attrib['Type']
-            if typename == "TransferFunction":
-                ref = parse_transfer(xml_node)
-                references[ref_num] = ref
-            elif typename == "Spectrum":
-                ref = parse_spectrum(xml_node)
-                references[ref_num] = ref
-            elif typename == "TimeSeries":
-                ref = parse_timeseries(xml_node)
-                references[ref_num] = ref
-        match_ref = re.match(r'Result\[(\d+)\]', xml_node.attrib['Name'])
+            ref = parse_result_node(xml_node)
+            if ref:
+                refs[ref_num] = ref
+                by_name[node_name] = ref
+        match_ref = re.match(r'Result\[(\d+)\]', node_name)
         if match_ref:
-            ref_num = int(match_ref.group(1))
-            typename = xml_node.attrib['Type']
-            ref = None
-            if typename == "TransferFunction":
-                ref = parse_transfer(xml_node)
-            elif typename == "Spectrum":
-                ref = parse_spectrum(xml_node)
-            elif typename == "TimeSeries":
-                ref = parse_timeseries(xml_node)
-            if ref is not None:
-                try:
-                    if ref.type_name in ('COH', 'STF', 'TF', 'PSD', 'FFT', 'CSD'):
-                        results.setdefault(ref.type_name, {})[ref.channelA] = ref
-                    elif ref.type_name in ('TS',):
-                        results.setdefault(ref.type_name, {})[ref.channel] = ref
-                    else:
-                        #Check that these routines aren't returning something unaccounted-for
-                        assert(False)
-                except KeyError:
-                    continue
+            ref = parse_result_node(xml_node)
+            if ref is False:
+                continue
+            if ref is None:
+                if not index_seen and entry is None:
+                    #keep it in case the Index names it as a coefficient node
+                    pending.append(copy.deepcopy(xml_node))
+                continue
+            by_name[node_name] = ref
+            try:
+                if ref.type_name in ('COH', 'STF', 'TF', 'PSD', 'FFT', 'CSD'):
+                    results.setdefault(ref.type_name, {})[ref.channelA] = ref
+                elif ref.type_name in ('TS',):
+                    results.setdefault(ref.type_name, {})[ref.channel] = ref
+                else:
+                    #Check that these routines aren't returning something unaccounted-for
+                    assert(False)
+            except KeyError:
+                continue
+
+    if coefficient_entries:
+        warnings.warn("The Index names coefficient nodes missing from the file: {0}".format(
+            ', '.join(sorted(coefficient_entries))
+        ))
 
     Items = Bunch()
-    Items.references = Bunch(references)
+    Items.references = Bunch(refs)
     Items.results = Bunch(results)
+    Items.index = index
+    Items.by_name = by_name
     return Items
-
-
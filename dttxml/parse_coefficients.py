@@ -1,75 +1,40 @@
 """
 """
 
-import base64
 import numpy as np
-from .bunch import Bunch
-import re
+from .records import CoefficientRecord
+from .parse_params import decode_params, COEFFICIENT_PARAMS
+from .stream import DeferredStream
+
+
+def _coefficient_arrays(data, dims, real_coeffs):
+    data = data.reshape(*dims)
+    coeffs = data[:, 1:]
+    if real_coeffs:
+        coeffs = np.real(coeffs)
+    return {
+        'data_raw' : data,
+        'FHz'      : np.real(data[:, 0]),
+        'coeffs'   : coeffs,
+    }
 
 
 def parse_coefficients(
     LW_node,
     entry_type = None,
     entry_num = None,
-    entry_text = None
+    entry_text = None,
+    lazy = False,
 ):
     if entry_type == 'TransferMatrix':
         return None
-    specbunch = Bunch()
+    specbunch = CoefficientRecord()
     specbunch.channelA = {}
     specbunch.channelB = {}
     specbunch.channels = {}
 
-    for sparam in LW_node.findall('Time'):
-        if sparam.attrib["Name"] == 't0':
-            specbunch.gps_second = float(sparam.text)
-    for sparam in LW_node.findall('Param'):
-        spname = sparam.attrib["Name"]
-        if spname == 'Subtype':
-            specbunch.subtype_raw = int(sparam.text)
-        elif spname == 'Window':
-            specbunch.window_raw = int(sparam.text)
-            specbunch.window = {
-                0 : 'uniform',
-                1 : 'hanning',
-                2 : 'flat-top',
-                3 : 'welch',
-                4 : 'bartlett',
-                5 : 'bmh',
-                6 : 'hamming',
-                7 : 'kaiser',
-            }.get(specbunch.window_raw, "unknown")
-        elif spname == 'AverageType':
-            specbunch.avgtype_raw = int(sparam.text)
-            specbunch.avgtype = {
-                0 : 'Fixed',
-                1 : 'Exponential',
-                2 : 'Single',
-            }.get(specbunch.avgtype_raw, "unknown")
-        elif spname == 'Averages':
-            specbunch.averages = int(sparam.text)
-        elif spname == 'BW':
-            specbunch.BW = float(sparam.text)
-        elif spname == 'M':
-            specbunch.M = int(sparam.text)
-        elif spname == 'N':
-            specbunch.N = int(sparam.text)
-        elif spname == 'f0':
-            specbunch.f0 = float(sparam.text)
-        elif spname == 'df':
-            specbunch.df = float(sparam.text)
-        elif spname.startswith('ChannelA'):
-            RefNMatch = re.match(r'ChannelA\[(\d+)\]', spname)
-            chn_num = int(RefNMatch.group(1))
-            specbunch.channelA[chn_num] = sparam.text
-            specbunch.channels[chn_num] = sparam.text
-        elif spname.startswith('ChannelB'):
-            RefNMatch = re.match(r'ChannelB\[(\d+)\]', spname)
-            chn_num = int(RefNMatch.group(1))
-            specbunch.channelB[chn_num] = sparam.text
-            specbunch.channels[chn_num] = sparam.text
-        else:
-            pass
+    params = decode_params(LW_node, COEFFICIENT_PARAMS)
+    specbunch.update(params)
 
     chn_dict = specbunch.setdefault('channelA', {})
     specbunch.channelA_inv = {}
@@ -90,20 +55,23 @@ def parse_coefficients(
     ##Now interpret the data
     array_node = LW_node.findall('Array')[0]
     dims = [int(d.text) for d in array_node.findall('Dim')]
-    streambuff = base64.b64decode(array_node.findall('Stream')[0].text)
     stream_type = array_node.attrib['Type']
     if stream_type == 'float':
-        data = np.frombuffer(streambuff, dtype='f4')
+        dtype = 'f4'
     elif stream_type == 'floatComplex':
-        data = np.frombuffer(streambuff, dtype='c8')
-    data = data.reshape(*dims)
-
-    specbunch.data_raw = data
-    specbunch.FHz = np.real(data[:, 0])
-    specbunch.coeffs = data[:, 1:]
+        dtype = 'c8'
 
-    if entry_type == 'CoherenceCoefficients':
-        specbunch.coeffs = np.real(specbunch.coeffs)
+    stream = DeferredStream.from_node(
+        array_node.findall('Stream')[0],
+        _coefficient_arrays,
+        (dims, entry_type == 'CoherenceCoefficients'),
+        dtype = dtype,
+        count = int(np.prod(dims)),
+    )
+    if lazy:
+        specbunch.defer(('data_raw', 'FHz', 'coeffs'), stream)
+    else:
+        specbunch.update(stream())
 
     #specbunch.FHz = data[:N].real
     if specbunch.subtype_raw == 0:
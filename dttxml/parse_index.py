@@ -0,0 +1,127 @@
+"""
+"""
+import re
+
+from .bunch import Bunch
+
+_ENTRY_NAME_RE = re.compile(r'Entry\[(\d+)\]')
+_ENTRY_HEAD_RE = re.compile(r'(\w+)(?:\[(\d+)\])?')
+_ENTRY_LINE_RE = re.compile(r'(\w+)((?:\[\d+\])*)\s*=\s*([^;]*);')
+_INDICES_RE = re.compile(r'\[(\d+)\]')
+
+#map of the Index entry types to the type_name of the results they name
+ENTRY_TYPE_NAMES = {
+    'TransferFunction'  : 'TF',
+    'CoherenceFunction' : 'COH',
+    'PowerSpectrum'     : 'PSD',
+    'CrossCorrelation'  : 'CSD',
+    'Coherence'         : 'COH',
+    'TimeSeries'        : 'TS',
+}
+
+
+def parse_index_entry(text):
+    """
+    Parse the text of one Index entry, e.g.
+
+        TransferFunction[0]:
+          ChannelA[0] = H1:LSC-DARM1_EXC;
+          ChannelB[0] = H1:LSC-DARM1_EXC;
+          Name[0][0] = Result[0];
+          Offset[0][0] = 46;
+          Length[0][0] = 46;
+
+    into a Bunch of the entry_type, entry_num (string or None), the text and
+    one dict per key (channelA, channelB, channel, name, offset, length, ...),
+    itself keyed by the tuple of bracketed indices of each line.
+    """
+    lines = text.splitlines()
+    head = _ENTRY_HEAD_RE.match(lines[0].strip())
+    entry = Bunch()
+    entry.entry_type = head.group(1)
+    entry.entry_num = head.group(2)
+    entry.text = text
+    fields = dict()
+    for key, indices, value in _ENTRY_LINE_RE.findall(text):
+        indices = tuple(int(idx) for idx in _INDICES_RE.findall(indices))
+        fields.setdefault(key[0].lower() + key[1:], {})[indices] = value.strip()
+    entry.update(fields)
+    return entry
+
+
+def entry_node_name(entry):
+    """
+    The name of the node holding the data of an entry naming a single node,
+    such as the coefficient entries, from its own Name line: the un-numbered
+    one, else that of its entry number, else its only one. None if it has
+    none of these.
+    """
+    names = entry.get('name', {})
+    if () in names:
+        return names[()]
+    if entry.entry_num is not None and (int(entry.entry_num),) in names:
+        return names[(int(entry.entry_num),)]
+    if len(names) == 1:
+        return next(iter(names.values()))
+    return None
+
+
+def parse_index(LW_node):
+    """
+    Parse the Index LIGO_LW node.
+
+    Returns a Bunch with
+     - entries: the parsed entries (see parse_index_entry) in order
+     - names: (entry_type, idx_A, idx_B) -> name of the node holding the data,
+       with the indices set to None for the entries that don't use them
+     - lookup: (entry_type, channel_A, channel_B) -> (node name, offset, length)
+       resolved through the channel lists of each entry, where channel_B is
+       None for single-channel entries
+
+    The entries naming a single node (such as the coefficient entries) take
+    their entry number, or None if they have none, in place of idx_A and
+    channel_A, so that several of a type are kept apart.
+    """
+    entries_raw = {}
+    for subentry in LW_node:
+        match_ref = _ENTRY_NAME_RE.match(subentry.attrib['Name'])
+        if match_ref:
+            entries_raw[int(match_ref.group(1))] = subentry.text
+
+    entries = []
+    names = {}
+    lookup = {}
+    for entry_idx in sorted(entries_raw):
+        entry = parse_index_entry(entries_raw[entry_idx])
+        entries.append(entry)
+        entry_type = entry.entry_type
+        channelA = entry.get('channelA', None) or entry.get('channel', {})
+        channelB = entry.get('channelB', {})
+        offsets = entry.get('offset', {})
+        lengths = entry.get('length', {})
+        for indices, node_name in entry.get('name', {}).items():
+            offset = offsets.get(indices, None)
+            length = lengths.get(indices, None)
+            if offset is not None:
+                offset = int(offset)
+            if length is not None:
+                length = int(length)
+            if len(indices) == 0:
+                entry_num = int(entry.entry_num) if entry.entry_num is not None else None
+                names[(entry_type, entry_num, None)] = node_name
+                lookup[(entry_type, entry_num, None)] = (node_name, offset, length)
+            elif len(indices) == 1:
+                names[(entry_type, indices[0], None)] = node_name
+                chn_A = channelA.get(indices[:1], None)
+                lookup[(entry_type, chn_A, None)] = (node_name, offset, length)
+            else:
+                names[(entry_type, indices[0], indices[1])] = node_name
+                chn_A = channelA.get(indices[:1], None)
+                chn_B = channelB.get(indices[1:2], None)
+                lookup[(entry_type, chn_A, chn_B)] = (node_name, offset, length)
+
+    index = Bunch()
+    index.entries = entries
+    index.names = names
+    index.lookup = lookup
+    return index
@@ -0,0 +1,159 @@
+"""
+Table-driven decoding of the Param/Time metadata of the result nodes.
+
+Each result type declares a ParamSchema mapping the (tag, Name) of its
+metadata nodes to the fields they fill, and the indexed parameters such as
+ChannelB[k] to the dicts collecting them. decode_params then reads a node's
+metadata in a single pass over its children with one dict lookup per child.
+"""
+import re
+
+
+WINDOW_NAMES = {
+    0 : 'Uniform',
+    1 : 'Hanning',
+    2 : 'Flat-top',
+    3 : 'Welch',
+    4 : 'Bartlett',
+    5 : 'BMH',
+    6 : 'Hamming',
+    7 : 'Kaiser',
+}
+
+#the coefficient results have always reported the window in lower case
+WINDOW_NAMES_LOWER = dict((k, v.lower()) for k, v in WINDOW_NAMES.items())
+
+AVGTYPE_NAMES = {
+    0 : 'Fixed',
+    1 : 'Exponential',
+    2 : 'Single',
+}
+
+_INDEXED_RE = re.compile(r'(\w+)\[(\d+)\]$')
+
+
+class EnumName(object):
+    """
+    Converter from the integer text of an enumerated Param to its name
+    """
+    __slots__ = ('names',)
+
+    def __init__(self, names):
+        self.names = names
+
+    def __call__(self, text):
+        return self.names.get(int(text), "unknown")
+
+
+def _text(text):
+    return text
+
+
+class ParamSchema(object):
+    """
+    params maps a Param Name to a tuple of (field, converter) pairs, times does
+    the same for the Time nodes and indexed maps the base name of an indexed
+    Param, such as 'ChannelB' for ChannelB[2], to the fields of the dicts
+    collecting its values by index.
+    """
+    def __init__(self, params, indexed = {}, times = None):
+        if times is None:
+            times = {'t0' : (('gps_second', float),)}
+        self.table = dict()
+        for name, fields in params.items():
+            self.table[('Param', name)] = tuple(fields)
+        for name, fields in times.items():
+            self.table[('Time', name)] = tuple(fields)
+        self.indexed = dict((name, tuple(fields)) for name, fields in indexed.items())
+
+    def extend(self, params = {}, indexed = {}, times = {}):
+        schema = self.__class__({})
+        schema.table = dict(self.table)
+        for name, fields in params.items():
+            schema.table[('Param', name)] = tuple(fields)
+        for name, fields in times.items():
+            schema.table[('Time', name)] = tuple(fields)
+        schema.indexed = dict(self.indexed)
+        schema.indexed.update((name, tuple(fields)) for name, fields in indexed.items())
+        return schema
+
+
+def decode_params(LW_node, schema):
+    """
+    Decode the Param and Time children of LW_node according to schema into a
+    dict of fields. Indexed parameters fill dicts keyed by their int index.
+    Parameters not named by the schema are ignored.
+    """
+    table = schema.table
+    indexed = schema.indexed
+    values = dict()
+    for sparam in LW_node:
+        tag = sparam.tag
+        if tag != 'Param' and tag != 'Time':
+            continue
+        spname = sparam.attrib["Name"]
+        fields = table.get((tag, spname), None)
+        if fields is not None:
+            text = sparam.text
+            for field, converter in fields:
+                values[field] = converter(text)
+            continue
+        if indexed and tag == 'Param':
+            RefNMatch = _INDEXED_RE.match(spname)
+            if RefNMatch is None:
+                continue
+            dict_fields = indexed.get(RefNMatch.group(1), None)
+            if dict_fields is None:
+                continue
+            chn_num = int(RefNMatch.group(2))
+            for field in dict_fields:
+                values.setdefault(field, {})[chn_num] = sparam.text
+    return values
+
+
+FREQUENCY_PARAMS = ParamSchema(
+    params = {
+        'Subtype'     : (('subtype_raw', int),),
+        'Window'      : (('window_raw', int), ('window', EnumName(WINDOW_NAMES))),
+        'AverageType' : (('avgtype_raw', int), ('avgtype', EnumName(AVGTYPE_NAMES))),
+        'Averages'    : (('averages', int),),
+        'BW'          : (('BW', float),),
+        'M'           : (('M', int),),
+        'N'           : (('N', int),),
+        'f0'          : (('f0', float),),
+        'df'          : (('df', float),),
+        'ChannelA'    : (('channelA', _text),),
+    },
+    indexed = {
+        'ChannelB' : ('channelB',),
+    },
+)
+
+TIMESERIES_PARAMS = ParamSchema(
+    params = {
+        'Subtype'          : (('subtype_raw', int),),
+        'AverageType'      : (('avgtype_raw', int), ('avgtype', EnumName(AVGTYPE_NAMES))),
+        'Averages'         : (('averages', int),),
+        'N'                : (('N', int),),
+        'f0'               : (('f0', float),),
+        'dt'               : (('dt', float),),
+        'Channel'          : (('channel', _text),),
+        'Decimation1'      : (('decimation1', int),),
+        'DecimationType'   : (('decimation_rawtype', int),),
+        'DecimationDelay'  : (('decimation_delay_s', float),),
+        'TimeDelay'        : (('time_delay_s', float),),
+        'DelayTaps'        : (('delay_taps_num', int),),
+        'DecimationFilter' : (('decimation_filter', _text),),
+    },
+)
+
+COEFFICIENT_PARAMS = FREQUENCY_PARAMS.extend(
+    params = {
+        'Window'   : (('window_raw', int), ('window', EnumName(WINDOW_NAMES_LOWER))),
+        'ChannelA' : (),
+    },
+    indexed = {
+        'ChannelA' : ('channelA', 'channels'),
+        'ChannelB' : ('channelB', 'channels'),
+    },
+)
@@ -1,62 +1,21 @@
 
-import base64
 import numpy as np
-from .bunch import Bunch
-import re
+from .records import SpectrumRecord
+from .parse_params import decode_params, FREQUENCY_PARAMS
+from .stream import DeferredStream, frequency_series_arrays, frequency_series_count
 #import xml.etree.cElementTree as etree
 
 
-def parse_spectrum(LW_node):
-    specbunch = Bunch()
-    specbunch.channelB = Bunch()
-    specbunch.channelB_inv = Bunch()
+def parse_spectrum(LW_node, lazy = False, axes = None):
+    specbunch = SpectrumRecord()
+    specbunch.channelB_inv = {}
 
-    for sparam in LW_node.findall('Time'):
-        if sparam.attrib["Name"] == 't0':
-            specbunch.gps_second = float(sparam.text)
-    for sparam in LW_node.findall('Param'):
-        spname = sparam.attrib["Name"]
-        if spname == 'Subtype':
-            subtype_raw = int(sparam.text)
-        elif spname == 'Window':
-            window_raw = int(sparam.text)
-            specbunch.window = {
-                0 : 'Uniform',
-                1 : 'Hanning',
-                2 : 'Flat-top',
-                3 : 'Welch',
-                4 : 'Bartlett',
-                5 : 'BMH',
-                6 : 'Hamming',
-                7 : 'Kaiser',
-            }.get(window_raw, "unknown")
-        elif spname == 'AverageType':
-            avgtype_raw = int(sparam.text)
-            specbunch.avgtype = {
-                0 : 'Fixed',
-                1 : 'Exponential',
-                2 : 'Single',
-            }.get(avgtype_raw, "unknown")
-        elif spname == 'Averages':
-            specbunch.averages = int(sparam.text)
-        elif spname == 'M':
-            M = int(sparam.text)
-        elif spname == 'N':
-            N = int(sparam.text)
-        elif spname == 'f0':
-            specbunch.f0 = float(sparam.text)
-        elif spname == 'BW':
-            specbunch.BW = float(sparam.text)
-        elif spname == 'df':
-            specbunch.df = float(sparam.text)
-        elif spname == 'ChannelA':
-            specbunch.channelA = sparam.text
-        elif spname.startswith('ChannelB'):
-            RefNMatch = re.match(r'ChannelB\[(\d+)\]', spname)
-            chn_num = int(RefNMatch.group(1))
-            specbunch.channelB[chn_num] = sparam.text
-        else:
-            pass
+    params = decode_params(LW_node, FREQUENCY_PARAMS)
+    specbunch.channelB = params.pop('channelB', {})
+    specbunch.update(params)
+    subtype_raw = specbunch.subtype_raw
+    N = specbunch.N
+    M = specbunch.M
 
     chanB = specbunch.channelB
     sarg = np.argsort(list(chanB.keys()))
@@ -67,57 +26,63 @@ def parse_spectrum(LW_node):
 
     ####
     ##Now interpret the data
-    streambuff = base64.b64decode(LW_node.findall('Array/Stream')[0].text)
-
+    #the layout is (dtype, field name, FHz format), where a FHz format of None
+    #means the frequencies are implied by f0 and df rather than stored
     if subtype_raw == 0:
         specbunch.subtype = 'FFT in format (Y)'
-        data = np.frombuffer(streambuff, dtype='c8')
-        specbunch.FHz = np.linspace(specbunch.f0, specbunch.f0 + specbunch.df*(N-1), N)
         specbunch.type_name = 'FFT'
-        specbunch.FFT = data.reshape(M, -1)
+        layout = ('c8', 'FFT', None)
     elif subtype_raw == 1:
         specbunch.subtype = 'power spectral density in format (Y)'
         specbunch.type_name = 'PSD'
-        data = np.frombuffer(streambuff, dtype='f4')
-        specbunch.FHz = np.linspace(specbunch.f0, specbunch.f0 + specbunch.df*(N-1), N)
-        specbunch.PSD = data.reshape(M, -1)
+        layout = ('f4', 'PSD', None)
     elif subtype_raw == 2:
         specbunch.subtype = 'cross-power spectrum in format (Y)'
         specbunch.type_name = 'CSD'
-        data = np.frombuffer(streambuff, dtype='c8')
-        specbunch.FHz = np.linspace(specbunch.f0, specbunch.f0 + specbunch.df*(N-1), N)
-        specbunch.CSD = data.reshape(M, -1)
+        layout = ('c8', 'CSD', None)
     elif subtype_raw == 3:
         specbunch.subtype = 'coherence in format (Y)'
         specbunch.type_name = 'COH'
-        data = np.frombuffer(streambuff, dtype='f4')
-        specbunch.FHz = np.linspace(specbunch.f0, specbunch.f0 + specbunch.df*(N-1), N)
-        specbunch.coherence = data.reshape(M, -1)
+        layout = ('f4', 'coherence', None)
     elif subtype_raw == 4:
         specbunch.subtype = 'FFT in format (f, Y)'
         specbunch.type_name = 'FFT'
-        data = np.frombuffer(streambuff, dtype='c8')
-        specbunch.FHz = data[:N]
-        specbunch.FFT = data[N:].reshape(M, -1)
+        layout = ('c8', 'FFT', 'data')
     elif subtype_raw == 5:
         specbunch.subtype = 'power spectral density in format (f,Y)'
         specbunch.type_name = 'PSD'
-        data = np.frombuffer(streambuff, dtype='f4')
-        specbunch.FHz = data[:N]
-        specbunch.PSD = data[N:].reshape(M, -1)
+        layout = ('f4', 'PSD', 'data')
     elif subtype_raw == 6:
         specbunch.subtype = 'cross-power spectrum in format (f,Y)'
         specbunch.type_name = 'CSD'
-        data = np.frombuffer(streambuff, dtype='c8')
-        specbunch.FHz = data[:N].real
-        specbunch.CSD = data[N:].reshape(M, -1)
+        layout = ('c8', 'CSD', 'real')
     elif subtype_raw == 7:
         specbunch.subtype = 'coherence in format (f,Y)'
         specbunch.type_name = 'COH'
-        data = np.frombuffer(streambuff, dtype='f4')
-        specbunch.FHz = data[:N]
-        specbunch.coherence = data[N:].reshape(M, -1)
+        layout = ('f4', 'coherence', 'data')
     else:
         specbunch.subtype = "unknown"
-    return specbunch
+        return specbunch
+
+    dtype, field, FHz_format = layout
+    if FHz_format is None:
+        if axes is not None:
+            specbunch.FHz = axes.linear(specbunch.f0, specbunch.df, N)
+        else:
+            specbunch.FHz = np.linspace(specbunch.f0, specbunch.f0 + specbunch.df*(N-1), N)
+        fields = (field,)
+    else:
+        fields = ('FHz', field)
 
+    stream = DeferredStream.from_node(
+        LW_node.findall('Array/Stream')[0],
+        frequency_series_arrays,
+        (field, FHz_format, N, M, axes),
+        dtype = dtype,
+        count = frequency_series_count(FHz_format, N, M),
+    )
+    if lazy:
+        specbunch.defer(fields, stream)
+    else:
+        specbunch.update(stream())
+    return specbunch
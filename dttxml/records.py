@@ -0,0 +1,357 @@
+"""
+Records of the parsed results, with a __slots__ field for each value the
+parsers produce.
+
+The fields of a record are listed by its class in _fields. Fields which are
+set are read as plain attributes, without going through a dict, and fields
+deferred to a loader (see defer) are filled on first access. Records also take the mapping interface of the Bunch
+they replace (result['PSD'], get, keys, items, "in", update...), with the
+keys outside of their fields kept in a dict on the side.
+"""
+try:
+    from collections.abc import Mapping as MappingABC
+    from collections.abc import MutableSequence as MutableSequenceABC
+except ImportError:
+    from collections import Mapping as MappingABC
+    from collections import MutableSequence as MutableSequenceABC
+
+import numpy as np
+
+from .bunch import Bunch
+from .parse_params import (
+    FREQUENCY_PARAMS,
+    TIMESERIES_PARAMS,
+    COEFFICIENT_PARAMS,
+)
+
+
+def schema_fields(schema, *extra):
+    """
+    The names of the fields filled by a parse_params.ParamSchema, in order,
+    followed by those of extra
+    """
+    fields = []
+    for field_converters in schema.table.values():
+        for field, converter in field_converters:
+            if field not in fields:
+                fields.append(field)
+    for dict_fields in schema.indexed.values():
+        for field in dict_fields:
+            if field not in fields:
+                fields.append(field)
+    for field in extra:
+        if field not in fields:
+            fields.append(field)
+    return tuple(fields)
+
+
+class ResultRecord(object):
+    """
+    Base of the records, see the module documentation. Subclasses set
+    __slots__ and _fields to the names of their fields.
+    """
+    __slots__ = ('_deferred', '_loaded', '_extra')
+    _fields = ()
+    _field_set = frozenset()
+
+    def __init__(self, items = None, **kwargs):
+        #key -> loader of the deferred fields
+        object.__setattr__(self, '_deferred', None)
+        #key -> loader of the loaded fields, for release
+        object.__setattr__(self, '_loaded', None)
+        #the keys outside of _fields
+        object.__setattr__(self, '_extra', None)
+        if items is not None:
+            self.update(items)
+        if kwargs:
+            self.update(kwargs)
+
+    def _peek(self, key):
+        """
+        The value of key if set, without loading it. Raises KeyError.
+        """
+        if key in self._field_set:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        extra = self._extra
+        if extra is not None and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def _store(self, key, item):
+        if key in self._field_set:
+            object.__setattr__(self, key, item)
+            return
+        if self._extra is None:
+            object.__setattr__(self, '_extra', dict())
+        self._extra[key] = item
+
+    def _unset(self, key):
+        if key in self._field_set:
+            try:
+                object.__delattr__(self, key)
+            except AttributeError:
+                raise KeyError(key)
+            return
+        extra = self._extra
+        if extra is None:
+            raise KeyError(key)
+        del extra[key]
+
+    def defer(self, keys, loader):
+        """
+        Have loader, called without arguments and returning a mapping holding
+        all of keys, supply keys on first access
+        """
+        if self._deferred is None:
+            object.__setattr__(self, '_deferred', dict())
+            object.__setattr__(self, '_loaded', dict())
+        for key in keys:
+            self._deferred[key] = loader
+        return
+
+    def _load(self, loader):
+        values = loader()
+        for key, loader_key in list(self._deferred.items()):
+            if loader_key is loader:
+                del self._deferred[key]
+                self._store(key, values[key])
+                self._loaded[key] = loader
+        return
+
+    def release(self):
+        """
+        Defer again the loaded fields whose loader can drop what it loaded,
+        through a release() method returning True. Returns the number of
+        fields released.
+        """
+        if not self._loaded:
+            return 0
+        released = 0
+        for loader in set(self._loaded.values()):
+            release = getattr(loader, 'release', None)
+            if release is None or not release():
+                continue
+            for key, loader_key in list(self._loaded.items()):
+                if loader_key is loader:
+                    del self._loaded[key]
+                    self._unset(key)
+                    self._deferred[key] = loader
+                    released += 1
+        return released
+
+    def resolve(self):
+        deferred = self._deferred
+        while deferred:
+            self._load(next(iter(deferred.values())))
+        return self
+
+    @property
+    def deferred_keys(self):
+        if self._deferred is None:
+            return []
+        return list(self._deferred.keys())
+
+    def loaded_items(self):
+        """
+        The (key, value) items set, without loading the deferred ones
+        """
+        items = []
+        for key in self._fields:
+            try:
+                items.append((key, object.__getattribute__(self, key)))
+            except AttributeError:
+                pass
+        if self._extra is not None:
+            items.extend(self._extra.items())
+        return items
+
+    def __getattr__(self, key):
+        #only reached for the fields not set
+        if key[:1] == '_':
+            raise AttributeError(key)
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(
+                "{0} has no field {1}".format(self.__class__.__name__, key)
+            )
+
+    def __delattr__(self, key):
+        try:
+            del self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __getitem__(self, key):
+        if type(key) is not str and isinstance(key, (slice, np.ndarray, MutableSequenceABC)):
+            rebuild = dict()
+            for vkey, val in self.items():
+                if isinstance(val, np.ndarray):
+                    rebuild[vkey] = val[key]
+            if not rebuild:
+                raise RuntimeError("Not holding arrays to index by {0}".format(key))
+            return Bunch(rebuild)
+        try:
+            return self._peek(key)
+        except KeyError:
+            deferred = self._deferred
+            if deferred is None or key not in deferred:
+                raise
+        self._load(deferred[key])
+        return self._peek(key)
+
+    def __setitem__(self, key, item):
+        if self._deferred is not None:
+            self._deferred.pop(key, None)
+            self._loaded.pop(key, None)
+        if key in self._field_set:
+            object.__setattr__(self, key, item)
+        else:
+            self._store(key, item)
+
+    __setattr__ = __setitem__
+
+    def __delitem__(self, key):
+        if self._deferred is not None:
+            self._loaded.pop(key, None)
+            if self._deferred.pop(key, None) is not None:
+                try:
+                    self._unset(key)
+                except KeyError:
+                    pass
+                return
+        self._unset(key)
+
+    def __contains__(self, key):
+        try:
+            self._peek(key)
+        except KeyError:
+            return self._deferred is not None and key in self._deferred
+        return True
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def pop(self, key, *args):
+        try:
+            item = self[key]
+        except KeyError:
+            if args:
+                return args[0]
+            raise
+        del self[key]
+        return item
+
+    def update(self, *args, **kwargs):
+        setitem = self.__setitem__
+        for key, item in dict(*args, **kwargs).items():
+            setitem(key, item)
+        return
+
+    def copy(self):
+        return self.__class__(self.items())
+
+    def keys(self):
+        return [key for key, item in self.resolve().loaded_items()]
+
+    def values(self):
+        return [item for key, item in self.resolve().loaded_items()]
+
+    def items(self):
+        return self.resolve().loaded_items()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.loaded_items()) + len(self.deferred_keys)
+
+    def __dir__(self):
+        return [key for key, item in self.loaded_items()] + self.deferred_keys
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self.items()),))
+
+    def __repr__(self):
+        items = [''.join((str(k), '=', repr(v))) for k, v in self.loaded_items()]
+        items.extend('{0}=<deferred>'.format(k) for k in self.deferred_keys)
+        return '{0}({1})'.format(
+            self.__class__.__name__,
+            ', \n    '.join(items)
+        )
+
+
+class SpectrumRecord(ResultRecord):
+    """
+    FFT, PSD, CSD and coherence results of parse_spectrum
+    """
+    __slots__ = _fields = schema_fields(
+        FREQUENCY_PARAMS,
+        'channelB_inv', 'subtype', 'type_name',
+        'FHz', 'FFT', 'PSD', 'CSD', 'coherence',
+    )
+    _field_set = frozenset(_fields)
+
+
+class TransferRecord(ResultRecord):
+    """
+    Transfer function, response and coherence results of parse_transfer
+    """
+    __slots__ = _fields = schema_fields(
+        FREQUENCY_PARAMS,
+        'channelB_inv', 'subtype', 'type_name',
+        'FHz', 'xfer', 'response', 'coherence',
+    )
+    _field_set = frozenset(_fields)
+
+
+class TimeSeriesRecord(ResultRecord):
+    """
+    Time series results of parse_timeseries
+    """
+    __slots__ = _fields = schema_fields(
+        TIMESERIES_PARAMS,
+        'subtype', 'type_name',
+        'data_raw', 'timeseries',
+    )
+    _field_set = frozenset(_fields)
+
+
+class CoefficientRecord(ResultRecord):
+    """
+    Transfer, coherence and harmonic coefficient results of
+    parse_coefficients
+    """
+    __slots__ = _fields = schema_fields(
+        COEFFICIENT_PARAMS,
+        'channelA_inv', 'channelB_inv', 'channels_inv', 'subtype', 'type_name',
+        'data_raw', 'FHz', 'coeffs',
+    )
+    _field_set = frozenset(_fields)
+
+
+#the records by their type_name, for the results rebuilt from other formats
+RECORD_TYPES = {
+    'FFT' : SpectrumRecord,
+    'PSD' : SpectrumRecord,
+    'CSD' : SpectrumRecord,
+    'TF'  : TransferRecord,
+    'STF' : TransferRecord,
+    'COH' : TransferRecord,
+    'TS'  : TimeSeriesRecord,
+}
+
+MappingABC.register(ResultRecord)
@@ -0,0 +1,189 @@
+"""
+Byte-offset index of the top-level LIGO_LW blocks of a diaggui xml file.
+
+One scan over an mmap of the file records, for every child of the root
+LIGO_LW (Index, Result[n], Reference[n], ...), the byte span of the block and
+the span of its Array/Stream payload. The blocks can then be parsed without
+their payloads, which are read back from the file only when a result's data
+is first accessed. The index may be persisted as a JSON sidecar next to the
+file and is rebuilt when the size or mtime of the file no longer match.
+"""
+import json
+import mmap
+import os
+import re
+import xml.etree.ElementTree as etree
+
+
+_TAG_RE = re.compile(rb'<(/?)LIGO_LW\b([^>]*)>')
+_ATTR_RE = re.compile(rb'(\w+)\s*=\s*"([^"]*)"')
+
+SIDECAR_EXT = '.sections.json'
+
+
+class FileSpan(object):
+    """
+    Placeholder for a Stream payload, read from the file on demand.
+    """
+    __slots__ = ('fname', 'start', 'end')
+
+    def __init__(self, fname, start, end):
+        self.fname = fname
+        self.start = start
+        self.end   = end
+
+    def read(self):
+        with open(self.fname, 'rb') as F:
+            F.seek(self.start)
+            return F.read(self.end - self.start)
+
+
+def _file_stamp(fname):
+    stat = os.stat(fname)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def scan_sections(fname):
+    """
+    Scan the file for the top-level LIGO_LW blocks. Returns a list of dicts
+    with the Name and Type attributes, the [start, end) byte span of the block
+    and the [start, end) span of its Stream payload (None if it has none).
+    """
+    sections = []
+    with open(fname, 'rb') as F:
+        with mmap.mmap(F.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            depth = 0
+            section = None
+            for match in _TAG_RE.finditer(mm):
+                if match.group(1):
+                    depth -= 1
+                    if depth == 1:
+                        section['end'] = match.end()
+                        sections.append(section)
+                        section = None
+                    continue
+                if match.group(2).rstrip().endswith(b'/'):
+                    continue
+                depth += 1
+                if depth == 2:
+                    attrs = dict(_ATTR_RE.findall(match.group(2)))
+                    section = dict(
+                        name    = attrs.get(b'Name', b'').decode('utf-8'),
+                        type    = attrs.get(b'Type', b'').decode('utf-8'),
+                        start   = match.start(),
+                        end     = None,
+                        payload = None,
+                    )
+
+            for section in sections:
+                start, end = section['start'], section['end']
+                idx_stream = mm.find(b'<Stream', start, end)
+                if idx_stream == -1:
+                    continue
+                payload_start = mm.find(b'>', idx_stream, end) + 1
+                payload_end = mm.find(b'</Stream>', payload_start, end)
+                if payload_end == -1:
+                    continue
+                section['payload'] = (payload_start, payload_end)
+    return sections
+
+
+class SectionIndex(object):
+    """
+    Index of the top-level blocks of a diaggui xml file, see scan_sections.
+
+    Use SectionIndex.open to build the index or load it from its sidecar.
+    iter_nodes() yields the blocks as xml nodes in file order, with the text of
+    their Stream node replaced by a FileSpan, so that the parse_* functions
+    defer reading the payload until it is decoded.
+    """
+    def __init__(self, fname, sections, stamp = None):
+        self.fname = os.path.abspath(fname)
+        self.sections = sections
+        self.stamp = tuple(stamp) if stamp is not None else _file_stamp(fname)
+        self.by_name = dict((section['name'], section) for section in sections)
+
+    @classmethod
+    def build(cls, fname):
+        stamp = _file_stamp(fname)
+        return cls(fname, scan_sections(fname), stamp = stamp)
+
+    @classmethod
+    def open(cls, fname, sidecar = None):
+        """
+        Build the index of fname. If sidecar is True (for fname + SIDECAR_EXT)
+        or a path, the index is loaded from there when it is still current
+        and is otherwise rebuilt and saved to it.
+        """
+        if sidecar is None or sidecar is False:
+            return cls.build(fname)
+        if sidecar is True:
+            sidecar = fname + SIDECAR_EXT
+        try:
+            with open(sidecar, 'r') as F:
+                data = json.load(F)
+        except (IOError, OSError, ValueError):
+            data = None
+        if data is not None and tuple(data['stamp']) == _file_stamp(fname):
+            sections = data['sections']
+            for section in sections:
+                if section['payload'] is not None:
+                    section['payload'] = tuple(section['payload'])
+            return cls(fname, sections, stamp = data['stamp'])
+        index = cls.build(fname)
+        index.save(sidecar)
+        return index
+
+    def save(self, sidecar = None):
+        if sidecar is None:
+            sidecar = self.fname + SIDECAR_EXT
+        sidecar_tmp = sidecar + '.tmp'
+        with open(sidecar_tmp, 'w') as F:
+            json.dump(dict(stamp = self.stamp, sections = self.sections), F)
+        os.replace(sidecar_tmp, sidecar)
+        return
+
+    def read_block(self, name, with_payload = True):
+        """
+        Return the bytes of the named block, optionally leaving out its payload
+        """
+        section = self.by_name[name]
+        with open(self.fname, 'rb') as F:
+            return self._read_block(F, section, with_payload)
+
+    def _read_block(self, F, section, with_payload):
+        start, end = section['start'], section['end']
+        payload = section['payload']
+        if with_payload or payload is None:
+            F.seek(start)
+            return F.read(end - start)
+        F.seek(start)
+        head = F.read(payload[0] - start)
+        F.seek(payload[1])
+        tail = F.read(end - payload[1])
+        return head + tail
+
+    def _node(self, block, section):
+        xml_node = etree.fromstring(block)
+        if section['payload'] is not None:
+            for stream_node in xml_node.iter('Stream'):
+                stream_node.text = FileSpan(self.fname, *section['payload'])
+        return xml_node
+
+    def parse_block(self, name):
+        section = self.by_name[name]
+        return self._node(self.read_block(name, with_payload = False), section)
+
+    def iter_nodes(self, select = None):
+        """
+        Yield the blocks in file order. select may be a function of the
+        section dict to skip reading blocks that aren't needed.
+        """
+        if _file_stamp(self.fname) != self.stamp:
+            raise RuntimeError("File {0} changed since it was indexed".format(self.fname))
+        with open(self.fname, 'rb') as F:
+            for section in self.sections:
+                if select is not None and not select(section):
+                    continue
+                block = self._read_block(F, section, with_payload = False)
+                yield self._node(block, section)
@@ -0,0 +1,229 @@
+"""
+Decoding of the LIGO_LW Array/Stream payloads
+"""
+import binascii
+import numpy as np
+
+
+#size of the slices of stream text decoded at a time
+CHUNK_CHARS = 1 << 20
+
+_WHITESPACE = b' \t\r\n\f\v'
+
+
+def _decode_chunks(text, chunk_chars = CHUNK_CHARS):
+    """
+    Yield the decoded bytes of the text, in slices of about chunk_chars
+    characters. The slices are cut at line ends, which usually leaves a
+    multiple of four base64 characters in each, so that binascii decodes them
+    as they are. Otherwise the whitespace is stripped to carry the remainder
+    over to the next slice.
+    """
+    is_str = isinstance(text, str)
+    carry = b''
+    idx = 0
+    while idx < len(text):
+        idx_end = text.find('\n' if is_str else b'\n', idx + chunk_chars) + 1
+        if idx_end == 0:
+            idx_end = len(text)
+        chunk = text[idx:idx_end]
+        idx = idx_end
+        if is_str:
+            chunk = chunk.encode('ascii')
+        if not carry:
+            try:
+                yield binascii.a2b_base64(chunk)
+                continue
+            except binascii.Error:
+                pass
+        chunk = carry + chunk.translate(None, _WHITESPACE)
+        n_use = len(chunk) - len(chunk) % 4
+        carry = chunk[n_use:]
+        if n_use > 0:
+            yield binascii.a2b_base64(chunk[:n_use])
+    if carry:
+        #let binascii report the malformed remainder
+        yield binascii.a2b_base64(carry)
+
+
+def decode_base64(text, dtype, count = None, chunk_chars = CHUNK_CHARS):
+    """
+    Decode base64 text, str or bytes with any whitespace, into a new writeable
+    array of the given dtype.
+
+    count is the expected number of elements, from the Dim/N/M of the node.
+    The array is preallocated for it and filled slice by slice, so the decoded
+    bytes are never held as one intermediate bytes object. The array is
+    trimmed or grown if the stream holds fewer or more elements.
+    """
+    dtype = np.dtype(dtype)
+    if count is None:
+        #upper bound of the decoded size
+        count = (len(text) * 3 // 4) // dtype.itemsize + 1
+    out = np.empty(count, dtype = dtype)
+    buff = out.view(np.uint8)
+    pos = 0
+    for decoded in _decode_chunks(text, chunk_chars):
+        pos_next = pos + len(decoded)
+        if pos_next > len(buff):
+            n_grow = max(len(out), (pos_next - len(buff)) // dtype.itemsize + 1)
+            out = np.concatenate([out, np.empty(n_grow, dtype = dtype)])
+            buff = out.view(np.uint8)
+        buff[pos:pos_next] = np.frombuffer(decoded, dtype = np.uint8)
+        pos = pos_next
+    if pos % dtype.itemsize != 0:
+        raise ValueError("Stream holds a partial element of type {0}".format(dtype))
+    count_read = pos // dtype.itemsize
+    if count_read != len(out):
+        out = out[:count_read]
+    return out
+
+
+def parse_encoding(encoding):
+    """
+    Split the Encoding attribute of a Stream, e.g. "LittleEndian,base64",
+    into the byte order character and whether the stream is base64 rather
+    than delimited text, which is the LIGO_LW default.
+    """
+    if encoding is None:
+        return '<', False
+    tokens = set(token.strip().lower() for token in encoding.split(','))
+    byteorder = '>' if 'bigendian' in tokens else '<'
+    return byteorder, 'base64' in tokens
+
+
+def decode_text(text, dtype, delimiter = ','):
+    """
+    Parse a delimited text stream with numpy into an array of dtype. Complex
+    values are read as (real, imaginary) pairs.
+    """
+    if not isinstance(text, str):
+        text = text.decode('ascii')
+    if delimiter and not delimiter.isspace():
+        text = text.replace(delimiter, ' ')
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'c':
+        real_dtype = np.dtype('f{0}'.format(dtype.itemsize // 2))
+        values = np.fromstring(text, dtype = real_dtype, sep = ' ')
+        if len(values) % 2 != 0:
+            raise ValueError("Text stream of complex values holds an odd number of values")
+        return values.view(dtype)
+    return np.fromstring(text, dtype = dtype, sep = ' ')
+
+
+class DeferredStream(object):
+    """
+    Handle to the text of an Array/Stream node which is decoded on first use.
+
+    Calling the handle decodes the stream into an array of dtype, sized for
+    count elements, and passes it to interpret(data, \\*args), which returns a
+    dict of the arrays it produces. The dict is cached and the stream text is
+    dropped afterwards. The text may also be an object with a read() method
+    returning it, such as a sections.FileSpan, which is kept so that release()
+    can free the arrays.
+
+    encoding is the Encoding attribute of the Stream (see parse_encoding).
+    Big endian streams decode to a big endian dtype of the same buffer, which
+    numpy swaps as it reads, and text streams are split at the delimiter.
+    """
+    __slots__ = (
+        'text', 'interpret', 'args', 'dtype', 'count',
+        'encoding', 'delimiter', '_arrays',
+    )
+
+    def __init__(
+        self,
+        text,
+        interpret,
+        args      = (),
+        dtype     = 'f4',
+        count     = None,
+        encoding  = 'LittleEndian,base64',
+        delimiter = ',',
+    ):
+        self.text      = text
+        self.interpret = interpret
+        self.args      = tuple(args)
+        self.dtype     = dtype
+        self.count     = count
+        self.encoding  = encoding
+        self.delimiter = delimiter
+        self._arrays   = None
+
+    @classmethod
+    def from_node(cls, stream_node, interpret, args = (), dtype = 'f4', count = None):
+        """
+        Handle for a Stream xml node, according to its Encoding and Delimiter
+        """
+        attrib = stream_node.attrib
+        return cls(
+            stream_node.text,
+            interpret,
+            args,
+            dtype     = dtype,
+            count     = count,
+            encoding  = attrib.get('Encoding', None),
+            delimiter = attrib.get('Delimiter', ','),
+        )
+
+    @property
+    def decoded(self):
+        return self._arrays is not None
+
+    def __call__(self):
+        if self._arrays is None:
+            text = self.text
+            if not isinstance(text, (str, bytes)):
+                #a placeholder such as sections.FileSpan
+                text = text.read()
+            byteorder, is_base64 = parse_encoding(self.encoding)
+            dtype = np.dtype(self.dtype).newbyteorder(byteorder)
+            if is_base64:
+                data = decode_base64(text, dtype, self.count)
+            else:
+                data = decode_text(text, dtype, self.delimiter)
+            self._arrays = self.interpret(data, *self.args)
+            if isinstance(self.text, (str, bytes)):
+                self.text = None
+        return self._arrays
+
+    def release(self):
+        """
+        Drop the decoded arrays if the text can be read again, as for a
+        sections.FileSpan. Returns whether they were dropped.
+        """
+        if self.text is None:
+            return False
+        self._arrays = None
+        return True
+
+
+def frequency_series_arrays(data, field, FHz_format, N, M, axes = None):
+    """
+    Interpret a Spectrum or TransferFunction stream of M rows of N points.
+
+    FHz_format is None when the frequencies are not stored in the stream,
+    'data' when they make up its first N points and 'real' when those first
+    points are complex and only their real part is kept. The frequencies are
+    interned in axes (an axes.AxisInterner) if given.
+    """
+    if FHz_format is None:
+        return {field : data.reshape(M, -1)}
+    FHz = data[:N]
+    if FHz_format == 'real':
+        FHz = FHz.real
+    if axes is not None:
+        FHz = axes.explicit(FHz)
+    return {
+        'FHz' : FHz,
+        field : data[N:].reshape(M, -1),
+    }
+
+
+def frequency_series_count(FHz_format, N, M):
+    """
+    Number of elements of a Spectrum or TransferFunction stream
+    """
+    if FHz_format is None:
+        return N * M
+    return N * (M + 1)
@@ -0,0 +1,256 @@
+"""
+Watching of directories for new diaggui files, converting them with dtt2hdf,
+appending them to an HDFArchive or parsing them into a ParseCache as they
+land.
+
+Directories are polled rather than watched through OS notifications, which
+do not work reliably on network filesystems. A file is taken once its size
+and mtime have stayed the same for stable_polls polls, so files still being
+written are left for later. The files done are recorded with their size and
+mtime in a JSON state file, so that a restarted watcher skips them.
+"""
+import os
+import json
+import time
+import glob
+import fnmatch
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from .dtt2hdf import _convert_worker, output_path
+from .cache import ParseCache
+
+log = logging.getLogger(__name__)
+
+
+def _cache_worker(file_from, cache_dir):
+    t_start = time.perf_counter()
+    try:
+        ParseCache(cache_dir).read(file_from)
+    except Exception as E:
+        return E
+    return time.perf_counter() - t_start
+
+
+class Watcher(object):
+    """
+    Watch directory (and its subdirectories if recursive) for files matching
+    pattern. Each stable new file is
+
+    - appended to the HDFArchive archive, if given, in this process,
+    - else parsed into the ParseCache at cache_dir, if given,
+    - else converted to a .h5 alongside it or in output_dir,
+
+    spread over a pool of workers processes for the latter two.
+
+    state_file defaults to .dttxml-watch.json in the directory, or to a
+    file named after the directory in output_dir when given.
+    """
+    def __init__(
+        self,
+        directory,
+        output_dir    = None,
+        recursive     = False,
+        pattern       = '*.xml',
+        state_file    = None,
+        workers       = 1,
+        poll_interval = 2.0,
+        stable_polls  = 2,
+        archive       = None,
+        cache_dir     = None,
+        write_options = None,
+        stream        = True,
+    ):
+        self.directory     = directory
+        self.output_dir    = output_dir
+        self.recursive     = recursive
+        self.pattern       = pattern
+        self.workers       = workers
+        self.poll_interval = poll_interval
+        self.stable_polls  = stable_polls
+        self.archive       = archive
+        self.cache_dir     = cache_dir
+        self.convert_kwargs = dict(write_options = write_options, stream = stream)
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok = True)
+        if state_file is None:
+            if output_dir is None:
+                state_file = os.path.join(directory, '.dttxml-watch.json')
+            else:
+                #several directories may be watched into one output_dir
+                digest = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()
+                state_file = os.path.join(output_dir, '.dttxml-watch-{0}.json'.format(digest[:12]))
+        self.state_file = state_file
+
+        #path -> [size, mtime_ns] of the files done
+        self.done = self._load_state()
+        #path -> (size, mtime_ns, polls unchanged) of the files seen
+        self.pending = dict()
+        #future -> (path, [size, mtime_ns], time submitted)
+        self.running = dict()
+        self.executor = None
+
+        self.n_done = 0
+        self.n_failed = 0
+        self.bytes_done = 0
+        self.t_busy = 0
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r') as F:
+                return json.load(F)['done']
+        except (IOError, OSError, ValueError, KeyError):
+            return dict()
+
+    def _save_state(self):
+        state_tmp = '{0}.tmp-{1}'.format(self.state_file, os.getpid())
+        with open(state_tmp, 'w') as F:
+            json.dump(dict(done = self.done), F)
+        os.replace(state_tmp, self.state_file)
+
+    def scan(self):
+        """
+        List the (path, relative path) of the files under the directory
+        """
+        if self.recursive:
+            fpaths = glob.glob(os.path.join(glob.escape(self.directory), '**', '*'), recursive = True)
+        else:
+            fpaths = glob.glob(os.path.join(glob.escape(self.directory), '*'))
+        found = []
+        for fpath in sorted(fpaths):
+            if not fnmatch.fnmatch(os.path.basename(fpath), self.pattern):
+                continue
+            if not os.path.isfile(fpath):
+                continue
+            found.append((fpath, os.path.relpath(fpath, self.directory)))
+        return found
+
+    def poll(self):
+        """
+        Collect the finished files, then scan for new ones and start those
+        which are stable. Returns the number of files started.
+        """
+        self.collect()
+        ready = []
+        for fpath, relpath in self.scan():
+            try:
+                stat = os.stat(fpath)
+            except OSError:
+                #removed since the scan
+                continue
+            ident = [stat.st_size, stat.st_mtime_ns]
+            if self.done.get(fpath, None) == ident:
+                continue
+            if any(running[0] == fpath for running in self.running.values()):
+                continue
+            size, mtime_ns, polls = self.pending.get(fpath, (None, None, 0))
+            if [size, mtime_ns] == ident:
+                polls += 1
+            else:
+                polls = 0
+            self.pending[fpath] = (stat.st_size, stat.st_mtime_ns, polls)
+            if polls >= self.stable_polls and stat.st_size > 0:
+                del self.pending[fpath]
+                ready.append((fpath, relpath, ident))
+        for fpath, relpath, ident in ready:
+            self.submit(fpath, relpath, ident)
+        return len(ready)
+
+    def submit(self, fpath, relpath, ident):
+        t_submit = time.time()
+        if self.archive is not None:
+            t_start = time.perf_counter()
+            try:
+                self.archive.append(fpath)
+                outcome = time.perf_counter() - t_start
+            except Exception as E:
+                outcome = E
+            self.finish(fpath, ident, t_submit, outcome)
+            return
+
+        if self.cache_dir is not None:
+            worker, args = _cache_worker, (fpath, self.cache_dir)
+        else:
+            file_to = output_path(fpath, relpath, self.output_dir)
+            worker, args = _convert_worker, (fpath, file_to, self.convert_kwargs)
+
+        if self.workers <= 1:
+            self.finish(fpath, ident, t_submit, worker(*args))
+            return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers = self.workers)
+        future = self.executor.submit(worker, *args)
+        self.running[future] = (fpath, ident, t_submit)
+
+    def collect(self, wait = False):
+        """
+        Record the files finished by the pool, all of those running if wait
+        """
+        for future, (fpath, ident, t_submit) in list(self.running.items()):
+            if not wait and not future.done():
+                continue
+            try:
+                outcome = future.result()
+            except Exception as E:
+                outcome = E
+            del self.running[future]
+            self.finish(fpath, ident, t_submit, outcome)
+
+    def finish(self, fpath, ident, t_submit, outcome):
+        #failed files are recorded too, to be retried only once they change
+        self.done[fpath] = ident
+        self._save_state()
+        if isinstance(outcome, Exception):
+            self.n_failed += 1
+            log.error("FAILED: %s: %s", fpath, outcome)
+            return
+        MB = ident[0] / 1e6
+        self.n_done += 1
+        self.bytes_done += ident[0]
+        self.t_busy += outcome
+        #from the last write of the file to its output
+        latency = time.time() - ident[1] / 1e9
+        log.info(
+            "%s: %.1f MB in %.2f s (%.1f MB/s), %.1f s after landing, queued %.2f s",
+            fpath, MB, outcome, MB / max(outcome, 1e-9), latency,
+            max(time.time() - t_submit - outcome, 0),
+        )
+        log.info(
+            "totals: %d done, %d failed, %.1f MB at %.1f MB/s",
+            self.n_done, self.n_failed, self.bytes_done / 1e6,
+            self.bytes_done / 1e6 / max(self.t_busy, 1e-9),
+        )
+
+    def run(self, max_polls = None):
+        """
+        Poll every poll_interval seconds, until interrupted or for max_polls
+        polls, then wait for the files started
+        """
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                self.poll()
+                polls += 1
+                if max_polls is not None and polls >= max_polls:
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            self.close()
+        return
+
+    def close(self):
+        """
+        Wait for the files started and shut down the pool of workers
+        """
+        self.collect(wait = True)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
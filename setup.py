@@ -23,7 +23,8 @@ setup(
     license = 'Apache v2',
     packages=find_packages(exclude=['doc']),
     extras_require   ={
-        "hdf" : ["h5py"],
+        "hdf"  : ["h5py"],
+        "lxml" : ["lxml"],
     },
     tests_require=['pytest'],
     entry_points={
@@ -0,0 +1,140 @@
+"""
+Writer of synthetic diaggui FFT measurement files, for the tests and
+benchmarks that need files larger than the bundled test data.
+"""
+import base64
+import numpy as np
+
+
+_HEADER = """<?xml version="1.0"?>
+<LIGO_LW Name="Diagnostics Test">
+  <LIGO_LW Name="Header" Type="Global">
+    <Param Name="Flag" Type="string">TestParameters</Param>
+    <Param Name="TestType" Type="string">FFT</Param>
+    <Time Name="TestTime" Type="GPS">{gps}</Time>
+  </LIGO_LW>
+"""
+
+_SPECTRUM = """  <LIGO_LW Name="{name}" Type="Spectrum">
+    <Param Name="Flag" Type="string">Result</Param>
+    <Param Name="Subtype" Type="int">{subtype}</Param>
+    <Param Name="f0" Type="double" Unit="Hz">0</Param>
+    <Param Name="df" Type="double" Unit="Hz">{df}</Param>
+    <Time Name="t0" Type="GPS">{gps}</Time>
+    <Param Name="dt" Type="double" Unit="s">1</Param>
+    <Param Name="BW" Type="double" Unit="Hz">{BW}</Param>
+    <Param Name="Window" Type="int">1</Param>
+    <Param Name="AverageType" Type="int">0</Param>
+    <Param Name="Averages" Type="int">10</Param>
+    <Param Name="N" Type="int">{N}</Param>
+    <Param Name="M" Type="int">{M}</Param>
+    <Param Name="ChannelA" Type="string" Unit="channel">{chnA}</Param>
+{channelB}    <Array Type="{array_type}">
+      <Dim>{dims}</Dim>
+      <Stream Encoding="LittleEndian,base64">
+{stream}
+      </Stream>
+    </Array>
+  </LIGO_LW>
+"""
+
+
+def _stream_text(data):
+    text = base64.b64encode(np.ascontiguousarray(data).tobytes()).decode('ascii')
+    return '\n'.join(text[idx:idx + 64] for idx in range(0, len(text), 64))
+
+
+def synthetic_channels(n_channels):
+    return ['X1:SYN-CHAN_{0}_DQ'.format(idx) for idx in range(n_channels)]
+
+
+def write_synthetic_dtt(
+    fname,
+    n_channels = 4,
+    N          = 1000,
+    df         = .1,
+    gps        = 1300000000.0,
+    seed       = 0,
+):
+    """
+    Write an FFT measurement with a PSD result for each channel and CSD and
+    COH results of each channel against the following ones, with an Index
+    naming them. Returns the list of channels.
+    """
+    rng = np.random.RandomState(seed)
+    channels = synthetic_channels(n_channels)
+    results = []
+    entries = dict(PowerSpectrum = [], CrossCorrelation = [], Coherence = [])
+
+    def add_result(entry_type, chnA, chnsB, subtype, data):
+        name = 'Result[{0}]'.format(len(results))
+        M = max(len(chnsB), 1)
+        channelB = ''.join(
+            '    <Param Name="ChannelB[{0}]" Type="string" Unit="channel">{1}</Param>\n'.format(idx, chn)
+            for idx, chn in enumerate(chnsB)
+        )
+        results.append(_SPECTRUM.format(
+            name       = name,
+            subtype    = subtype,
+            df         = df,
+            gps        = gps,
+            BW         = 1.5 * df,
+            N          = N,
+            M          = M,
+            chnA       = chnA,
+            channelB   = channelB,
+            array_type = 'floatComplex' if data.dtype.kind == 'c' else 'float',
+            dims       = N if not chnsB else '{0}</Dim>\n      <Dim>{1}'.format(M, N),
+            stream     = _stream_text(data),
+        ))
+        entries[entry_type].append((chnA, chnsB, name))
+
+    for idx, chn in enumerate(channels):
+        add_result('PowerSpectrum', chn, [], 1, rng.rand(N).astype('f4'))
+    for idx, chn in enumerate(channels[:-1]):
+        chnsB = channels[idx + 1:]
+        csd = (rng.randn(len(chnsB), N) + 1j * rng.randn(len(chnsB), N)).astype('c8')
+        add_result('CrossCorrelation', chn, chnsB, 2, csd)
+        add_result('Coherence', chn, chnsB, 3, rng.rand(len(chnsB), N).astype('f4'))
+
+    index = [
+        '  <LIGO_LW Name="Index" Type="Index">\n',
+        '    <Param Name="Flag" Type="string">Result</Param>\n',
+        '    <Param Name="Entry[0]" Type="string">MasterIndex:\n',
+        ';\n'.join(
+            '      Entry[{0}] = {1}'.format(idx, entry)
+            for idx, entry in enumerate(['MasterIndex'] + ['{0}[0]'.format(k) for k in entries])
+        ),
+        ';</Param>\n',
+    ]
+    for idx_entry, (entry_type, rows) in enumerate(entries.items()):
+        lines = ['{0}[0]:'.format(entry_type)]
+        if entry_type == 'PowerSpectrum':
+            for idx, (chnA, chnsB, name) in enumerate(rows):
+                lines.append('Channel[{0}] = {1};'.format(idx, chnA))
+                lines.append('Name[{0}] = {1};'.format(idx, name))
+                lines.append('Offset[{0}] = 0;'.format(idx))
+                lines.append('Length[{0}] = {1};'.format(idx, N))
+        else:
+            for idx, chn in enumerate(channels):
+                lines.append('ChannelA[{0}] = {1};'.format(idx, chn))
+            for idx, chn in enumerate(channels):
+                lines.append('ChannelB[{0}] = {1};'.format(idx, chn))
+            for idx, (chnA, chnsB, name) in enumerate(rows):
+                for chnB in chnsB:
+                    idx_B = channels.index(chnB)
+                    lines.append('Name[{0}][{1}] = {2};'.format(idx, idx_B, name))
+                    lines.append('Offset[{0}][{1}] = {2};'.format(idx, idx_B, chnsB.index(chnB) * N))
+                    lines.append('Length[{0}][{1}] = {2};'.format(idx, idx_B, N))
+        index.append('    <Param Name="Entry[{0}]" Type="string">{1}</Param>\n'.format(
+            idx_entry + 1, '\n      '.join(lines)
+        ))
+    index.append('  </LIGO_LW>\n')
+
+    with open(fname, 'w') as F:
+        F.write(_HEADER.format(gps = gps))
+        F.write(''.join(index))
+        for result in results:
+            F.write(result)
+        F.write('</LIGO_LW>\n')
+    return channels
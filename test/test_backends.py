@@ -0,0 +1,67 @@
+
+import time
+import glob
+import pytest
+
+import dttxml
+from dttxml import backends
+
+from test_parse import assert_items_equal
+from synthetic_dtt import write_synthetic_dtt
+
+
+def available_backends():
+    names = ['etree', 'expat']
+    if backends.lxml_etree is not None:
+        names.append('lxml')
+    return names
+
+
+def test_backends_match(fpath_join, tpath_join):
+    fpaths = [
+        fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml'),
+        fpath_join('data', 'test_DTT_20_f_pts.xml'),
+        tpath_join('synthetic.xml'),
+    ]
+    channels = write_synthetic_dtt(fpaths[-1], n_channels = 3, N = 50)
+
+    for fpath in fpaths:
+        items_ref = dttxml.dtt_read(fpath, backend = 'etree')
+        for backend in available_backends():
+            for streaming in [False, True]:
+                items = dttxml.dtt_read(fpath, backend = backend, streaming = streaming)
+                assert_items_equal(items_ref, items)
+
+    items = dttxml.dtt_read(fpaths[-1], backend = 'expat')
+    assert(set(items.results.keys()) == {'PSD', 'CSD', 'COH'})
+    assert(list(items.results.CSD[channels[0]].channelB) == channels[1:])
+
+
+def test_backend_selection(monkeypatch):
+    monkeypatch.setenv(backends.ENV_VAR, 'expat')
+    assert(backends.get_backend().name == 'expat')
+    assert(backends.get_backend('etree').name == 'etree')
+    monkeypatch.delenv(backends.ENV_VAR)
+    if backends.lxml_etree is not None:
+        assert(backends.get_backend().name == 'lxml')
+    else:
+        assert(backends.get_backend().name == 'etree')
+    with pytest.raises(ValueError):
+        backends.get_backend('sax')
+
+
+def test_backend_benchmark(request, fpath_join, tpath_join, pprint):
+    if not request.config.getvalue('--do-stresstest'):
+        pytest.skip("benchmark only runs with --do-stresstest")
+    fpaths = sorted(glob.glob(fpath_join('data', '*.xml')))
+    fpath_large = tpath_join('synthetic_large.xml')
+    write_synthetic_dtt(fpath_large, n_channels = 16, N = 20000)
+    fpaths.append(fpath_large)
+
+    for fpath in fpaths:
+        for backend in available_backends():
+            for streaming in [False, True]:
+                t_start = time.perf_counter()
+                dttxml.dtt_read(fpath, backend = backend, streaming = streaming)
+                t_end = time.perf_counter()
+                pprint(fpath.split('/')[-1], backend, streaming, '{0:.4f}s'.format(t_end - t_start))
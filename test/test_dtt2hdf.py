@@ -0,0 +1,347 @@
+
+import pytest
+import numpy as np
+
+import dttxml
+from dttxml.dtt2bunch import dtt2bunch_iter
+
+from synthetic_dtt import write_synthetic_dtt
+
+h5py = pytest.importorskip('h5py')
+
+
+def hdf_contents(fpath):
+    contents = {}
+    def visit(name, item):
+        if isinstance(item, h5py.Dataset):
+            contents[name] = item[()]
+        else:
+            contents[name] = None
+    with h5py.File(fpath, 'r') as F:
+        F.visititems(visit)
+    return contents
+
+
+def assert_hdf_equal(fpath_A, fpath_B):
+    contents_A = hdf_contents(fpath_A)
+    contents_B = hdf_contents(fpath_B)
+    assert(sorted(contents_A.keys()) == sorted(contents_B.keys()))
+    for key, value in contents_A.items():
+        if value is None:
+            assert(contents_B[key] is None)
+        else:
+            np.testing.assert_array_equal(value, contents_B[key])
+
+
+def test_release(fpath_join):
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    access = dttxml.DiagAccess(fpath, lazy = True, indexed = True)
+    xfer = access.xfer('H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_IN1').xfer
+    assert(access.release() > 0)
+    assert('xfer' in access.results.TF['H1:LSC-DARM1_IN2'].deferred_keys)
+    np.testing.assert_array_equal(
+        xfer,
+        access.xfer('H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_IN1').xfer,
+    )
+
+    #without the file to read back from, the arrays are kept
+    access = dttxml.DiagAccess(fpath, lazy = True)
+    access.xfer('H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_IN1').xfer
+    assert(access.release() == 0)
+
+
+def test_dtt2hdf_stream(fpath_join, tpath_join):
+    from dttxml.dtt2hdf import dtt2hdf
+    fpath_synthetic = tpath_join('synthetic.xml')
+    write_synthetic_dtt(fpath_synthetic, n_channels = 5, N = 100)
+    for fpath in [
+        fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml'),
+        fpath_synthetic,
+    ]:
+        dtt2hdf(fpath, tpath_join('stream.h5'), stream = True)
+        dtt2hdf(fpath, tpath_join('memory.h5'), stream = False)
+        assert_hdf_equal(tpath_join('stream.h5'), tpath_join('memory.h5'))
+
+    #each item is produced once, including those of the inverted pairs
+    paths = [path for path, value in dtt2bunch_iter(fpath_synthetic, lazy = True, indexed = True)]
+    assert(len(paths) == len(set(paths)))
+    assert(('XFER', 'X1:SYN-CHAN_4_DQ', 'X1:SYN-CHAN_0_DQ') in paths)
+
+
+def test_dtt2hdf_batch(fpath_join, tpath_join):
+    import os
+    import shutil
+    from dttxml.dtt2hdf import main
+    dpath_in = tpath_join('batch_in')
+    dpath_out = tpath_join('batch_out')
+    shutil.rmtree(dpath_in, ignore_errors = True)
+    shutil.rmtree(dpath_out, ignore_errors = True)
+    os.makedirs(os.path.join(dpath_in, 'sub'))
+    shutil.copy(
+        fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml'),
+        os.path.join(dpath_in, 'measurement.xml'),
+    )
+    write_synthetic_dtt(os.path.join(dpath_in, 'sub', 'synthetic.xml'), n_channels = 3, N = 50)
+    with open(os.path.join(dpath_in, 'sub', 'broken.xml'), 'w') as F:
+        F.write('<LIGO_LW')
+
+    assert(main([dpath_in, '-r', '-o', dpath_out, '-j', '2', '-q']) == 1)
+    fpaths_out = [
+        os.path.join(dpath_out, 'measurement.h5'),
+        os.path.join(dpath_out, 'sub', 'synthetic.h5'),
+    ]
+    mtimes = [os.stat(fpath).st_mtime_ns for fpath in fpaths_out]
+    assert(not os.path.exists(os.path.join(dpath_out, 'sub', 'broken.h5')))
+    assert(sorted(os.listdir(os.path.join(dpath_out, 'sub'))) == ['synthetic.h5'])
+
+    #the outputs newer than their input are skipped
+    os.remove(os.path.join(dpath_in, 'sub', 'broken.xml'))
+    assert(main([dpath_in, '-r', '-o', dpath_out, '-q']) == 0)
+    assert(mtimes == [os.stat(fpath).st_mtime_ns for fpath in fpaths_out])
+
+    #the single file form and glob patterns
+    fpath_to = tpath_join('single.h5')
+    assert(main([os.path.join(dpath_in, 'meas*.xml'), fpath_to, '-q']) == 0)
+    assert_hdf_equal(fpath_to, fpaths_out[0])
+
+
+def test_dtt2hdf_write_options(tpath_join):
+    from dttxml.dtt2hdf import dtt2hdf, main
+    from dttxml.hdf_deep_bunch import HDFDeepBunch
+    fpath = tpath_join('synthetic.xml')
+    chns = write_synthetic_dtt(fpath, n_channels = 3, N = 1000)
+    fpath_plain = tpath_join('plain.h5')
+    fpath_packed = tpath_join('packed.h5')
+    dtt2hdf(fpath, fpath_plain)
+    dtt2hdf(fpath, fpath_packed, write_options = dict(
+        chunks       = 256,
+        compression  = 'gzip',
+        shuffle      = True,
+        float32      = True,
+        scalar_attrs = True,
+    ))
+
+    with h5py.File(fpath_plain, 'r') as F_plain, h5py.File(fpath_packed, 'r') as F_packed:
+        dataset = F_packed['CSD'][chns[0]][chns[1]]
+        assert(dataset.chunks == (256,))
+        assert(dataset.compression == 'gzip')
+        assert(dataset.shuffle)
+        assert(dataset.dtype == F_plain['CSD'][chns[0]][chns[1]].dtype)
+        assert('gps_second' in F_packed.attrs)
+        assert('gps_second' not in F_packed)
+
+        #the attributes read back as the datasets did
+        plain = HDFDeepBunch(F_plain)
+        packed = HDFDeepBunch(F_packed)
+        assert(sorted(plain.keys()) == sorted(packed.keys()))
+        assert(packed.gps_second == plain.gps_second)
+        assert(packed.averages == plain.averages)
+        #the linear frequency axis is computed in double precision
+        assert(packed.FHz.dtype == np.float32)
+        np.testing.assert_allclose(packed.FHz, plain.FHz, rtol = 1e-6)
+        np.testing.assert_array_equal(packed.XFER[chns[1]][chns[2]], plain.XFER[chns[1]][chns[2]])
+
+    fpath_cli = tpath_join('cli.h5')
+    assert(main([fpath, fpath_cli, '-q', '--compression', 'lzf', '--chunks', 'auto']) == 0)
+    with h5py.File(fpath_cli, 'r') as F:
+        assert(F['ASD'][chns[0]].compression == 'lzf')
+
+    with pytest.raises(TypeError):
+        dtt2hdf(fpath, fpath_cli, write_options = dict(compresion = 'gzip'))
+
+
+def test_hdf_archive(tpath_join):
+    import os
+    from dttxml.hdf_archive import HDFArchive
+    from dttxml.dtt2hdf import main
+    fpaths = []
+    for idx in range(4):
+        fpath = tpath_join('measurement_{0}.xml'.format(idx))
+        #the third measurement is missing a channel
+        chns = write_synthetic_dtt(
+            fpath,
+            n_channels = 2 if idx == 2 else 3,
+            N          = 100,
+            gps        = 1300000000.0 + 600 * idx,
+            seed       = idx,
+        )
+        fpaths.append(fpath)
+    #with a channel more, on another grid or at the time of an archived one
+    fpath_other = tpath_join('other_grid.xml')
+    write_synthetic_dtt(fpath_other, n_channels = 4, N = 200, gps = 1300009000.0)
+    fpath_copy = tpath_join('measurement_copy.xml')
+    write_synthetic_dtt(fpath_copy, n_channels = 4, N = 100, gps = 1300000000.0)
+
+    fpath_archive = tpath_join('archive.h5')
+    if os.path.exists(fpath_archive):
+        os.remove(fpath_archive)
+    with HDFArchive(fpath_archive) as archive:
+        #appended out of time order
+        for fpath in [fpaths[1], fpaths[0], fpaths[2]]:
+            assert(archive.append(fpath) is not None)
+        assert(archive.append(fpaths[0]) is None)
+        keys = archive.keys()
+        assert(archive.append(fpath_copy) is None)
+        with pytest.raises(ValueError):
+            archive.append(fpath_other)
+        assert(len(archive) == 3)
+        assert(archive.keys() == keys)
+        assert(archive.hdf['ASD'][chns[0]].shape == (3, 100))
+
+    assert(main([fpaths[3], fpaths[2], '--append', fpath_archive, '-q']) == 0)
+    with HDFArchive(fpath_archive, mode = 'r') as archive:
+        assert(len(archive) == 4)
+        gps, asd = archive.trend('ASD', chns[0])
+        np.testing.assert_array_equal(gps, 1300000000.0 + 600 * np.arange(4))
+        for idx, fpath in enumerate(fpaths):
+            access = dttxml.DiagAccess(fpath)
+            np.testing.assert_array_equal(asd[idx], access.asd(chns[0]).asd)
+        gps, xfer = archive.trend('XFER', chns[2], chns[0], gps_start = 1300000600.0, gps_end = 1300001800.0)
+        assert(list(gps) == [1300000600.0, 1300001200.0])
+        np.testing.assert_array_equal(
+            xfer[0],
+            dttxml.DiagAccess(fpaths[1]).xfer(chns[2], chns[0]).xfer,
+        )
+        #backfilled for the measurement without the channel
+        assert(np.all(np.isnan(xfer[1])))
+        assert(archive.hdf['index']['averages'].shape == (4,))
+
+    #float32 only for the arrays, the GPS times stay apart
+    fpath_archive = tpath_join('archive_float32.h5')
+    if os.path.exists(fpath_archive):
+        os.remove(fpath_archive)
+    fpath_close = tpath_join('measurement_close.xml')
+    write_synthetic_dtt(fpath_close, n_channels = 3, N = 100, gps = 1300000030.0)
+    with HDFArchive(fpath_archive, write_options = dict(float32 = True)) as archive:
+        assert(archive.append(fpaths[0]) == 0)
+        assert(archive.append(fpath_close) == 1)
+        assert(archive.hdf['ASD'][chns[0]].dtype == np.float32)
+        assert(archive.hdf['index']['gps_second'].dtype == np.float64)
+        assert(list(archive.gps_second) == [1300000000.0, 1300000030.0])
+        assert(archive.rows(gps_start = 1300000010.0) == slice(1, 2))
+
+
+def test_watch(tpath_join):
+    import os
+    import shutil
+    from dttxml.watch import Watcher
+    from dttxml.dtt2hdf import main
+    dpath_in = tpath_join('watch_in')
+    dpath_out = tpath_join('watch_out')
+    shutil.rmtree(dpath_in, ignore_errors = True)
+    shutil.rmtree(dpath_out, ignore_errors = True)
+    os.makedirs(dpath_in)
+    write_synthetic_dtt(os.path.join(dpath_in, 'first.xml'), n_channels = 2, N = 50)
+
+    watcher = Watcher(dpath_in, output_dir = dpath_out, poll_interval = 0, stable_polls = 1)
+    #not stable until seen unchanged on a second poll
+    assert(watcher.poll() == 0)
+    #a file still being written
+    fpath_partial = os.path.join(dpath_in, 'second.xml')
+    with open(fpath_partial, 'w') as F:
+        F.write('<?xml version="1.0"?>\n')
+    assert(watcher.poll() == 1)
+    assert(os.path.exists(os.path.join(dpath_out, 'first.h5')))
+    write_synthetic_dtt(fpath_partial, n_channels = 2, N = 50, seed = 1)
+    assert(watcher.poll() == 0)
+    watcher.run(max_polls = 2)
+    assert(os.path.exists(os.path.join(dpath_out, 'second.h5')))
+    assert(watcher.n_done == 2 and watcher.n_failed == 0)
+    #no temporary files left behind
+    assert(sorted(f for f in os.listdir(dpath_out) if not f.startswith('.')) == ['first.h5', 'second.h5'])
+
+    #a restarted watcher skips the files done
+    with Watcher(dpath_in, output_dir = dpath_out, poll_interval = 0, stable_polls = 1, workers = 2) as watcher:
+        for idx in range(3):
+            watcher.poll()
+    assert(watcher.executor is None)
+    assert(watcher.n_done == 0)
+
+    #over a pool of workers, through the command line
+    write_synthetic_dtt(os.path.join(dpath_in, 'third.xml'), n_channels = 2, N = 50, seed = 2)
+    assert(main([
+        dpath_in, '--watch', '-o', dpath_out, '-j', '2', '-q',
+        '--poll-interval', '0', '--max-polls', '4',
+    ]) == 0)
+    assert(os.path.exists(os.path.join(dpath_out, 'third.h5')))
+
+
+def test_hdf_lazy(tpath_join):
+    from dttxml.dtt2hdf import dtt2hdf
+    from dttxml.hdf_deep_bunch import HDFDeepBunch, HDFDatasetProxy
+    fpath = tpath_join('synthetic.xml')
+    chns = write_synthetic_dtt(fpath, n_channels = 3, N = 1000)
+    fpath_to = tpath_join('lazy.h5')
+    dtt2hdf(fpath, fpath_to, write_options = dict(chunks = 100))
+
+    with h5py.File(fpath_to, 'r') as F:
+        eager = HDFDeepBunch(F)
+        lazy = HDFDeepBunch(F, lazy = True)
+        proxy = lazy.XFER[chns[1]][chns[0]]
+        xfer = eager.XFER[chns[1]][chns[0]]
+        assert(isinstance(proxy, HDFDatasetProxy))
+        assert(proxy.shape == xfer.shape and proxy.dtype == xfer.dtype)
+        assert(len(proxy) == len(xfer) and proxy.ndim == 1)
+        np.testing.assert_array_equal(proxy[100:200:3], xfer[100:200:3])
+        np.testing.assert_array_equal(np.asarray(proxy), xfer)
+        np.testing.assert_array_equal(np.abs(proxy), np.abs(xfer))
+        #the single values are read as before
+        assert(lazy.gps_second == eager.gps_second)
+
+        #the group handles are looked up once
+        assert(lazy.XFER[chns[1]]._hdf is lazy.XFER[chns[1]]._hdf)
+
+
+def test_from_hdf(fpath_join, tpath_join):
+    from dttxml.dtt2hdf import dtt2hdf
+    fpath = tpath_join('synthetic.xml')
+    chns = write_synthetic_dtt(fpath, n_channels = 3, N = 100)
+    fpath_to = tpath_join('from_hdf.h5')
+    dtt2hdf(fpath, fpath_to, write_options = dict(scalar_attrs = True))
+    access = dttxml.DiagAccess(fpath)
+    access_hdf = dttxml.DiagAccess.from_hdf(fpath_to)
+    assert(access.hdf is None)
+    assert(access_hdf.channels() == access.channels())
+    #nothing read but the metadata
+    assert(access_hdf.results.PSD[chns[0]].deferred_keys == ['PSD'])
+    assert(access_hdf.results.CSD[chns[0]].deferred_keys == ['CSD'])
+
+    np.testing.assert_array_equal(access_hdf.asd(chns[1]).asd, access.asd(chns[1]).asd)
+    np.testing.assert_array_equal(access_hdf.csd(chns[0], chns[2]).csd, access.csd(chns[0], chns[2]).csd)
+    np.testing.assert_array_equal(access_hdf.coh(chns[2], chns[0]).coh, access.coh(chns[2], chns[0]).coh)
+    np.testing.assert_array_equal(access_hdf.xfer(chns[2], chns[1]).xfer, access.xfer(chns[2], chns[1]).xfer)
+    np.testing.assert_array_equal(
+        access_hdf.xfer_via(chns[0], chns[1], chns[2]).xfer,
+        access.xfer_via(chns[0], chns[1], chns[2]).xfer,
+    )
+    holder = access_hdf.xfer(chns[0], chns[1])
+    assert(holder.gps_second == access.xfer(chns[0], chns[1]).gps_second)
+    assert(holder.averages == access.xfer(chns[0], chns[1]).averages)
+    assert(access_hdf.release() > 0)
+    hdf = access_hdf.hdf
+    access_hdf.close()
+    assert(access_hdf.hdf is None and not hdf)
+
+    #the references come back as references
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    #overwritten, as the file is closed
+    dtt2hdf(fpath, fpath_to)
+    access = dttxml.DiagAccess(fpath)
+    with dttxml.DiagAccess.from_hdf(fpath_to) as access_hdf:
+        assert(access_hdf.reference_channels == access.reference_channels)
+        np.testing.assert_array_equal(
+            access_hdf.xfer('H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_IN1').xfer,
+            access.xfer('H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_IN1').xfer,
+        )
+        for chn_ref in access.reference_channels:
+            ref = access.results.TF.get(chn_ref, None)
+            if ref is not None:
+                np.testing.assert_array_equal(access_hdf.results.TF[chn_ref].xfer, ref.xfer)
+        hdf = access_hdf.hdf
+    assert(not hdf)
+
+    fpath_other = tpath_join('other.h5')
+    with h5py.File(fpath_other, 'w') as F:
+        F['data'] = np.arange(10)
+    with pytest.raises(ValueError):
+        dttxml.DiagAccess.from_hdf(fpath_other)
@@ -0,0 +1,622 @@
+import pytest
+import numpy as np
+
+import dttxml
+
+
+def assert_items_equal(a, b):
+    if isinstance(a, np.ndarray):
+        assert(isinstance(b, np.ndarray))
+        assert(a.dtype == b.dtype)
+        np.testing.assert_array_equal(a, b)
+    elif hasattr(a, 'items'):
+        assert(set(a.keys()) == set(b.keys()))
+        for k, v in a.items():
+            assert_items_equal(v, b[k])
+    elif isinstance(a, (list, tuple)):
+        assert(len(a) == len(b))
+        for v_a, v_b in zip(a, b):
+            assert_items_equal(v_a, v_b)
+    else:
+        assert(a == b)
+
+
+def test_streaming_matches_tree(fpath_join):
+    for fname in [
+        '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml',
+        'test_DTT_20_f_pts.xml',
+        'test_DTT_21_f_pts.xml',
+    ]:
+        fpath = fpath_join('data', fname)
+        items_tree = dttxml.dtt_read(fpath)
+        items_stream = dttxml.dtt_read(fpath, streaming = True)
+        assert_items_equal(items_tree, items_stream)
+
+
+def test_streaming_drops_nodes(fpath_join):
+    from dttxml import backends
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    names = ['etree']
+    if backends.lxml_etree is not None:
+        names.append('lxml')
+    for name in names:
+        backend = backends.get_backend(name)
+        nodes = []
+        for xml_node in backend.iter_nodes(fpath, streaming = True):
+            #those before are emptied as the parse goes on, not at its end
+            assert(len(xml_node) > 0)
+            for prev_node in nodes:
+                assert(len(prev_node) == 0 and not prev_node.attrib)
+            nodes.append(xml_node)
+        assert(len(nodes) > 2)
+
+        nodes = list(backend.iter_nodes(fpath, streaming = False))
+        assert(all(len(xml_node) > 0 for xml_node in nodes))
+
+
+def test_lazy_matches_eager(fpath_join):
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    items_eager = dttxml.dtt_read(fpath)
+    items_lazy = dttxml.dtt_read(fpath, lazy = True)
+
+    result = items_lazy.results.TF['H1:LSC-DARM1_IN2']
+    assert('xfer' in result.deferred_keys)
+    #metadata access does not decode
+    result.channelB_inv
+    assert('xfer' in result.deferred_keys)
+    result.xfer
+    assert(not result.deferred_keys)
+
+    assert_items_equal(items_eager, items_lazy)
+
+    access = dttxml.DiagAccess(fpath, lazy = True)
+    xfer = access.xfer('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2')
+    np.testing.assert_array_equal(
+        xfer.xfer,
+        items_eager.results.TF['H1:LSC-DARM1_IN2'].xfer[1],
+    )
+
+
+def test_filters(fpath_join):
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    items = dttxml.dtt_read(
+        fpath,
+        channels = ['H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2'],
+        types = ('TF',),
+        references = False,
+    )
+    assert(not items.references)
+    assert(set(items.results.keys()) == {'TF'})
+    assert(set(items.results.TF.keys()) == {'H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2'})
+
+    items_full = dttxml.dtt_read(fpath)
+    assert_items_equal(
+        items.results.TF['H1:LSC-DARM1_IN2'],
+        items_full.results.TF['H1:LSC-DARM1_IN2'],
+    )
+
+    bunch = dttxml.dtt2bunch(fpath, channels = ['H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2'])
+    assert(set(bunch.XFER.mydict.keys()) == {'H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2'})
+
+
+def test_indexed(fpath_join, tpath_join):
+    import shutil
+    from dttxml.sections import SectionIndex
+
+    fpath = tpath_join('measurement.xml')
+    shutil.copy(
+        fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml'),
+        fpath,
+    )
+    index = SectionIndex.open(fpath, sidecar = True)
+    assert(index.by_name['Result[3]']['payload'] is not None)
+    index_loaded = SectionIndex.open(fpath, sidecar = True)
+    assert(index_loaded.sections == index.sections)
+
+    items_eager = dttxml.dtt_read(fpath)
+    items_indexed = dttxml.dtt_read(fpath, indexed = index_loaded, lazy = True)
+    result = items_indexed.results.TF['H1:LSC-DARM1_IN2']
+    assert('xfer' in result.deferred_keys)
+    assert_items_equal(items_eager, items_indexed)
+
+    access = dttxml.DiagAccess(fpath, indexed = 'sidecar', lazy = True)
+    np.testing.assert_array_equal(
+        access.coh('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2').coh,
+        items_eager.results.COH['H1:LSC-DARM1_IN1'].coherence[2],
+    )
+
+
+def test_index_lookup(fpath_join):
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    access = dttxml.DiagAccess(fpath)
+    assert(access.index.lookup[(
+        'TransferFunction', 'H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_IN1'
+    )] == ('Result[2]', 92, 46))
+
+    result, row = access.index_lookup('TransferFunction', 'H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_IN1')
+    assert(result is access.results.TF['H1:LSC-DARM1_IN2'])
+    np.testing.assert_array_equal(
+        result.xfer[row],
+        access.xfer('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2').xfer,
+    )
+
+    fpath = fpath_join('data', 'test_DTT_20_f_pts.xml')
+    access = dttxml.DiagAccess(fpath)
+    result, row = access.index_lookup('PowerSpectrum', 'H1:PEM-EX_SEIS_VEA_FLOOR_Z_DQ')
+    assert(result is access.results.PSD['H1:PEM-EX_SEIS_VEA_FLOOR_Z_DQ'])
+
+
+_COEFFICIENTS_NODE = """  <LIGO_LW Name="{name}" Type="Coefficients">
+    <Param Name="Subtype" Type="int">0</Param>
+    <Param Name="ChannelA[0]" Type="string" Unit="channel">X1:SYN-EXC</Param>
+    <Param Name="ChannelB[0]" Type="string" Unit="channel">X1:SYN-RESP</Param>
+    <Array Type="floatComplex">
+      <Dim>3</Dim>
+      <Dim>2</Dim>
+      <Stream Encoding="LittleEndian,base64">{stream}</Stream>
+    </Array>
+  </LIGO_LW>
+"""
+
+
+def test_index_coefficients(tpath_join):
+    import base64
+    from synthetic_dtt import _HEADER
+    #numbered entries whose Name lines are numbered, or not
+    entries = [
+        'TransferCoefficients[0]:\n      Name[0] = Result[0];',
+        'CoherenceCoefficients[0]:\n      Name = Result[1];',
+        'TransferCoefficients[1]:\n      Name = Result[2];',
+    ]
+    data = (np.arange(6) + 1j * np.arange(6)).astype('c8').reshape(3, 2)
+    stream = base64.b64encode(data.tobytes()).decode('ascii')
+    fpath = tpath_join('coefficients.xml')
+    with open(fpath, 'w') as F:
+        F.write(_HEADER.format(gps = 1300000000.0))
+        F.write('  <LIGO_LW Name="Index" Type="Index">\n')
+        for idx, entry in enumerate(entries):
+            F.write('    <Param Name="Entry[{0}]" Type="string">{1}</Param>\n'.format(idx + 1, entry))
+        F.write('  </LIGO_LW>\n')
+        for idx in range(2):
+            F.write(_COEFFICIENTS_NODE.format(name = 'Result[{0}]'.format(idx), stream = stream))
+        F.write('</LIGO_LW>\n')
+
+    for streaming in [False, True]:
+        with pytest.warns(UserWarning, match = r'Result\[2\]'):
+            items = dttxml.dtt_read(fpath, streaming = streaming)
+        assert(set(items.results.keys()) == {'TransferCoefficients', 'CoherenceCoefficients'})
+        assert(items.by_name['Result[0]'] is items.results.TransferCoefficients)
+        assert(items.by_name['Result[1]'] is items.results.CoherenceCoefficients)
+        np.testing.assert_array_equal(items.results.TransferCoefficients.coeffs, data[:, 1:])
+        np.testing.assert_array_equal(items.results.CoherenceCoefficients.coeffs, data[:, 1:].real)
+    #the entries of a type are kept apart
+    assert(items.index.names[('TransferCoefficients', 0, None)] == 'Result[0]')
+    assert(items.index.names[('TransferCoefficients', 1, None)] == 'Result[2]')
+    assert(items.index.names[('CoherenceCoefficients', 0, None)] == 'Result[1]')
+
+
+def test_read_many(fpath_join):
+    import pickle
+    fpaths = [
+        fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml'),
+        fpath_join('data', 'does_not_exist.xml'),
+        fpath_join('data', 'test_DTT_20_f_pts.xml'),
+        fpath_join('data', 'test_DTT_21_f_pts.xml'),
+    ]
+    items = dttxml.dtt_read(fpaths[0], lazy = True)
+    assert_items_equal(items, pickle.loads(pickle.dumps(items, protocol = 5)))
+
+    for workers in [1, 2]:
+        items_many = dttxml.dtt_read_many(fpaths, workers = workers)
+        assert(len(items_many) == len(fpaths))
+        assert(isinstance(items_many[1], Exception))
+        for fpath, items in zip(fpaths, items_many):
+            if fpath is fpaths[1]:
+                continue
+            assert_items_equal(dttxml.dtt_read(fpath), items)
+        result = items_many[0].results.TF['H1:LSC-DARM1_IN2']
+        assert(items_many[0].by_name['Result[2]'] is result)
+        assert(result.xfer.flags.writeable)
+
+    accesses = dttxml.DiagAccess.open_many(fpaths, workers = 2, types = ('TF',))
+    assert(isinstance(accesses[1], Exception))
+    np.testing.assert_array_equal(
+        accesses[0].xfer('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2').xfer,
+        dttxml.DiagAccess(fpaths[0]).xfer('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2').xfer,
+    )
+
+
+def test_read_many_unlinks(fpath_join, monkeypatch):
+    import os
+    from dttxml import parallel
+    if not os.path.isdir('/dev/shm'):
+        pytest.skip("no /dev/shm to check")
+    fpaths = [
+        fpath_join('data', 'test_DTT_20_f_pts.xml'),
+        fpath_join('data', 'test_DTT_21_f_pts.xml'),
+    ]
+    def unpack_fails(payload, name, spans):
+        raise ValueError("unreadable")
+    monkeypatch.setattr(parallel, '_unpack_shared', unpack_fails)
+    blocks = set(os.listdir('/dev/shm'))
+    items_many = dttxml.dtt_read_many(fpaths, workers = 2)
+    assert(all(isinstance(items, ValueError) for items in items_many))
+    #the blocks of the files which failed to unpack are not left behind
+    assert(set(os.listdir('/dev/shm')) - blocks == set())
+
+
+def test_read_many_benchmark(request, tpath_join, pprint):
+    import os
+    import time
+    from synthetic_dtt import write_synthetic_dtt
+    if not request.config.getvalue('--do-stresstest'):
+        pytest.skip("benchmark only runs with --do-stresstest")
+    fpaths = []
+    for idx in range(16):
+        fpath = tpath_join('synthetic_{0}.xml'.format(idx))
+        write_synthetic_dtt(fpath, n_channels = 12, N = 20000, seed = idx)
+        fpaths.append(fpath)
+
+    workers = 1
+    while True:
+        t_start = time.perf_counter()
+        dttxml.dtt_read_many(fpaths, workers = workers)
+        pprint(workers, 'workers', '{0:.3f}s'.format(time.perf_counter() - t_start))
+        if workers >= (os.cpu_count() or 1):
+            break
+        workers = min(2 * workers, os.cpu_count())
+
+
+def test_parse_cache(fpath_join, tpath_join):
+    import os
+    import shutil
+    from dttxml.cache import ParseCache
+
+    fpath = tpath_join('measurement.xml')
+    shutil.copy(
+        fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml'),
+        fpath,
+    )
+    cache_dir = tpath_join('cache')
+    shutil.rmtree(cache_dir, ignore_errors = True)
+    cache = ParseCache(cache_dir)
+
+    items = dttxml.dtt_read(fpath)
+    items_cold = cache.read(fpath)
+    assert(len(cache.entries()) == 1)
+    items_warm = cache.read(fpath)
+    assert(len(cache.entries()) == 1)
+    for items_cached in [items_cold, items_warm]:
+        assert_items_equal(items, items_cached)
+        result = items_cached.results.TF['H1:LSC-DARM1_IN2']
+        assert(isinstance(result.xfer, np.memmap))
+        assert(items_cached.by_name['Result[2]'] is result)
+
+    #the filters are part of the key
+    cache.read(fpath, types = ['TF'])
+    assert(len(cache.entries()) == 2)
+
+    access = dttxml.DiagAccess(fpath, cache_dir = cache_dir)
+    np.testing.assert_array_equal(
+        access.xfer('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2').xfer,
+        items.results.TF['H1:LSC-DARM1_IN2'].xfer[1],
+    )
+
+    #a modified file misses
+    stat = os.stat(fpath)
+    os.utime(fpath, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    cache.read(fpath)
+    assert(len(cache.entries()) == 3)
+
+    cache.evict(max_bytes = 1)
+    assert(len(cache.entries()) == 0)
+
+    cache_hash = ParseCache(cache_dir, hash_content = True)
+    cache_hash.read(fpath)
+    fpath_copy = tpath_join('measurement_copy.xml')
+    shutil.copy(fpath, fpath_copy)
+    assert(cache_hash.key(fpath) == cache_hash.key(fpath_copy))
+
+
+def test_access_cached(fpath_join, tpath_join):
+    import os
+    import shutil
+    from dttxml.access import ACCESS_CACHE
+
+    fpath = tpath_join('measurement.xml')
+    shutil.copy(
+        fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml'),
+        fpath,
+    )
+    ACCESS_CACHE.clear()
+    stats = ACCESS_CACHE.stats()
+    access = dttxml.DiagAccess.cached(fpath)
+    assert(access.nbytes() > 0)
+    assert(dttxml.DiagAccess.cached(fpath) is access)
+    assert(dttxml.DiagAccess.cached(fpath, types = ['TF']) is not access)
+    assert(ACCESS_CACHE.stats()['hits'] == stats['hits'] + 1)
+    assert(ACCESS_CACHE.stats()['misses'] == stats['misses'] + 2)
+
+    stat = os.stat(fpath)
+    os.utime(fpath, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert(dttxml.DiagAccess.cached(fpath) is not access)
+    assert(ACCESS_CACHE.stats()['invalidations'] == stats['invalidations'] + 1)
+
+    max_bytes = ACCESS_CACHE.max_bytes
+    try:
+        ACCESS_CACHE.configure(max_bytes = access.nbytes())
+        assert(len(ACCESS_CACHE) == 1)
+    finally:
+        ACCESS_CACHE.configure(max_bytes = max_bytes)
+        ACCESS_CACHE.clear()
+
+    #the arrays decoded after the put count on the next hit
+    access = dttxml.DiagAccess.cached(fpath, lazy = True)
+    nbytes = ACCESS_CACHE.nbytes
+    for result in access.by_name.values():
+        result.resolve()
+    nbytes_resolved = access.nbytes()
+    assert(nbytes_resolved > nbytes)
+    assert(dttxml.DiagAccess.cached(fpath, lazy = True) is access)
+    assert(ACCESS_CACHE.nbytes == nbytes_resolved)
+    ACCESS_CACHE.clear()
+
+
+def test_memoized_holders(fpath_join, tpath_join):
+    from synthetic_dtt import write_synthetic_dtt
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    access = dttxml.DiagAccess(fpath)
+    xfer = access.xfer('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2')
+    assert(access.xfer('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2') is xfer)
+    assert(xfer.SNR_estimate is xfer.SNR_estimate)
+    assert(xfer.coh_obj is access.coh('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2'))
+    #shared by the callers, so not to be modified in place
+    with pytest.raises(ValueError):
+        xfer.xfer *= 2
+    with pytest.raises(ValueError):
+        xfer.SNR_estimate[0] = 0
+
+    via = access.xfer_via('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_EXC')
+    np.testing.assert_array_equal(
+        via.coh_nv,
+        access.coh('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_EXC').coh,
+    )
+    np.testing.assert_array_equal(via.coh_nd, xfer.coh)
+    access.clear_holders()
+    assert(access.xfer('H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2') is not xfer)
+
+    fpath = tpath_join('synthetic.xml')
+    chn_A, chn_B, chn_C = write_synthetic_dtt(fpath, n_channels = 3, N = 50)
+    access = dttxml.DiagAccess(fpath)
+    xfer = access.xfer(chn_B, chn_A)
+    assert(xfer.asd_den_obj is access.asd(chn_A))
+    np.testing.assert_array_equal(xfer.asd_den, access.asd(chn_A).asd)
+    np.testing.assert_array_equal(xfer.xfer, xfer.csd / xfer.asd_den**2)
+
+
+def test_pair_index(fpath_join, capsys):
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    access = dttxml.DiagAccess(fpath, lazy = True)
+    result, row, inverted = access.pair('TF', 'H1:LSC-DARM1_IN2', 'H1:LSC-DARM1_IN1')
+    assert(result is access.results.TF['H1:LSC-DARM1_IN2'])
+    assert(not inverted)
+    assert(result.channelB[row] == 'H1:LSC-DARM1_IN1')
+    #the index is built without decoding the data
+    assert('xfer' in result.deferred_keys)
+
+    result, row, inverted = access.pair('TF', 'H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2(REF0)')
+    assert(inverted)
+    assert(result is access.references[0])
+
+    chns = ['H1:LSC-DARM1_EXC', 'H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2']
+    assert(set(access.pairs('TF')) >= set((a, b) for a in chns for b in chns))
+    channels_A, channels_B = access.channels()
+    assert(set(chns) <= channels_A)
+    channels_A.clear()
+    assert(access.channels()[0])
+    with pytest.raises(KeyError):
+        access.pair('TF', 'H1:LSC-DARM1_IN1', 'H1:NOT-A_CHANNEL')
+    with pytest.raises(KeyError):
+        access.xfer('H1:LSC-DARM1_IN1', 'H1:NOT-A_CHANNEL')
+
+    fpath = fpath_join('data', 'test_DTT_20_f_pts.xml')
+    access = dttxml.DiagAccess(fpath)
+    result, row, inverted = access.pair('PSD', 'H1:PEM-EX_SEIS_VEA_FLOOR_Z_DQ')
+    assert(row is None)
+    assert(access.channels() == ({'H1:PEM-EX_SEIS_VEA_FLOOR_Z_DQ'}, set()))
+    access.channels_print()
+    assert(capsys.readouterr().out.split() == ['A-Channels:', 'H1:PEM-EX_SEIS_VEA_FLOOR_Z_DQ'])
+
+
+def test_matrices(fpath_join, tpath_join):
+    from synthetic_dtt import write_synthetic_dtt
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    access = dttxml.DiagAccess(fpath)
+    chns = ['H1:LSC-DARM1_EXC', 'H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2', 'H1:NOT-A_CHANNEL']
+    xfer = access.xfer_matrix(chns, chns[:3])
+    coh = access.coh_matrix(chns, chns[:3])
+    assert(xfer.xfer.shape == (4, 3, len(xfer.FHz)))
+    assert(xfer.xfer.flags.c_contiguous)
+    assert(not xfer.mask[3].any())
+    assert(np.isnan(xfer.xfer[3]).all())
+    for idx_num, chn_num in enumerate(chns[:3]):
+        for idx_den, chn_den in enumerate(chns[:3]):
+            assert(xfer.mask[idx_num, idx_den])
+            np.testing.assert_array_equal(
+                xfer.xfer[idx_num, idx_den],
+                access.xfer(chn_num, chn_den).xfer,
+            )
+            np.testing.assert_array_equal(
+                coh.coh[idx_num, idx_den],
+                access.coh(chn_num, chn_den).coh,
+            )
+
+    fpath = tpath_join('synthetic.xml')
+    chns = write_synthetic_dtt(fpath, n_channels = 4, N = 50)
+    access = dttxml.DiagAccess(fpath)
+    xfer = access.xfer_matrix(chns, chns)
+    csd = access.csd_matrix(chns, chns)
+    asd = access.asd_stack(chns)
+    assert(asd.asd.shape == (4, 50))
+    for idx_num, chn_num in enumerate(chns):
+        for idx_den, chn_den in enumerate(chns):
+            if idx_num == idx_den:
+                assert(not xfer.mask[idx_num, idx_den])
+                continue
+            np.testing.assert_array_equal(
+                xfer.xfer[idx_num, idx_den],
+                access.xfer(chn_num, chn_den).xfer,
+            )
+            np.testing.assert_array_equal(
+                csd.csd[idx_num, idx_den],
+                access.csd(chn_num, chn_den).csd,
+            )
+
+
+def test_interned_axes(fpath_join, tpath_join):
+    from synthetic_dtt import write_synthetic_dtt
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    for lazy in [False, True]:
+        items = dttxml.dtt_read(fpath, lazy = lazy)
+        results = list(items.results.TF.values()) + list(items.results.COH.values())
+        FHz = results[0].FHz
+        assert(not FHz.flags.writeable)
+        for result in results:
+            assert(result.FHz is FHz)
+
+    fpath = tpath_join('synthetic.xml')
+    chns = write_synthetic_dtt(fpath, n_channels = 3, N = 50)
+    items = dttxml.dtt_read(fpath)
+    FHz = items.results.PSD[chns[0]].FHz
+    assert(items.results.CSD[chns[0]].FHz is FHz)
+    assert(items.results.COH[chns[1]].FHz is FHz)
+
+
+def test_dtt2bunch_pairs(fpath_join, tpath_join):
+    from synthetic_dtt import write_synthetic_dtt
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    bunch = dttxml.dtt2bunch(fpath)
+    #the references go under REFS only
+    assert(set(bunch.XFER.mydict.keys()) == {
+        'H1:LSC-DARM1_EXC', 'H1:LSC-DARM1_IN1', 'H1:LSC-DARM1_IN2'
+    })
+    assert(len(bunch.REFS.mydict) == 5)
+
+    fpath = tpath_join('synthetic.xml')
+    chns = write_synthetic_dtt(fpath, n_channels = 4, N = 50)
+    access = dttxml.DiagAccess(fpath)
+    bunch = dttxml.dtt2bunch(
+        fpath,
+        channel_map      = {chns[0] : 'A', chns[1] : 'B'},
+        channels_exclude = {chns[3]},
+    )
+    assert(set(bunch.ASD.mydict.keys()) == {'A', 'B', chns[2]})
+    assert(set(bunch.CSD.B.mydict.keys()) == {'A', chns[2]})
+    np.testing.assert_array_equal(bunch.ASD.A, access.asd(chns[0]).asd)
+    np.testing.assert_array_equal(bunch.CSD.B.A, access.csd(chns[1], chns[0]).csd)
+    np.testing.assert_array_equal(bunch.XFER.A[chns[2]], access.xfer(chns[0], chns[2]).xfer)
+    np.testing.assert_array_equal(bunch.COH[chns[2]].B, access.coh(chns[2], chns[1]).coh)
+
+
+def dtt2bunch_all_pairs(access):
+    """
+    The arrays of every channel pair found by trying each, as dtt2bunch did
+    before visiting only the pairs present
+    """
+    chns_A, chns_B = access.channels()
+    chns = sorted(set(chns_A) | set(chns_B))
+    items = dict()
+    for chn_A in chns:
+        try:
+            items[('ASD', chn_A)] = access.asd(chn_A).asd
+        except KeyError:
+            pass
+        for chn_B in chns:
+            if chn_A == chn_B:
+                continue
+            try:
+                items[('CSD', chn_A, chn_B)] = access.csd(chn_A, chn_B).csd
+            except KeyError:
+                pass
+            try:
+                xfer = access.xfer(chn_A, chn_B)
+            except KeyError:
+                continue
+            items[('XFER', chn_A, chn_B)] = xfer.xfer
+            items[('COH', chn_A, chn_B)] = access.coh(chn_A, chn_B).coh
+            items[('XFER_SNR_EST', chn_A, chn_B)] = np.maximum(xfer.SNR_estimate**2 - 1, 0)
+    return items
+
+
+def test_dtt2bunch_baseline(fpath_join, tpath_join):
+    from synthetic_dtt import write_synthetic_dtt
+    fpath = tpath_join('synthetic.xml')
+    write_synthetic_dtt(fpath, n_channels = 4, N = 50)
+    items = dict(
+        (path, value) for path, value in dttxml.dtt2bunch_iter(fpath)
+        if not isinstance(value, (dict, tuple))
+    )
+    items_all = dtt2bunch_all_pairs(dttxml.DiagAccess(fpath))
+    assert(set(items.keys()) == set(items_all.keys()))
+    for path, value in items_all.items():
+        np.testing.assert_array_equal(items[path], value)
+
+    #the transfer functions of the references have no coherence, which
+    #stopped the conversion before they were left to REFS
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    access = dttxml.DiagAccess(fpath)
+    with pytest.raises(KeyError):
+        dtt2bunch_all_pairs(access)
+    chns = set()
+    for path, value in dttxml.dtt2bunch_iter(fpath):
+        if path[0] != 'REFS':
+            chns.update(path[1:])
+    assert(not chns & access.reference_channels)
+
+
+def test_records(fpath_join):
+    import pickle
+    from dttxml.records import TransferRecord
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    result = dttxml.dtt_read(fpath, lazy = True).results.TF['H1:LSC-DARM1_IN2']
+    assert(isinstance(result, TransferRecord))
+    assert('xfer' in TransferRecord._fields)
+    assert(not hasattr(result, '__dict__'))
+
+    #the mapping interface of the Bunch results
+    assert(result['averages'] == result.averages == result.get('averages'))
+    assert('xfer' in result and 'xfer' in result.deferred_keys)
+    assert(result.get('missing', 1) == 1 and 'missing' not in result)
+    with pytest.raises(AttributeError):
+        result.missing
+    with pytest.raises(KeyError):
+        result['missing']
+    assert(type(result.channelB_inv) is dict)
+    result['note'] = 'extra'
+    assert(result.note == 'extra')
+    assert(set(result.keys()) >= set(['xfer', 'FHz', 'channelB', 'note']))
+    assert(not result.deferred_keys)
+    del result.note
+    assert('note' not in result)
+
+    result_copy = pickle.loads(pickle.dumps(result))
+    assert(isinstance(result_copy, TransferRecord))
+    assert_items_equal(dict(result.items()), dict(result_copy.items()))
+
+
+def test_release_frees_stream(fpath_join):
+    import gc
+    import weakref
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    access = dttxml.DiagAccess(fpath, lazy = True, indexed = True)
+    result = access.results.TF['H1:LSC-DARM1_IN2']
+    data = result.xfer
+    while data.base is not None:
+        data = data.base
+    #the interned frequencies are a copy rather than a view of the stream
+    assert(result.FHz.base is None or result.FHz.base is not data)
+    data_ref = weakref.ref(data)
+    data = None
+    assert(access.release([result]) > 0)
+    gc.collect()
+    assert(data_ref() is None)
@@ -0,0 +1,88 @@
+
+import time
+import base64
+import pytest
+import numpy as np
+
+import dttxml
+from dttxml.stream import decode_base64
+
+
+def wrapped_base64(data, width = 64, indent = '      '):
+    text = base64.b64encode(data.tobytes()).decode('ascii')
+    return '\n'.join(indent + text[idx:idx + width] for idx in range(0, len(text), width)) + '\n'
+
+
+def test_decode_base64():
+    data = (np.arange(1001) * (1 + 2j)).astype('c8')
+    #lines of 66 characters don't split into whole base64 quads
+    for text in [wrapped_base64(data), wrapped_base64(data, width = 66)]:
+        for chunk_chars in [7, 64, 1000, 1 << 18]:
+            for count in [None, len(data), 10, 5000]:
+                for text_in in [text, text.encode('ascii')]:
+                    out = decode_base64(text_in, 'c8', count = count, chunk_chars = chunk_chars)
+                    assert(out.flags.writeable)
+                    assert(out.flags.aligned)
+                    np.testing.assert_array_equal(out, data)
+
+
+def test_decoded_writeable(fpath_join):
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    items = dttxml.dtt_read(fpath)
+    xfer = items.results.TF['H1:LSC-DARM1_IN2'].xfer
+    assert(xfer.flags.writeable)
+    xfer[0, 0] = 0
+
+
+def test_decode_benchmark(request, pprint):
+    if not request.config.getvalue('--do-stresstest'):
+        pytest.skip("benchmark only runs with --do-stresstest")
+    data = np.random.RandomState(0).randn(4, 10**6).astype('f4')
+    text = wrapped_base64(data)
+
+    t_start = time.perf_counter()
+    out_b64 = np.frombuffer(base64.b64decode(text), dtype = 'f4').copy()
+    t_b64 = time.perf_counter() - t_start
+
+    t_start = time.perf_counter()
+    out = decode_base64(text, 'f4', count = data.size)
+    t_decode = time.perf_counter() - t_start
+
+    np.testing.assert_array_equal(out, out_b64)
+    pprint('b64decode + frombuffer + copy', '{0:.4f}s'.format(t_b64))
+    pprint('decode_base64', '{0:.4f}s'.format(t_decode))
+
+
+def test_stream_encodings(fpath_join, tpath_join):
+    import xml.etree.ElementTree as etree
+    fpath = fpath_join('data', '2020-01-03_H1_DARM_OLGTF_LF_SS_5to1100Hz_15min.xml')
+    tree = etree.parse(fpath)
+    for xml_node in tree.getroot():
+        if not xml_node.attrib['Name'].startswith('Result['):
+            continue
+        stream_node = xml_node.find('Array/Stream')
+        if xml_node.attrib['Type'] == 'TransferFunction' and xml_node.find("Param[@Name='Subtype']").text == '3':
+            data = np.frombuffer(base64.b64decode(stream_node.text), dtype = '<c8')
+            stream_node.text = wrapped_base64(data.astype('>c8'))
+            stream_node.attrib['Encoding'] = 'BigEndian,base64'
+        else:
+            data = np.frombuffer(base64.b64decode(stream_node.text), dtype = '<f4')
+            stream_node.text = '\n'.join(
+                ', '.join(repr(float(v)) for v in data[idx:idx + 5])
+                for idx in range(0, len(data), 5)
+            )
+            del stream_node.attrib['Encoding']
+            stream_node.attrib['Delimiter'] = ','
+    fpath_encoded = tpath_join('encoded.xml')
+    tree.write(fpath_encoded)
+
+    items = dttxml.dtt_read(fpath)
+    items_encoded = dttxml.dtt_read(fpath_encoded)
+    for type_name, field in [('TF', 'xfer'), ('COH', 'coherence')]:
+        for chn, result in items.results[type_name].items():
+            data = result[field]
+            data_encoded = items_encoded.results[type_name][chn][field]
+            assert(data.dtype.kind == data_encoded.dtype.kind)
+            np.testing.assert_array_equal(data, data_encoded)
+    xfer = items_encoded.results.TF['H1:LSC-DARM1_IN2'].xfer
+    assert(xfer.dtype.byteorder == '>')